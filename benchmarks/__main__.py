@@ -0,0 +1,65 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from argparse import ArgumentParser
+from benchmarks.runner import run_benchmarks
+
+import json
+import sys
+
+#######################################################################
+#                                                                     #
+#         MAIN                                                        #
+#                                                                     #
+#######################################################################
+def integers(text: str) -> tuple:
+    return tuple(int(item) for item in text.split(r',') if 0 < len(item.strip()))
+
+def main(argv: list = None) -> int:
+    parser: ArgumentParser = ArgumentParser(prog=r'python -m benchmarks', description=r'Measure mdbpg throughput and latency against a local Postgres and mongod, or in-process stand-ins.')
+    parser.add_argument(r'--backends', default=r'postgres,mongodb', help=r'comma separated backends to run (default: postgres,mongodb)')
+    parser.add_argument(r'--concurrency', type=integers, default=(1, 4, 16), help=r'comma separated thread counts (default: 1,4,16)')
+    parser.add_argument(r'--payload-sizes', type=integers, default=(64, 1024, 16384), help=r'comma separated payload sizes in bytes (default: 64,1024,16384)')
+    parser.add_argument(r'--max-conns', type=integers, default=(10,), help=r'comma separated max_conns values (default: 10)')
+    parser.add_argument(r'--operations', type=int, default=1000, help=r'calls per operation and level (default: 1000)')
+    parser.add_argument(r'--seed-rows', type=int, default=1000, help=r'rows written before each level (default: 1000)')
+    parser.add_argument(r'--warmup', type=int, default=50, help=r'untimed finds before each level (default: 50)')
+    parser.add_argument(r'--standin', action=r'store_true', help=r'always use the in-process stand-ins')
+    parser.add_argument(r'--pg-bin', default=None, help=r'directory holding initdb and pg_ctl (default: PATH)')
+    parser.add_argument(r'--mongod-bin', default=None, help=r'directory holding mongod (default: PATH)')
+    parser.add_argument(r'--output', default=None, help=r'write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    report: dict = run_benchmarks(backends=tuple(backend.strip() for backend in args.backends.split(r',') if backend.strip() in (r'postgres', r'mongodb')),
+                                  concurrency=args.concurrency,
+                                  payload_sizes=args.payload_sizes,
+                                  max_conns=args.max_conns,
+                                  operations=args.operations,
+                                  seed_rows=args.seed_rows,
+                                  warmup=args.warmup,
+                                  standin=args.standin,
+                                  pg_bin=args.pg_bin,
+                                  mongod_bin=args.mongod_bin)
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    else:
+        with open(args.output, r'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    return 0
+
+if __name__ == r'__main__':
+    sys.exit(main())
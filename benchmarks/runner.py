@@ -0,0 +1,227 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from benchmarks.servers import local_mongod, local_postgres
+from benchmarks.standins import standinclient, standinconnection
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from mdbpg.pool import pgpool
+from time import perf_counter
+from typing import Callable
+
+import mdbpg
+import os
+import platform
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+TABLE: str = r'mdbpg_bench'
+
+# inserts run before deletes so that every delete has a row to remove
+OPERATIONS: tuple = (r'insert', r'find', r'update', r'fetch', r'delete')
+
+#######################################################################
+#                                                                     #
+#         HELPERS                                                     #
+#                                                                     #
+#######################################################################
+def percentile(latencies: list, fraction: float) -> float:
+    # nearest rank on an already sorted list
+    if 0 == len(latencies):
+        return None
+
+    return latencies[min(len(latencies) - 1, max(0, int(round(fraction * len(latencies) + 0.5)) - 1))]
+
+@contextmanager
+def environment(values: dict):
+    saved: dict = { name: os.environ.get(name) for name in values }
+    os.environ.update({ name: str(value) for name, value in values.items() })
+
+    try:
+        yield
+
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+
+            else:
+                os.environ[name] = value
+
+def package_version() -> str:
+    try:
+        return version(r'mdbpg')
+
+    except PackageNotFoundError:
+        return None
+
+#######################################################################
+#                                                                     #
+#         CLIENTS                                                     #
+#                                                                     #
+#######################################################################
+def postgres_client(settings: dict, max_conns: int, payload: str) -> mdbpg.postgres:
+    if settings is not None:
+        with environment({ r'POSTGRES_' + name.upper(): value for name, value in settings.items() }):
+            return mdbpg.postgres(max_conns=max_conns)
+
+    with environment({ r'POSTGRES_USERNAME': r'standin', r'POSTGRES_PASSWORD': r'standin', r'POSTGRES_HOSTNAME': r'standin', r'POSTGRES_DBNAME': r'standin' }):
+        pgdb: mdbpg.postgres = mdbpg.postgres(max_conns=max_conns)
+
+    # every query answers with one row holding the payload
+    rows: list = [{ r'id': 0, r'payload': payload }]
+    pgdb.pool = pgpool(lambda: standinconnection(rows), max_conns=max_conns)
+
+    return pgdb
+
+def mongodb_client(connstr: str, max_conns: int) -> mdbpg.mongodb:
+    with environment({ r'MONGODB_USERNAME': r'bench', r'MONGODB_PASSWORD': r'bench', r'MONGODB_HOSTNAME': r'localhost', r'MONGODB_DBNAME': r'mdbpg_bench' }):
+        mdb: mdbpg.mongodb = mdbpg.mongodb(max_conns=max_conns)
+
+    if connstr is not None:
+        # the configuration always builds an SRV string, a local mongod
+        # is reached directly instead
+        mdb.connstr = connstr
+
+    else:
+        mdb.connstr = r'standin'
+        mdb.client = standinclient()
+        mdb.client_key = (os.getpid(), mdb.connstr)
+
+    return mdb
+
+#######################################################################
+#                                                                     #
+#         WORKLOADS                                                   #
+#                                                                     #
+#######################################################################
+def postgres_workload(pgdb: mdbpg.postgres, payload: str, seed_rows: int, standin: bool) -> dict:
+    # the stand-in has no tables to set up and execute_values needs a
+    # real cursor
+    if standin is False:
+        pgdb.commit(r'CREATE TABLE IF NOT EXISTS ' + TABLE + r' (id integer, payload text)')
+        pgdb.commit(r'CREATE INDEX IF NOT EXISTS ' + TABLE + r'_id ON ' + TABLE + r' (id)')
+        pgdb.commit(r'TRUNCATE ' + TABLE)
+        pgdb.insert_many(TABLE, ({ r'id': i, r'payload': payload } for i in range(seed_rows)))
+
+    return { r'insert': lambda i: pgdb.insert(TABLE, { r'id': seed_rows + i, r'payload': payload }),
+             r'find': lambda i: pgdb.find(TABLE, { r'id': i % seed_rows }),
+             r'update': lambda i: pgdb.update(TABLE, { r'id': i % seed_rows }, { r'payload': payload }),
+             r'fetch': lambda i: pgdb.fetch(r'SELECT * FROM ' + TABLE + r' WHERE id = %s', (i % seed_rows,)),
+             r'delete': lambda i: pgdb.delete(TABLE, { r'id': seed_rows + i }) }
+
+def mongodb_workload(mdb: mdbpg.mongodb, payload: str, seed_rows: int) -> dict:
+    mdb.delete(TABLE, {})
+    mdb.insert_many(TABLE, ({ r'id': i, r'payload': payload } for i in range(seed_rows)))
+
+    # MongoDB has no raw query method so fetch is left out
+    return { r'insert': lambda i: mdb.insert(TABLE, { r'id': seed_rows + i, r'payload': payload }),
+             r'find': lambda i: mdb.find(TABLE, { r'id': i % seed_rows }),
+             r'update': lambda i: mdb.update(TABLE, { r'id': i % seed_rows }, { r'payload': payload }),
+             r'delete': lambda i: mdb.delete(TABLE, { r'id': seed_rows + i }) }
+
+#######################################################################
+#                                                                     #
+#         MEASURE                                                     #
+#                                                                     #
+#######################################################################
+def measure(operation: Callable, concurrency: int, operations: int) -> dict:
+    # each worker runs every concurrency-th index so that the workers
+    # together run operations calls, failed calls count as errors
+    def worker(offset: int) -> tuple:
+        latencies: list = []
+        errors: int = 0
+
+        for i in range(offset, operations, concurrency):
+            started: float = perf_counter()
+            result = operation(i)
+            latencies.append(perf_counter() - started)
+
+            if result is None or result is False:
+                errors += 1
+
+        return latencies, errors
+
+    started: float = perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes: list = list(executor.map(worker, range(concurrency)))
+
+    seconds: float = perf_counter() - started
+    latencies: list = sorted(latency for outcome in outcomes for latency in outcome[0])
+
+    return { r'operations': len(latencies),
+             r'errors': sum(outcome[1] for outcome in outcomes),
+             r'seconds': seconds,
+             r'ops_per_sec': len(latencies) / seconds if 0 < seconds else None,
+             r'p50_ms': None if 0 == len(latencies) else percentile(latencies, 0.50) * 1000.0,
+             r'p99_ms': None if 0 == len(latencies) else percentile(latencies, 0.99) * 1000.0 }
+
+#######################################################################
+#                                                                     #
+#         RUN BENCHMARKS                                              #
+#                                                                     #
+#######################################################################
+def run_benchmarks(backends: tuple = (r'postgres', r'mongodb'), concurrency: tuple = (1, 4, 16), payload_sizes: tuple = (64, 1024, 16384), max_conns: tuple = (10,),
+                   operations: int = 1000, seed_rows: int = 1000, warmup: int = 50, standin: bool = False, pg_bin: str = None, mongod_bin: str = None) -> dict:
+    report: dict = { r'mdbpg': package_version(),
+                     r'python': platform.python_version(),
+                     r'platform': platform.platform(),
+                     r'started': datetime.now(timezone.utc).isoformat(),
+                     r'results': [] }
+
+    with ExitStack() as servers:
+        # local servers are started once and fall back to the in-process
+        # stand-ins when their binaries are missing or standin is set
+        pg_settings: dict = None if standin is True or r'postgres' not in backends else servers.enter_context(local_postgres(pg_bin))
+        mongod_connstr: str = None if standin is True or r'mongodb' not in backends else servers.enter_context(local_mongod(mongod_bin))
+
+        for backend in backends:
+            server: str = r'local' if (pg_settings if r'postgres' == backend else mongod_connstr) is not None else r'standin'
+
+            for conns in max_conns:
+                for payload_bytes in payload_sizes:
+                    payload: str = r'x' * payload_bytes
+
+                    if r'postgres' == backend:
+                        client = postgres_client(pg_settings, conns, payload)
+
+                    else:
+                        client = mongodb_client(mongod_connstr, conns)
+
+                    try:
+                        for level in concurrency:
+                            workload: dict = postgres_workload(client, payload, seed_rows, r'standin' == server) if r'postgres' == backend else mongodb_workload(client, payload, seed_rows)
+
+                            for i in range(warmup):
+                                workload[r'find'](i)
+
+                            for operation in OPERATIONS:
+                                if operation not in workload:
+                                    continue
+
+                                result: dict = { r'backend': backend, r'server': server, r'operation': operation, r'concurrency': level, r'max_conns': conns, r'payload_bytes': payload_bytes }
+                                result.update(measure(workload[operation], level, operations))
+                                report[r'results'].append(result)
+
+                    finally:
+                        client.close()
+
+    report[r'finished'] = datetime.now(timezone.utc).isoformat()
+
+    return report
@@ -0,0 +1,129 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from contextlib import contextmanager
+from datetime import datetime
+from shutil import which
+from sys import stderr
+from tempfile import TemporaryDirectory
+from time import monotonic, sleep
+
+import os
+import socket
+import subprocess
+
+#######################################################################
+#                                                                     #
+#         FIND BINARY                                                 #
+#                                                                     #
+#######################################################################
+def find_binary(name: str, directory: str = None) -> str:
+    # an explicit directory wins over the PATH
+    if directory is not None:
+        path: str = os.path.join(directory, name)
+
+        return path if os.access(path, os.X_OK) else None
+
+    return which(name)
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind((r'127.0.0.1', 0))
+
+        return listener.getsockname()[1]
+
+#######################################################################
+#                                                                     #
+#         LOCAL POSTGRES                                              #
+#                                                                     #
+#######################################################################
+@contextmanager
+def local_postgres(pg_bin: str = None, startup_timeout: float = 30.0):
+    # yields the settings of a throwaway cluster listening on a unix
+    # socket in a temporary directory, or None if initdb is not available
+    initdb: str = find_binary(r'initdb', pg_bin)
+    pg_ctl: str = find_binary(r'pg_ctl', pg_bin)
+
+    if initdb is None or pg_ctl is None:
+        yield None
+        return
+
+    with TemporaryDirectory(prefix=r'mdbpg_bench_') as directory:
+        datadir: str = os.path.join(directory, r'data')
+        started: bool = False
+
+        try:
+            subprocess.run([initdb, r'-D', datadir, r'-U', r'postgres', r'--auth=trust', r'-E', r'UTF8'], check=True, capture_output=True)
+            subprocess.run([pg_ctl, r'-D', datadir, r'-l', os.path.join(directory, r'postgres.log'), r'-w', r'-t', str(int(startup_timeout)),
+                            r'-o', r'-c listen_addresses= -c unix_socket_directories=' + directory + r' -c fsync=off', r'start'], check=True, capture_output=True)
+            started = True
+
+        except (OSError, subprocess.CalledProcessError) as server_exception:
+            details: bytes = getattr(server_exception, r'stderr', None)
+
+            print('[{0}] Failed to start a local Postgres server: {1}'.format(datetime.now().strftime('%m/%d %I:%M %p'), str(server_exception) if not details else details.decode(errors=r'replace').strip()), file=stderr)
+
+        try:
+            yield { r'username': r'postgres', r'password': r'postgres', r'hostname': directory, r'dbname': r'postgres' } if started is True else None
+
+        finally:
+            if started is True:
+                subprocess.run([pg_ctl, r'-D', datadir, r'-m', r'immediate', r'stop'], capture_output=True)
+
+#######################################################################
+#                                                                     #
+#         LOCAL MONGOD                                                #
+#                                                                     #
+#######################################################################
+@contextmanager
+def local_mongod(mongod_bin: str = None, startup_timeout: float = 30.0):
+    # yields the connection string of a throwaway mongod bound to
+    # localhost, or None if mongod is not available
+    mongod: str = find_binary(r'mongod', mongod_bin)
+
+    if mongod is None:
+        yield None
+        return
+
+    with TemporaryDirectory(prefix=r'mdbpg_bench_') as directory:
+        port: int = free_port()
+        process: subprocess.Popen = None
+        connstr: str = None
+
+        try:
+            process = subprocess.Popen([mongod, r'--dbpath', directory, r'--port', str(port), r'--bind_ip', r'127.0.0.1', r'--quiet'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            deadline: float = monotonic() + startup_timeout
+
+            while connstr is None and monotonic() < deadline and process.poll() is None:
+                try:
+                    socket.create_connection((r'127.0.0.1', port), timeout=1.0).close()
+                    connstr = r'mongodb://127.0.0.1:' + str(port) + r'/'
+
+                except OSError:
+                    sleep(0.1)
+
+        except OSError as server_exception:
+            print('[{0}] Failed to start a local mongod: {1}'.format(datetime.now().strftime('%m/%d %I:%M %p'), str(server_exception)), file=stderr)
+
+        try:
+            yield connstr
+
+        finally:
+            if process is not None:
+                process.terminate()
+
+                try:
+                    process.wait(timeout=10.0)
+
+                except subprocess.TimeoutExpired:
+                    process.kill()
@@ -0,0 +1,208 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+# in-process stand-ins for a Postgres connection and a MongoClient, they
+# answer instantly so that a benchmark run against them only measures
+# mdbpg's own overhead: pooling, statement building, limits and metrics,
+# and can be given a standinfaults to fail calls on purpose
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from threading import Lock
+from typing import Callable
+
+import psycopg2.extensions
+
+#######################################################################
+#                                                                     #
+#         FAULTS                                                      #
+#                                                                     #
+#######################################################################
+class standinfaults():
+    # fails the next failures calls by raising error(message) and lets
+    # every call after them through, failures can be raised again later
+    def __init__(self: r'standinfaults', failures: int = 0, error: Callable = psycopg2.OperationalError) -> None:
+        self.lock: Lock = Lock()
+        self.failures: int = failures
+        self.error: Callable = error
+        self.calls: int = 0
+
+    def check(self: r'standinfaults') -> None:
+        with self.lock:
+            self.calls += 1
+
+            if 0 >= self.failures:
+                return
+
+            self.failures -= 1
+
+        raise self.error(r'Injected fault')
+
+NOFAULTS: standinfaults = standinfaults()
+
+#######################################################################
+#                                                                     #
+#         POSTGRES                                                    #
+#                                                                     #
+#######################################################################
+class standincursor():
+    def __init__(self: r'standincursor', rows: list, faults: standinfaults = NOFAULTS) -> None:
+        self.rows: list = rows
+        self.faults: standinfaults = faults
+        self.rowcount: int = -1
+        self.itersize: int = 2000
+
+    def __enter__(self: r'standincursor') -> r'standincursor':
+        return self
+
+    def __exit__(self: r'standincursor', exc_type, exc_value, traceback) -> None:
+        pass
+
+    def __iter__(self: r'standincursor'):
+        return iter(self.rows)
+
+    def execute(self: r'standincursor', sql_query, params=None) -> None:
+        self.faults.check()
+        self.rowcount = len(self.rows)
+
+    def fetchall(self: r'standincursor') -> list:
+        return [dict(row) for row in self.rows]
+
+    def close(self: r'standincursor') -> None:
+        pass
+
+class standinconnection():
+    def __init__(self: r'standinconnection', rows: list, faults: standinfaults = NOFAULTS) -> None:
+        self.rows: list = rows
+        self.faults: standinfaults = faults
+        self.closed: int = 0
+
+    def cursor(self: r'standinconnection', name: str = None, cursor_factory=None) -> standincursor:
+        return standincursor(self.rows, self.faults)
+
+    def get_transaction_status(self: r'standinconnection') -> int:
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self: r'standinconnection') -> None:
+        pass
+
+    def rollback(self: r'standinconnection') -> None:
+        pass
+
+    def close(self: r'standinconnection') -> None:
+        self.closed = 1
+
+#######################################################################
+#                                                                     #
+#         MONGODB                                                     #
+#                                                                     #
+#######################################################################
+class standinresult():
+    def __init__(self: r'standinresult', count: int = 0, inserted_ids: list = None) -> None:
+        self.matched_count: int = count
+        self.modified_count: int = count
+        self.deleted_count: int = count
+        self.inserted_ids: list = [] if inserted_ids is None else inserted_ids
+
+class standincollection():
+    # documents are bucketed by their 'id' field, which the benchmark
+    # indexes in Postgres as well, other criteria are matched by equality
+    def __init__(self: r'standincollection', faults: standinfaults = NOFAULTS) -> None:
+        self.lock: Lock = Lock()
+        self.faults: standinfaults = faults
+        self.buckets: dict = {}
+
+    def _candidates(self: r'standincollection', criteria: dict) -> list:
+        if r'id' in criteria:
+            return self.buckets.get(criteria[r'id'], [])
+
+        return [document for bucket in self.buckets.values() for document in bucket]
+
+    def _matches(self: r'standincollection', document: dict, criteria: dict) -> bool:
+        return all(document.get(key) == value for key, value in criteria.items())
+
+    def _add(self: r'standincollection', document: dict) -> None:
+        self.buckets.setdefault(document.get(r'id'), []).append(dict(document))
+
+    def find(self: r'standincollection', criteria: dict, batch_size: int = 0) -> list:
+        self.faults.check()
+
+        with self.lock:
+            return [dict(document) for document in self._candidates(criteria) if self._matches(document, criteria) is True]
+
+    def insert_one(self: r'standincollection', document: dict) -> standinresult:
+        self.faults.check()
+
+        with self.lock:
+            self._add(document)
+
+        return standinresult(1)
+
+    def insert_many(self: r'standincollection', documents: list, ordered: bool = True) -> standinresult:
+        self.faults.check()
+
+        with self.lock:
+            for document in documents:
+                self._add(document)
+
+        return standinresult(len(documents), list(range(len(documents))))
+
+    def update_many(self: r'standincollection', criteria: dict, changes: dict) -> standinresult:
+        self.faults.check()
+
+        count: int = 0
+
+        with self.lock:
+            for document in self._candidates(criteria):
+                if self._matches(document, criteria) is True:
+                    document.update(changes.get(r'$set', {}))
+                    count += 1
+
+        return standinresult(count)
+
+    def delete_many(self: r'standincollection', criteria: dict) -> standinresult:
+        self.faults.check()
+
+        count: int = 0
+
+        with self.lock:
+            for key in ([criteria[r'id']] if r'id' in criteria else list(self.buckets.keys())):
+                bucket: list = self.buckets.get(key, [])
+                kept: list = [document for document in bucket if self._matches(document, criteria) is False]
+                count += len(bucket) - len(kept)
+
+                if 0 == len(kept):
+                    self.buckets.pop(key, None)
+
+                else:
+                    self.buckets[key] = kept
+
+        return standinresult(count)
+
+class standindatabase():
+    def __init__(self: r'standindatabase', faults: standinfaults = NOFAULTS) -> None:
+        self.lock: Lock = Lock()
+        self.faults: standinfaults = faults
+        self.collections: dict = {}
+
+    def __getitem__(self: r'standindatabase', name: str) -> standincollection:
+        with self.lock:
+            return self.collections.setdefault(name, standincollection(self.faults))
+
+class standinclient():
+    def __init__(self: r'standinclient', faults: standinfaults = NOFAULTS) -> None:
+        self.database: standindatabase = standindatabase(faults)
+
+    def __getitem__(self: r'standinclient', name: str) -> standindatabase:
+        return self.database
+
+    def close(self: r'standinclient') -> None:
+        pass
@@ -6,7 +6,14 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
 #######################################################################
 
-__all__ = (r'mongodb', r'postgres')
+__all__ = (r'advisor', r'bufferedwriter', r'metrics', r'mongodb', r'postgres', r'resilience', r'resultcache', r'scheduler', r'singleflight')
 
+from mdbpg.advisor import advisor
+from mdbpg.cache import resultcache
+from mdbpg.metrics import metrics
 from mdbpg.mongodb import mongodb
-from mdbpg.postgres import postgres
\ No newline at end of file
+from mdbpg.postgres import postgres
+from mdbpg.resilience import resilience
+from mdbpg.scheduler import scheduler
+from mdbpg.singleflight import singleflight
+from mdbpg.writer import bufferedwriter
@@ -0,0 +1,209 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from mdbpg.criteria import is_operators
+from threading import Lock
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# operators an index can seek on, $ne and $nin match most of a table
+EQUALITIES: tuple = (r'$eq', r'$in')
+RANGES: tuple = (r'$gt', r'$gte', r'$lt', r'$lte', r'$prefix')
+
+# plan nodes and stages by the scan they make, shared by both backends
+SCANS: dict = { r'Seq Scan': r'seq_scan',
+                r'Index Scan': r'index_scan',
+                r'Index Only Scan': r'index_only_scan',
+                r'Bitmap Heap Scan': r'bitmap_scan',
+                r'Tid Scan': r'tid_scan',
+                r'Tid Range Scan': r'tid_scan',
+                r'COLLSCAN': r'seq_scan',
+                r'IXSCAN': r'index_scan',
+                r'EXPRESS_IXSCAN': r'index_scan',
+                r'IDHACK': r'index_scan',
+                r'EXPRESS_IDHACK': r'index_scan',
+                r'CLUSTERED_IXSCAN': r'index_scan',
+                r'COUNT_SCAN': r'index_only_scan',
+                r'DISTINCT_SCAN': r'index_only_scan' }
+
+#######################################################################
+#                                                                     #
+#         INDEX COLUMNS                                               #
+#                                                                     #
+#######################################################################
+def index_columns(criteria: dict) -> tuple:
+    # ((column, kind), ...) for the index which would serve the criteria,
+    # the columns compared for equality come first and then one column
+    # compared by range or prefix, since an index stops narrowing the
+    # scan after its first range, kind is 'eq', 'range' or 'prefix'
+    equalities: list = []
+    ranges: list = []
+
+    for column, value in ({} if criteria is None else criteria).items():
+        if str(column).startswith(r'$'):
+            continue
+
+        if is_operators(value) is False:
+            equalities.append(column)
+
+        elif any(operator in EQUALITIES for operator in value):
+            equalities.append(column)
+
+        elif any(operator in RANGES for operator in value):
+            ranges.append((column, r'prefix' if r'$prefix' in value else r'range'))
+
+    return tuple((column, r'eq') for column in sorted(equalities)) + tuple(sorted(ranges)[:1])
+
+def covered(columns: tuple, indexes: list) -> bool:
+    # an index covers the columns when it leads with the equality columns
+    # in any order, followed by the range column when there is one
+    names: list = [column for column, kind in columns]
+    equalities: set = { column for column, kind in columns if r'eq' == kind }
+
+    for index in indexes:
+        index = tuple(index)
+
+        if len(index) < len(names) or set(index[:len(equalities)]) != equalities:
+            continue
+
+        if len(equalities) == len(names) or index[len(equalities)] == names[-1]:
+            return True
+
+    return False
+
+#######################################################################
+#                                                                     #
+#         PLAN SUMMARIES                                              #
+#                                                                     #
+#######################################################################
+def pg_summary(explained: list) -> dict:
+    # explained is the document returned by EXPLAIN (FORMAT JSON), the
+    # actual rows and seconds are None when it was not run with ANALYZE
+    root: dict = explained[0]
+    plan: dict = root[r'Plan']
+    scan: dict = _first(plan, lambda node: node.get(r'Node Type') in SCANS, (r'Plans',))
+    index: dict = _first(plan, lambda node: r'Index Name' in node, (r'Plans',))
+    actual = plan.get(r'Actual Rows')
+
+    return plan_summary(None if scan is None else SCANS[scan[r'Node Type']],
+                        None if index is None else index[r'Index Name'],
+                        plan.get(r'Plan Rows'),
+                        None if actual is None else int(round(actual * plan.get(r'Actual Loops', 1))),
+                        None if r'Execution Time' not in root else root[r'Execution Time'] / 1000.0,
+                        explained)
+
+def mongo_summary(explained: dict) -> dict:
+    # explained is the result of a cursor's explain(), MongoDB does not
+    # estimate rows before 8.0 so estimated_rows is usually None
+    planner: dict = explained.get(r'queryPlanner', {})
+    plan: dict = planner.get(r'winningPlan', {})
+    plan = plan.get(r'queryPlan', plan)
+    children: tuple = (r'inputStage', r'inputStages', r'queryPlan')
+    scan: dict = _first(plan, lambda node: node.get(r'stage') in SCANS, children)
+    index: dict = _first(plan, lambda node: r'indexName' in node, children)
+    stats: dict = explained.get(r'executionStats', {})
+
+    return plan_summary(None if scan is None else SCANS[scan[r'stage']],
+                        None if index is None else index[r'indexName'],
+                        plan.get(r'estimatedCardinality'),
+                        stats.get(r'nReturned'),
+                        None if r'executionTimeMillis' not in stats else stats[r'executionTimeMillis'] / 1000.0,
+                        explained)
+
+def plan_summary(scan: str = None, index: str = None, estimated_rows: int = None, actual_rows: int = None, seconds: float = None, plan=None) -> dict:
+    return { r'scan': scan, r'index': index, r'estimated_rows': estimated_rows, r'actual_rows': actual_rows, r'seconds': seconds, r'plan': plan }
+
+#######################################################################
+#                                                                     #
+#         ADVISOR                                                     #
+#                                                                     #
+#######################################################################
+class advisor():
+    # counts the columns filtered on by find, update and delete and how
+    # long those calls took, suggest_indexes and ensure_indexes on the
+    # database classes turn the ones without an index into indexes
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'advisor') -> None:
+        self.lock: Lock = Lock()
+        self.shapes: dict = {}          # (table, columns) -> [count, seconds, slowest]
+
+    ###################################################################
+    #     RECORD                                                      #
+    ###################################################################
+    def record(self: r'advisor', table: str, criteria: dict, seconds: float) -> None:
+        columns: tuple = index_columns(criteria)
+
+        if 0 == len(columns):
+            return
+
+        with self.lock:
+            shape: list = self.shapes.get((table, columns))
+
+            if shape is None:
+                shape = [0, 0.0, 0.0]
+                self.shapes[(table, columns)] = shape
+
+            shape[0] += 1
+            shape[1] += seconds
+            shape[2] = max(shape[2], seconds)
+
+    ###################################################################
+    #     CANDIDATES                                                  #
+    ###################################################################
+    def candidates(self: r'advisor', min_count: int = 1, min_seconds: float = 0.0) -> list:
+        # the shapes seen at least min_count times taking at least
+        # min_seconds on average, the most total time spent first
+        with self.lock:
+            shapes: list = [(table, columns, count, seconds, slowest) for (table, columns), (count, seconds, slowest) in self.shapes.items()]
+
+        return [{ r'table': table, r'columns': columns, r'count': count, r'seconds': seconds, r'mean': seconds / count, r'slowest': slowest }
+                for table, columns, count, seconds, slowest in sorted(shapes, key=lambda shape: shape[3], reverse=True)
+                if min_count <= count and min_seconds <= seconds / count]
+
+    ###################################################################
+    #     STATS, RESET                                                #
+    ###################################################################
+    def stats(self: r'advisor') -> dict:
+        with self.lock:
+            return { r'shapes': len(self.shapes), r'calls': sum(shape[0] for shape in self.shapes.values()) }
+
+    def reset(self: r'advisor') -> None:
+        with self.lock:
+            self.shapes = {}
+
+#######################################################################
+#                                                                     #
+#         PRIVATE                                                     #
+#                                                                     #
+#######################################################################
+def _first(node, matches, children: tuple) -> dict:
+    # the first node of a plan tree, depth first, which matches
+    if not isinstance(node, dict):
+        return None
+
+    if matches(node) is True:
+        return node
+
+    for child in children:
+        for subnode in node.get(child, []) if isinstance(node.get(child), list) else [node.get(child)]:
+            found: dict = _first(subnode, matches, children)
+
+            if found is not None:
+                return found
+
+    return None
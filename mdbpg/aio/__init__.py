@@ -0,0 +1,12 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+__all__ = (r'mongodb', r'postgres')
+
+from mdbpg.aio.mongodb import mongodb
+from mdbpg.aio.postgres import postgres
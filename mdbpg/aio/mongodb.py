@@ -0,0 +1,237 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from asyncio import Semaphore
+from datetime import datetime
+from inspect import isawaitable
+from mdbpg.config import load_config
+from mdbpg.criteria import mongo_criteria
+from mdbpg.mongodb import RAW_OPTIONS, client_options, connection_string
+from mdbpg.paging import decode_token, mongo_filter, mongo_projection, mongo_sort, next_page, order_spec, with_order
+from mdbpg.results import FORMATS, shape_documents
+from sys import stderr
+
+try:
+    from pymongo import AsyncMongoClient
+
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+
+    except ImportError:
+        AsyncMongoClient = None
+
+#######################################################################
+#                                                                     #
+#         MONGODB                                                     #
+#                                                                     #
+#######################################################################
+class mongodb():
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'mongodb', max_conns: int = 10, use_env_vars: bool = True, pool_size: int = None, wait_queue_timeout_ms: int = None, compressors: str = None, server_selection_timeout_ms: int = None) -> None:
+        self.max_conns: int = max_conns if 0 < max_conns else 10
+        self.sema: Semaphore = None
+        self.client: AsyncMongoClient = None
+        self.client_connstr: str = None
+
+        config: dict = load_config(r'mongodb', (r'username', r'password', r'hostname', r'dbname'), (r'authsrc', r'pool_size', r'wait_queue_timeout_ms', r'compressors', r'server_selection_timeout_ms'), use_env_vars=use_env_vars)
+
+        self.username: str = config[r'username']
+        self.password: str = config[r'password']
+        self.hostname: str = config[r'hostname']
+        self.authsrc: str = r'' if use_env_vars is True else config[r'authsrc']
+        self.dbname: str = config[r'dbname']
+
+        self.client_options: dict = client_options(max_conns,
+                                                   config[r'pool_size'] if pool_size is None else pool_size,
+                                                   config[r'wait_queue_timeout_ms'] if wait_queue_timeout_ms is None else wait_queue_timeout_ms,
+                                                   config[r'compressors'] if compressors is None else compressors,
+                                                   config[r'server_selection_timeout_ms'] if server_selection_timeout_ms is None else server_selection_timeout_ms)
+
+        self.connstr: str = connection_string(self.username, self.password, self.hostname, self.authsrc, self.dbname)
+
+        if AsyncMongoClient is None:
+            self.connstr = r''
+
+            print('[{0}] The asyncio MongoDB client requires PyMongo 4.10 or motor, install mdbpg[aio].'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+
+        elif r'' == self.connstr:
+            print('[{0}] Failed to load the configuration for MongoDB.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+
+    ###################################################################
+    #     CONTEXT MANAGER                                             #
+    ###################################################################
+    async def __aenter__(self: r'mongodb') -> r'mongodb':
+        return self
+
+    async def __aexit__(self: r'mongodb', exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    ###################################################################
+    #     CLOSE                                                       #
+    ###################################################################
+    async def close(self: r'mongodb') -> None:
+        client: AsyncMongoClient = self.client
+        self.client = None
+        self.client_connstr = None
+
+        if client is not None:
+            # PyMongo's async client closes asynchronously, motor's does not
+            result = client.close()
+
+            if isawaitable(result):
+                await result
+
+    ###################################################################
+    #     CLIENT                                                      #
+    ###################################################################
+    def _collection(self: r'mongodb', collection: str):
+        if self.client is None or self.client_connstr != self.connstr:
+            self.client = AsyncMongoClient(self.connstr, **self.client_options)
+            self.client_connstr = self.connstr
+
+        return self.client[str(self.dbname)][collection]
+
+    def _sema(self: r'mongodb') -> Semaphore:
+        # created on first use so that it belongs to the running event loop
+        if self.sema is None:
+            self.sema = Semaphore(self.max_conns)
+
+        return self.sema
+
+    ###################################################################
+    #     FIND                                                        #
+    ###################################################################
+    async def find(self: r'mongodb', collection: str, criteria: dict, fields: list = None, limit: int = None, order_by=None, after: str = None, result_format: str = r'dicts') -> list:
+        dbresult: list = None
+
+        if r'' == self.connstr:
+            return dbresult
+
+        if result_format not in FORMATS + (r'raw',):
+            print('[{0}] The result_format \'{1}\' is not one of {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), result_format, r', '.join(FORMATS + (r'raw',))), file=stderr)
+
+            return None
+
+        order: tuple = order_spec(order_by)
+        values: tuple = None
+
+        if after is not None:
+            values = decode_token(after)
+
+            if values is None or len(values) != len(order) or 0 == len(order):
+                print('[{0}] The page token passed to find on the collection \'{1}\' does not match its order_by.'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection), file=stderr)
+
+                return None
+
+        async with self._sema():
+            try:
+                dbcollection = self._collection(collection)
+
+                if r'raw' == result_format:
+                    dbcollection = dbcollection.with_options(codec_options=RAW_OPTIONS)
+
+                dbcursor = dbcollection.find(mongo_filter(mongo_criteria(criteria), order, values), mongo_projection(with_order(fields, order)))
+
+                if 0 < len(order):
+                    dbcursor = dbcursor.sort(mongo_sort(order))
+
+                if limit is not None and 0 < limit:
+                    dbcursor = dbcursor.limit(limit)
+
+                dbresult = await dbcursor.to_list(None)
+
+                if r'raw' != result_format:
+                    dbresult = shape_documents(dbresult, with_order(fields, order), result_format)
+
+            except Exception as mongodb_exception:
+                dbresult = None
+
+                print('[{0}] An exception was thrown while trying to find a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+
+        return dbresult
+
+    ###################################################################
+    #     FIND PAGE                                                   #
+    ###################################################################
+    async def find_page(self: r'mongodb', collection: str, criteria: dict, limit: int, order_by, fields: list = None, after: str = None) -> tuple:
+        order: tuple = order_spec(order_by)
+
+        if 0 == len(order) or limit is None or 0 >= limit:
+            print('[{0}] find_page on the collection \'{1}\' needs an order_by and a positive limit.'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection), file=stderr)
+
+            return None, None
+
+        return next_page(await self.find(collection, criteria, fields, limit + 1, order, after), tuple(column for column, ascending in order), limit)
+
+    ###################################################################
+    #     INSERT                                                      #
+    ###################################################################
+    async def insert(self: r'mongodb', collection: str, document: dict) -> bool:
+        result: bool = True
+
+        if r'' == self.connstr:
+            return False
+
+        async with self._sema():
+            try:
+                await self._collection(collection).insert_one(document)
+
+            except Exception as mongodb_exception:
+                result = False
+
+                print('[{0}] An exception was thrown while trying to insert a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+
+        return result
+
+    ###################################################################
+    #     UPDATE                                                      #
+    ###################################################################
+    async def update(self: r'mongodb', collection: str, criteria: dict, changes: dict) -> bool:
+        result: bool = True
+
+        if r'' == self.connstr:
+            return False
+
+        async with self._sema():
+            try:
+                await self._collection(collection).update_many(mongo_criteria(criteria), { r'$set': changes })
+
+            except Exception as mongodb_exception:
+                result = False
+
+                print('[{0}] An exception was thrown while trying to update a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+
+        return result
+
+    ###################################################################
+    #     DELETE                                                      #
+    ###################################################################
+    async def delete(self: r'mongodb', collection: str, criteria: dict) -> bool:
+        result: bool = True
+
+        if r'' == self.connstr:
+            return False
+
+        async with self._sema():
+            try:
+                await self._collection(collection).delete_many(mongo_criteria(criteria))
+
+            except Exception as mongodb_exception:
+                result = False
+
+                print('[{0}] An exception was thrown while trying to delete a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+
+        return result
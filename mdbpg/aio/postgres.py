@@ -0,0 +1,253 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from asyncio import Lock
+from datetime import datetime
+from mdbpg.config import load_config
+from mdbpg.criteria import criteria_error
+from mdbpg.paging import decode_token, next_page, order_spec, with_order
+from mdbpg.results import BATCH_SIZE, FORMATS, shape_rows
+from mdbpg.statements import sqlcompiler, statement
+from sys import stderr
+
+try:
+    import psycopg
+    import psycopg.rows
+    import psycopg.sql
+    import psycopg_pool
+
+except ImportError:
+    psycopg = None
+
+#######################################################################
+#                                                                     #
+#         POSTGRES                                                    #
+#                                                                     #
+#######################################################################
+class postgres():
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'postgres', max_conns: int = 10, use_env_vars: bool = True, max_lifetime: float = 3600.0, max_idle: float = 300.0, statement_cache_size: int = 256) -> None:
+        self.max_conns: int = max_conns if 0 < max_conns else 10
+        self.max_lifetime: float = max_lifetime
+        self.max_idle: float = max_idle
+        self.pool = None
+        self.pool_lock: Lock = None
+
+        config: dict = load_config(r'postgres', (r'username', r'password', r'hostname', r'dbname'), use_env_vars=use_env_vars)
+
+        self.username: str = config[r'username']
+        self.password: str = config[r'password']
+        self.hostname: str = config[r'hostname']
+        self.dbname: str = config[r'dbname']
+
+        if psycopg is None:
+            self.loaded = False
+            self.compiler: sqlcompiler = None
+
+            print('[{0}] The asyncio Postgres client requires psycopg 3 and psycopg_pool, install mdbpg[aio].'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+
+        elif self.username is None or self.password is None or self.hostname is None or self.dbname is None:
+            self.loaded = False
+            self.compiler: sqlcompiler = sqlcompiler(cache_size=statement_cache_size, sql=psycopg.sql)
+
+            print('[{0}] Failed to load the configuration for Postgres.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+
+        else:
+            self.loaded = True
+            self.compiler: sqlcompiler = sqlcompiler(cache_size=statement_cache_size, sql=psycopg.sql)
+
+    ###################################################################
+    #     CONTEXT MANAGER                                             #
+    ###################################################################
+    async def __aenter__(self: r'postgres') -> r'postgres':
+        return self
+
+    async def __aexit__(self: r'postgres', exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    ###################################################################
+    #     CLOSE                                                       #
+    ###################################################################
+    async def close(self: r'postgres') -> None:
+        pool = self.pool
+        self.pool = None
+
+        if pool is not None:
+            await pool.close()
+
+    ###################################################################
+    #     POOL                                                        #
+    ###################################################################
+    async def _pool(self: r'postgres'):
+        # the pool's max_size plays the part of max_conns, callers queue for
+        # a connection instead of for a separate semaphore, and psycopg 3
+        # prepares statements on its own once they have been run a few times
+        if self.pool is None:
+            if self.pool_lock is None:
+                self.pool_lock = Lock()
+
+            async with self.pool_lock:
+                if self.pool is None:
+                    pool = psycopg_pool.AsyncConnectionPool(kwargs={ r'host': str(self.hostname), r'dbname': str(self.dbname), r'user': str(self.username), r'password': str(self.password) },
+                                                            min_size=0,
+                                                            max_size=self.max_conns,
+                                                            max_lifetime=self.max_lifetime,
+                                                            max_idle=self.max_idle,
+                                                            check=psycopg_pool.AsyncConnectionPool.check_connection,
+                                                            open=False)
+
+                    await pool.open()
+                    self.pool = pool
+
+        return self.pool
+
+    ###################################################################
+    #     FETCH                                                       #
+    ###################################################################
+    async def fetch(self: r'postgres', sql_query: str, params: tuple = None, result_format: str = r'dicts') -> list:
+        if self.loaded is False:
+            return None
+
+        if result_format not in FORMATS:
+            print('[{0}] The result_format \'{1}\' is not one of {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), result_format, r', '.join(FORMATS)), file=stderr)
+
+            return None
+
+        dbresult: list = []
+
+        try:
+            async with (await self._pool()).connection() as dbconn:
+                async with dbconn.cursor(row_factory=psycopg.rows.dict_row if r'dicts' == result_format else psycopg.rows.tuple_row) as dbcursor:
+                    await dbcursor.execute(sql_query.query if type(sql_query) is statement else sql_query, params)
+
+                    if r'dicts' == result_format:
+                        dbresult = await dbcursor.fetchall()
+
+                    else:
+                        batches: list = []
+                        batch: list = await dbcursor.fetchmany(BATCH_SIZE)
+
+                        while 0 < len(batch):
+                            batches.append(batch)
+                            batch = await dbcursor.fetchmany(BATCH_SIZE)
+
+                        dbresult = shape_rows([column.name for column in dbcursor.description], batches, result_format)
+
+        except Exception as sql_exception:
+            dbresult = None
+
+            print('[{0}] An exception was thrown while trying to run a fetch query on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.dbname, str(sql_exception)), file=stderr)
+
+        return dbresult
+
+    ###################################################################
+    #     COMMIT                                                      #
+    ###################################################################
+    async def commit(self: r'postgres', sql_query: str, params: tuple = None) -> bool:
+        if self.loaded is False:
+            return False
+
+        dbresult: bool = True
+
+        try:
+            async with (await self._pool()).connection() as dbconn:
+                async with dbconn.cursor() as dbcursor:
+                    await dbcursor.execute(sql_query.query if type(sql_query) is statement else sql_query, params)
+
+        except Exception as sql_exception:
+            dbresult = False
+
+            print('[{0}] An exception was thrown while trying to run an update query on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.dbname, str(sql_exception)), file=stderr)
+
+        return dbresult
+
+    ###################################################################
+    #     CRITERIA                                                    #
+    ###################################################################
+    def _valid_criteria(self: r'postgres', table: str, criteria: dict) -> bool:
+        error: str = criteria_error(criteria)
+
+        if error is not None:
+            print('[{0}] The criteria for the Postgres table \'{1}\' are invalid: {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table, error), file=stderr)
+
+            return False
+
+        return True
+
+    ###################################################################
+    #     FIND                                                        #
+    ###################################################################
+    async def find(self: r'postgres', table: str, criteria: dict, fields: list = None, limit: int = None, order_by=None, after: str = None, result_format: str = r'dicts') -> list:
+        if self.loaded is False or self._valid_criteria(table, criteria) is False:
+            return None
+
+        order: tuple = order_spec(order_by)
+        values: tuple = None
+
+        if after is not None:
+            values = decode_token(after)
+
+            if values is None or len(values) != len(order) or 0 == len(order):
+                print('[{0}] The page token passed to find on the Postgres table \'{1}\' does not match its order_by.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table), file=stderr)
+
+                return None
+
+        return await self.fetch(*self.compiler.select(table, criteria, with_order(fields, order), order, limit if limit is not None and 0 < limit else None, values), result_format)
+
+    ###################################################################
+    #     FIND PAGE                                                   #
+    ###################################################################
+    async def find_page(self: r'postgres', table: str, criteria: dict, limit: int, order_by, fields: list = None, after: str = None) -> tuple:
+        order: tuple = order_spec(order_by)
+
+        if 0 == len(order) or limit is None or 0 >= limit:
+            print('[{0}] find_page on the Postgres table \'{1}\' needs an order_by and a positive limit.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table), file=stderr)
+
+            return None, None
+
+        return next_page(await self.find(table, criteria, fields, limit + 1, order, after), tuple(self.compiler.fold(column)[-1] for column, ascending in order), limit)
+
+    ###################################################################
+    #     INSERT                                                      #
+    ###################################################################
+    async def insert(self: r'postgres', table: str, row: dict) -> bool:
+        if self.loaded is False or row is None or 0 == len(row.keys()):
+            return False
+
+        return await self.commit(*self.compiler.insert(table, row))
+
+    ###################################################################
+    #     UPDATE                                                      #
+    ###################################################################
+    async def update(self: r'postgres', table: str, criteria: dict, changes: dict) -> bool:
+        if self.loaded is False or changes is None or 0 == len(changes.keys()):
+            return False
+
+        if self._valid_criteria(table, criteria) is False:
+            return False
+
+        return await self.commit(*self.compiler.update(table, criteria, changes))
+
+    ###################################################################
+    #     DELETE                                                      #
+    ###################################################################
+    async def delete(self: r'postgres', table: str, criteria: dict) -> bool:
+        if self.loaded is False or criteria is None or 0 == len(criteria.keys()):
+            return False
+
+        if self._valid_criteria(table, criteria) is False:
+            return False
+
+        return await self.commit(*self.compiler.delete(table, criteria))
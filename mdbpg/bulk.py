@@ -0,0 +1,90 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from collections.abc import Mapping
+from itertools import islice
+from mdbpg.criteria import criteria_error
+from typing import Callable, Iterable, Iterator
+
+#######################################################################
+#                                                                     #
+#         CHUNKS                                                      #
+#                                                                     #
+#######################################################################
+def chunks(items: Iterable, batch_size: int = 1000) -> Iterator[list]:
+    iterator: Iterator = iter(items)
+
+    if 0 >= batch_size:
+        batch_size = 1000
+
+    while True:
+        batch: list = list(islice(iterator, batch_size))
+
+        if 0 == len(batch):
+            return
+
+        yield batch
+
+#######################################################################
+#                                                                     #
+#         BATCH RESULT                                                #
+#                                                                     #
+#######################################################################
+def batch_result(count: int = 0, failed: list = None, error: str = None) -> dict:
+    # every bulk method on both backends reports one of these per batch
+    return { r'count': count, r'failed': [] if failed is None else failed, r'error': error }
+
+def upsert_result(result: dict) -> dict:
+    # upsert_many also splits count into rows inserted and rows updated
+    return { r'inserted': 0, r'updated': 0, **result }
+
+#######################################################################
+#                                                                     #
+#         IS DOCUMENT, IS ROW, IS CRITERIA                            #
+#                                                                     #
+#######################################################################
+def is_document(value: dict) -> bool:
+    return isinstance(value, Mapping)
+
+def is_row(value: dict) -> bool:
+    return isinstance(value, Mapping) and 0 < len(value.keys())
+
+def is_criteria(value: dict) -> bool:
+    return is_row(value) and criteria_error(value) is None
+
+#######################################################################
+#                                                                     #
+#         IS UPDATE, IS CRITERIA UPDATE                               #
+#                                                                     #
+#######################################################################
+def is_update(value) -> bool:
+    # updates are passed as (criteria, changes) pairs
+    return type(value) in (list, tuple) and 2 == len(value) and (value[0] is None or isinstance(value[0], Mapping)) and is_row(value[1])
+
+def is_criteria_update(value) -> bool:
+    return is_update(value) and criteria_error(value[0]) is None
+
+#######################################################################
+#                                                                     #
+#         HAS KEYS, LATEST                                            #
+#                                                                     #
+#######################################################################
+def has_keys(key_columns: tuple) -> Callable:
+    return lambda value: is_row(value) and all(key in value for key in key_columns)
+
+def latest(rows: list, key_columns: tuple) -> list:
+    # a statement cannot upsert the same key twice so the last row given
+    # for each key wins, rows without every key are left for is_valid
+    valid: Callable = has_keys(key_columns)
+
+    return list({ (tuple(repr(row[key]) for key in key_columns) if valid(row) is True else id(row)): row for row in rows }.values())
@@ -0,0 +1,211 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+from copy import copy
+from sys import getsizeof
+from threading import Lock
+from time import monotonic
+
+#######################################################################
+#                                                                     #
+#         CANONICAL                                                   #
+#                                                                     #
+#######################################################################
+def canonical(value):
+    # an order independent, hashable form of a criteria dict
+    if isinstance(value, Mapping):
+        return (r'{}',) + tuple(sorted(((str(key), canonical(item)) for key, item in value.items()), key=lambda pair: pair[0]))
+
+    if type(value) in (list, tuple, set, frozenset):
+        items: tuple = tuple(canonical(item) for item in value)
+
+        return (r'[]',) + (tuple(sorted(items, key=repr)) if type(value) in (set, frozenset) else items)
+
+    try:
+        hash(value)
+
+    except TypeError:
+        return (type(value).__name__, repr(value))
+
+    return (type(value).__name__, value)
+
+#######################################################################
+#                                                                     #
+#         COPY ROWS                                                   #
+#                                                                     #
+#######################################################################
+def copy_rows(result):
+    # a copy which callers can change without touching the original, rows
+    # become plain dicts, columns are copied and tuples are kept as they are
+    if result is None:
+        return None
+
+    if isinstance(result, Mapping):
+        return { column: copy(values) for column, values in result.items() }
+
+    rows = copy(result)
+
+    for i, row in enumerate(rows):
+        if isinstance(row, MutableMapping):
+            rows[i] = dict(row)
+
+    return rows
+
+#######################################################################
+#                                                                     #
+#         SIZEOF                                                      #
+#                                                                     #
+#######################################################################
+def sizeof(value) -> int:
+    # a cheap estimate of the memory held by a list of rows or documents
+    if isinstance(value, Mapping):
+        return getsizeof(value) + sum(getsizeof(key) + sizeof(item) for key, item in value.items())
+
+    if type(value) in (list, tuple):
+        return getsizeof(value) + sum(sizeof(item) for item in value)
+
+    return getsizeof(value)
+
+#######################################################################
+#                                                                     #
+#         RESULTCACHE                                                 #
+#                                                                     #
+#######################################################################
+class resultcache():
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'resultcache', ttl: float = 60.0, max_entries: int = 1024, max_bytes: int = 0, table_ttls: dict = None) -> None:
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.table_ttls: dict = {} if table_ttls is None else dict(table_ttls)
+
+        self.lock: Lock = Lock()
+        self.entries: OrderedDict = OrderedDict()   # key -> [table, expires, nbytes, result], least recently used first
+        self.tables: dict = {}                      # table -> keys of its entries
+        self.generations: dict = {}                 # table -> number of invalidations so far
+        self.generation: int = 0                    # number of invalidations of every table so far
+        self.nbytes: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+
+    ###################################################################
+    #     GET                                                         #
+    ###################################################################
+    def get(self: r'resultcache', table: str, criteria: dict, options: tuple = ()) -> list:
+        key: tuple = (table, canonical(criteria), options)
+
+        with self.lock:
+            entry: list = self.entries.get(key)
+
+            if entry is not None and monotonic() >= entry[1]:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        # callers get their own rows so that they cannot change the cached ones
+        return copy_rows(entry[3])
+
+    ###################################################################
+    #     TOKEN, PUT                                                  #
+    ###################################################################
+    def token(self: r'resultcache', table: str) -> tuple:
+        # taken before querying, a result is only stored if no write to its
+        # table was seen in the meantime
+        with self.lock:
+            return (self.generation, self.generations.get(table, 0))
+
+    def put(self: r'resultcache', table: str, criteria: dict, result: list, token: tuple, options: tuple = ()) -> bool:
+        ttl: float = self.table_ttls.get(table, self.ttl)
+
+        if result is None or 0 >= ttl or 0 >= self.max_entries:
+            return False
+
+        key: tuple = (table, canonical(criteria), options)
+        nbytes: int = sizeof(result) if 0 < self.max_bytes else 0
+
+        if 0 < self.max_bytes and nbytes > self.max_bytes:
+            return False
+
+        with self.lock:
+            if token != (self.generation, self.generations.get(table, 0)):
+                return False
+
+            if key in self.entries:
+                self._remove(key)
+
+            self.entries[key] = [table, monotonic() + ttl, nbytes, copy_rows(result)]
+            self.tables.setdefault(table, set()).add(key)
+            self.nbytes += nbytes
+
+            while self.max_entries < len(self.entries) or (0 < self.max_bytes and self.max_bytes < self.nbytes):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+        return True
+
+    ###################################################################
+    #     INVALIDATE                                                  #
+    ###################################################################
+    def invalidate(self: r'resultcache', table: str = None) -> None:
+        with self.lock:
+            self.invalidations += 1
+
+            if table is None:
+                self.generation += 1
+                self.entries.clear()
+                self.tables.clear()
+                self.nbytes = 0
+                return
+
+            self.generations[table] = self.generations.get(table, 0) + 1
+
+            for key in self.tables.pop(table, ()):
+                entry: list = self.entries.pop(key, None)
+
+                if entry is not None:
+                    self.nbytes -= entry[2]
+
+    ###################################################################
+    #     STATS                                                       #
+    ###################################################################
+    def stats(self: r'resultcache') -> dict:
+        with self.lock:
+            return { r'hits': self.hits, r'misses': self.misses, r'evictions': self.evictions, r'invalidations': self.invalidations, r'entries': len(self.entries), r'bytes': self.nbytes }
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _remove(self: r'resultcache', key: tuple) -> None:
+        entry: list = self.entries.pop(key)
+        self.nbytes -= entry[2]
+
+        keys: set = self.tables.get(entry[0])
+
+        if keys is not None:
+            keys.discard(key)
+
+            if 0 == len(keys):
+                del self.tables[entry[0]]
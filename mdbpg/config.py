@@ -0,0 +1,46 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from datetime import datetime
+from sys import stderr
+
+import mtoml
+import os
+
+#######################################################################
+#                                                                     #
+#         LOAD CONFIG                                                 #
+#                                                                     #
+#######################################################################
+def load_config(group: str, env_fields: tuple, toml_fields: tuple = (), use_env_vars: bool = True) -> dict:
+    # env_fields are read from GROUP_FIELD environment variables or from the
+    # [group] of 'database.toml', toml_fields are only read from the latter
+    config: dict = {}
+
+    if use_env_vars is True:
+        for field in env_fields:
+            config[field] = os.getenv(group.upper() + r'_' + field.upper())
+
+        for field in toml_fields:
+            config[field] = None
+
+        return config
+
+    if mtoml.is_loaded(config = r'database') is False:
+        if mtoml.load(config = r'database') is False:
+            print('[{0}] Failed to load the \'database\' configuration.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+
+    for field in env_fields + toml_fields:
+        config[field] = mtoml.get(config = r'database', group = group, field = field)
+
+    return config
@@ -0,0 +1,203 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from collections.abc import Mapping
+
+import re
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# the operators both backends understand, MongoDB runs them as they are
+# apart from $prefix which becomes an anchored $regex, Postgres compiles
+# them into parameterized predicates, both of which can use an index
+OPERATORS: tuple = (r'$eq', r'$ne', r'$gt', r'$gte', r'$lt', r'$lte', r'$in', r'$nin', r'$prefix')
+
+# operators which take a list
+LISTS: tuple = (r'$in', r'$nin')
+
+#######################################################################
+#                                                                     #
+#         IS OPERATORS                                                #
+#                                                                     #
+#######################################################################
+def is_operators(value) -> bool:
+    # { '$gt': 5, '$lt': 10 } rather than a value to compare with
+    return isinstance(value, Mapping) and 0 < len(value) and all(type(key) is str and key.startswith(r'$') for key in value.keys())
+
+#######################################################################
+#                                                                     #
+#         CRITERIA ERROR                                              #
+#                                                                     #
+#######################################################################
+def criteria_error(criteria: dict) -> str:
+    # None when the criteria only use operators from OPERATORS
+    for column, value in ({} if criteria is None else criteria).items():
+        if str(column).startswith(r'$'):
+            return r'{0} is not supported, criteria are AND-ed field conditions'.format(column)
+
+        if is_operators(value) is False:
+            continue
+
+        for operator, operand in value.items():
+            if operator not in OPERATORS:
+                return r'{0} on {1} is not one of {2}'.format(operator, column, r', '.join(OPERATORS))
+
+            if operator in LISTS and (isinstance(operand, (str, bytes, Mapping)) or not hasattr(operand, r'__iter__')):
+                return r'{0} on {1} needs a list'.format(operator, column)
+
+            if r'$prefix' == operator and type(operand) is not str:
+                return r'$prefix on {0} needs a string'.format(column)
+
+    return None
+
+#######################################################################
+#                                                                     #
+#         CRITERIA TERMS                                              #
+#                                                                     #
+#######################################################################
+def criteria_terms(criteria: dict) -> tuple:
+    # (terms, params) for SQL, a term is a column compared for equality or
+    # a (column, operator) pair, so statements are cached by the shape of
+    # the criteria and never by their values
+    terms: list = []
+    params: list = []
+
+    for column, value in ({} if criteria is None else criteria).items():
+        if is_operators(value) is False:
+            terms.append(column)
+            params.append(value)
+
+            continue
+
+        for operator, operand in value.items():
+            terms.append((column, operator))
+            params.append(_sql_operand(operator, operand))
+
+    return tuple(terms), tuple(params)
+
+#######################################################################
+#                                                                     #
+#         MONGO CRITERIA                                              #
+#                                                                     #
+#######################################################################
+def mongo_criteria(criteria: dict) -> dict:
+    # native MongoDB operators are passed through untouched
+    if criteria is None:
+        return None
+
+    translated: dict = {}
+
+    for key, value in criteria.items():
+        if key in (r'$and', r'$or', r'$nor') and type(value) is list:
+            value = [mongo_criteria(clause) for clause in value]
+
+        elif is_operators(value) is True and r'$prefix' in value:
+            value = { (r'$regex' if r'$prefix' == operator else operator): (r'^' + re.escape(operand) if r'$prefix' == operator else operand) for operator, operand in value.items() }
+
+        translated[key] = value
+
+    return translated
+
+#######################################################################
+#                                                                     #
+#         MATCHES                                                     #
+#                                                                     #
+#######################################################################
+def matches(document, criteria: dict, sql: bool = False) -> bool:
+    # evaluates criteria without a database, as Postgres would when sql is
+    # True where NULLs never equal anything, or else as MongoDB would where
+    # None matches null and missing fields, dotted names reach into nested
+    # documents and a value matches an array holding it
+    for column, expected in ({} if criteria is None else criteria).items():
+        value = document.get(column) if sql is True else _field(document, column)
+        operators: dict = expected if is_operators(expected) is True else { r'$eq': expected }
+
+        if any(_matches(value, operator, operand, sql) is False for operator, operand in operators.items()):
+            return False
+
+    return True
+
+#######################################################################
+#                                                                     #
+#         PRIVATE                                                     #
+#                                                                     #
+#######################################################################
+def _sql_operand(operator: str, operand):
+    # lists become arrays for ANY and ALL, prefixes LIKE patterns
+    if operator in LISTS:
+        return list(operand)
+
+    if r'$prefix' == operator:
+        return re.sub(r'([\\%_])', r'\\\1', operand) + r'%'
+
+    return operand
+
+def _field(document, field: str):
+    for part in field.split(r'.'):
+        document = document.get(part) if isinstance(document, Mapping) else None
+
+    return document
+
+def _matches(value, operator: str, operand, sql: bool) -> bool:
+    if r'$ne' == operator:
+        return (value != operand) if sql is True else _matches(value, r'$eq', operand, sql) is False
+
+    if r'$nin' == operator:
+        if sql is True:
+            return value is None or (None not in operand and value not in operand)
+
+        return _matches(value, r'$in', operand, sql) is False
+
+    if sql is True:
+        if value is None:
+            return False
+
+        candidates: list = [value]
+
+    else:
+        candidates = [value] + (value if isinstance(value, list) and not isinstance(operand, list) else [])
+
+    return any(_compare(candidate, operator, operand, sql) is True for candidate in candidates)
+
+def _compare(value, operator: str, operand, sql: bool) -> bool:
+    try:
+        if r'$eq' == operator:
+            return value == operand and (sql is False or operand is not None)
+
+        if r'$in' == operator:
+            return any(value == option and (sql is False or option is not None) for option in operand)
+
+        if r'$prefix' == operator:
+            return type(value) is str and value.startswith(operand)
+
+        if value is None or operand is None:
+            return False
+
+        if r'$gt' == operator:
+            return value > operand
+
+        if r'$gte' == operator:
+            return value >= operand
+
+        if r'$lt' == operator:
+            return value < operand
+
+        return value <= operand
+
+    except TypeError:
+        # values of different types never match a range, as with MongoDB's
+        # type bracketing
+        return False
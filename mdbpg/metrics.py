@@ -0,0 +1,178 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from bisect import bisect_left
+from datetime import datetime
+from mdbpg.cache import sizeof
+from sys import stderr
+from threading import Lock
+from time import perf_counter
+from typing import Callable
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# upper bounds in seconds, anything slower lands in a final +Inf bucket
+BUCKETS: tuple = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES: tuple = (r'queue', r'connect', r'execute', r'fetch')
+
+#######################################################################
+#                                                                     #
+#         HISTOGRAM                                                   #
+#                                                                     #
+#######################################################################
+class histogram():
+    __slots__ = (r'count', r'sum', r'buckets')
+
+    def __init__(self: r'histogram') -> None:
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.buckets: list = [0] * (len(BUCKETS) + 1)
+
+    def observe(self: r'histogram', seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def snapshot(self: r'histogram') -> dict:
+        return { r'count': self.count, r'sum': self.sum, r'buckets': dict(zip(BUCKETS + (float(r'inf'),), self.buckets)) }
+
+#######################################################################
+#                                                                     #
+#         SPAN                                                        #
+#                                                                     #
+#######################################################################
+class span():
+    __slots__ = (r'metrics', r'operation', r'table', r'start', r'last', r'phases')
+
+    def __init__(self: r'span', owner: r'metrics', operation: str, table: str) -> None:
+        self.metrics: metrics = owner
+        self.operation: str = operation
+        self.table: str = table
+        self.start: float = perf_counter()
+        self.last: float = self.start
+        self.phases: dict = {}
+
+    def phase(self: r'span', name: str) -> None:
+        # closes the phase which started at the previous mark
+        now: float = perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self: r'span', rows: int = 0, result=None, error: BaseException = None) -> None:
+        self.metrics._record(self, perf_counter() - self.start, rows, result, error)
+
+class nullspan():
+    __slots__ = ()
+
+    def phase(self: r'nullspan', name: str) -> None:
+        pass
+
+    def finish(self: r'nullspan', rows: int = 0, result=None, error: BaseException = None) -> None:
+        pass
+
+# shared by every call made while metrics are disabled
+NULLSPAN: nullspan = nullspan()
+
+#######################################################################
+#                                                                     #
+#         METRICS                                                     #
+#                                                                     #
+#######################################################################
+class metrics():
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'metrics', enabled: bool = True, measure_bytes: bool = False) -> None:
+        self.enabled: bool = enabled
+        self.measure_bytes: bool = measure_bytes    # estimating result sizes walks every row
+        self.hooks: list = []
+        self.lock: Lock = Lock()
+        self.operations: dict = {}
+
+    ###################################################################
+    #     SPAN                                                        #
+    ###################################################################
+    def span(self: r'metrics', operation: str, table: str = None):
+        if self.enabled is False:
+            return NULLSPAN
+
+        return span(self, operation, table)
+
+    ###################################################################
+    #     HOOKS                                                       #
+    ###################################################################
+    def add_hook(self: r'metrics', callback: Callable) -> None:
+        # callbacks receive one dict per finished operation
+        with self.lock:
+            self.hooks = self.hooks + [callback]
+
+    def remove_hook(self: r'metrics', callback: Callable) -> None:
+        with self.lock:
+            self.hooks = [hook for hook in self.hooks if hook != callback]
+
+    ###################################################################
+    #     STATS, RESET                                                #
+    ###################################################################
+    def stats(self: r'metrics') -> dict:
+        with self.lock:
+            return { operation: { r'count': record[r'total'].count,
+                                  r'rows': record[r'rows'],
+                                  r'bytes': record[r'bytes'],
+                                  r'errors': dict(record[r'errors']),
+                                  r'latency': record[r'total'].snapshot(),
+                                  r'phases': { phase: record[r'phases'][phase].snapshot() for phase in PHASES } } for operation, record in self.operations.items() }
+
+    def reset(self: r'metrics') -> None:
+        with self.lock:
+            self.operations = {}
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _record(self: r'metrics', finished: span, seconds: float, rows: int, result, error: BaseException) -> None:
+        nbytes: int = sizeof(result) if self.measure_bytes is True and result is not None else 0
+
+        with self.lock:
+            record: dict = self.operations.get(finished.operation)
+
+            if record is None:
+                record = { r'total': histogram(), r'rows': 0, r'bytes': 0, r'errors': {}, r'phases': { phase: histogram() for phase in PHASES } }
+                self.operations[finished.operation] = record
+
+            record[r'total'].observe(seconds)
+            record[r'rows'] += rows
+            record[r'bytes'] += nbytes
+
+            for phase, phase_seconds in finished.phases.items():
+                if phase in record[r'phases']:
+                    record[r'phases'][phase].observe(phase_seconds)
+
+            if error is not None:
+                record[r'errors'][type(error).__name__] = record[r'errors'].get(type(error).__name__, 0) + 1
+
+            hooks: list = self.hooks
+
+        if 0 == len(hooks):
+            return
+
+        event: dict = { r'operation': finished.operation, r'table': finished.table, r'seconds': seconds, r'phases': finished.phases, r'rows': rows, r'bytes': nbytes, r'error': None if error is None else type(error).__name__ }
+
+        for hook in hooks:
+            try:
+                hook(event)
+
+            except Exception as hook_exception:
+                print('[{0}] An exception was thrown by a metrics hook: {1}'.format(datetime.now().strftime('%m/%d %I:%M %p'), str(hook_exception)), file=stderr)
@@ -0,0 +1,484 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from abc import ABC, abstractmethod
+from collections.abc import Hashable
+from datetime import datetime, time
+from mdbpg.criteria import criteria_error, is_operators, matches
+from sys import stderr
+from threading import Event, Lock, Thread
+from typing import Callable
+
+import psycopg2
+import psycopg2.extras
+import select
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# change stream events after which the collection has to be reloaded
+GAPS: tuple = (r'drop', r'rename', r'dropDatabase', r'invalidate')
+
+# operators whose answer on text follows the database's collation
+TEXT_RANGES: tuple = (r'$gt', r'$gte', r'$lt', r'$lte', r'$prefix')
+
+#######################################################################
+#                                                                     #
+#         MIRROR                                                      #
+#                                                                     #
+#######################################################################
+class mirror(ABC):
+    # an in-memory copy of a table kept current by a thread following its
+    # changes, rows are held by identity with hash indexes on the key and
+    # on the other columns finds compare for equality, built on first use
+    # and dropped by every full load, find returns None while the copy is
+    # not loaded or has fallen behind, including after a write through the
+    # database instance until the follower has seen it, and for criteria
+    # the database might compare differently, so that the caller asks the
+    # database, pgmirror and mdbmirror implement _follow for each database
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'mirror', table: str, key: str, sql: bool, column: Callable, retry_interval: float = 1.0) -> None:
+        self.table: str = table
+        self.key: str = column(key)
+        self.sql: bool = sql                # compare as Postgres would, or else as MongoDB would
+        self.column: Callable = column      # the name of a criteria column in the rows
+        self.retry_interval: float = retry_interval
+        self.lock: Lock = Lock()
+        self.rows: dict = {}                # identity -> row
+        self.indexes: dict = { self.key: {} }
+        self.kinds: dict = {}               # column -> kinds of its values, built like the indexes
+        self.marks: int = 0                 # writes through the database instance
+        self.synced: int = 0                # the marks the follower has caught up with
+        self.ready: Event = Event()
+        self.stop: Event = Event()
+        self.thread: Thread = None
+        self.hits: int = 0
+        self.loads: int = 0
+        self.changes: int = 0
+        self.failures: int = 0              # in a row, reset by a load
+
+    ###################################################################
+    #     START, CLOSE                                                #
+    ###################################################################
+    def start(self: r'mirror', timeout: float = None) -> bool:
+        # True once the first load finished within timeout
+        self.thread = Thread(target=self._follow, name=r'mdbpg_mirror', daemon=True)
+        self.thread.start()
+
+        return self.ready.wait(timeout)
+
+    def close(self: r'mirror') -> None:
+        self.stop.set()
+        self.ready.clear()
+
+        if self.thread is not None:
+            self.thread.join()
+
+    ###################################################################
+    #     FIND                                                        #
+    ###################################################################
+    def find(self: r'mirror', criteria: dict, fields: list = None, limit: int = None) -> list:
+        # None when the criteria can not be answered locally
+        if self.ready.is_set() is False or criteria_error(criteria) is not None:
+            return None
+
+        if self.sql is False and fields is not None and any(r'.' in field for field in fields):
+            return None
+
+        criteria = { self.column(column): value for column, value in ({} if criteria is None else criteria).items() }
+        found: list = []
+
+        with self.lock:
+            if self.ready.is_set() is False or self.synced < self.marks or self._comparable(criteria) is False:
+                return None
+
+            for identity in self._candidates(criteria):
+                row = self.rows[identity]
+
+                if matches(row, criteria, self.sql) is True:
+                    found.append(dict(row) if fields is None else self._project(row, fields))
+
+                    if limit is not None and 0 < limit and limit <= len(found):
+                        break
+
+            self.hits += 1
+
+        return found
+
+    ###################################################################
+    #     BEHIND                                                      #
+    ###################################################################
+    def behind(self: r'mirror') -> None:
+        # called after a write, find goes to the database until the
+        # follower has caught up with it
+        with self.lock:
+            self.marks += 1
+
+    def _caught_up(self: r'mirror', mark: int) -> None:
+        # mark is the number of writes made before the follower last
+        # caught up with the database
+        with self.lock:
+            self.synced = max(self.synced, mark)
+
+    ###################################################################
+    #     STATS                                                       #
+    ###################################################################
+    def stats(self: r'mirror') -> dict:
+        with self.lock:
+            return { r'ready': self.ready.is_set(), r'behind': self.synced < self.marks, r'rows': len(self.rows), r'hits': self.hits, r'loads': self.loads, r'changes': self.changes, r'failures': self.failures, r'indexes': sorted(column for column, index in self.indexes.items() if index is not None) }
+
+    ###################################################################
+    #     CHANGES                                                     #
+    ###################################################################
+    def _load(self: r'mirror', rows: list) -> None:
+        # rows are (identity, row) pairs replacing everything held
+        with self.lock:
+            self.rows = dict(rows)
+            self.indexes = { self.key: None }
+            self.indexes[self.key] = self._index(self.key)
+            self.kinds = {}
+            self.loads += 1
+            self.failures = 0
+
+        self.ready.set()
+
+    def _put(self: r'mirror', identity, row) -> None:
+        with self.lock:
+            self._unindex(identity)
+            self.rows[identity] = row
+            self.changes += 1
+
+            for column, index in self.indexes.items():
+                if index is not None and self._add(index, identity, row.get(column)) is False:
+                    self.indexes[column] = None
+
+            # a removed row leaves its kinds behind, which only sends more
+            # finds to the database
+            for column, kinds in self.kinds.items():
+                kinds.add(_kind(row.get(column)))
+
+    def _remove(self: r'mirror', identity) -> None:
+        with self.lock:
+            self._unindex(identity)
+            self.rows.pop(identity, None)
+            self.changes += 1
+
+    def _gap(self: r'mirror', error: Exception) -> None:
+        # finds go to the database until the table has been loaded again,
+        # only the first of the failures in a row is printed
+        self.ready.clear()
+
+        with self.lock:
+            self.failures += 1
+
+        if self.stop.is_set() is False and 1 == self.failures:
+            print('[{0}] The mirror of \'{1}\' is reloading after an exception: {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.table, str(error)), file=stderr)
+
+    @abstractmethod
+    def _follow(self: r'mirror') -> None:
+        # runs on the thread start() launches until stop is set
+        ...
+
+    def _project(self: r'mirror', row, fields: list) -> dict:
+        # as find would, MongoDB leaves out missing fields and _id unless
+        # it was asked for
+        if self.sql is True:
+            return { self.column(field): row.get(self.column(field)) for field in fields }
+
+        return { field: row[field] for field in fields if field in row }
+
+    ###################################################################
+    #     COMPARABLE                                                  #
+    ###################################################################
+    def _comparable(self: r'mirror', criteria: dict) -> bool:
+        # False when the database might compare differently, text ranges
+        # follow its collation and operands of another type than the
+        # column holds are coerced by Postgres, such as '5' for 5 or a
+        # string for a timestamp, and ordered by type by MongoDB
+        for column, value in criteria.items():
+            if r'.' in column and self.sql is False:
+                return False
+
+            if column not in self.kinds:
+                self.kinds[column] = { _kind(row.get(column)) for row in self.rows.values() }
+
+            kinds: set = self.kinds[column] - { None }
+
+            for operator, operand in (value if is_operators(value) is True else { r'$eq': value }).items():
+                options: list = list(operand) if operator in (r'$in', r'$nin') else [operand]
+
+                if operator in TEXT_RANGES and any(isinstance(option, str) for option in options):
+                    return False
+
+                if any(option is not None and { _kind(option) } != kinds for option in options):
+                    return False
+
+        return True
+
+    ###################################################################
+    #     INDEXES                                                     #
+    ###################################################################
+    def _candidates(self: r'mirror', criteria: dict):
+        # the identities of rows which might match, narrowed by the first
+        # column compared for equality which can be indexed
+        for column, value in criteria.items():
+            if r'.' in column and self.sql is False:
+                continue
+
+            values: list = _equalities(value)
+
+            if values is None or any(isinstance(option, Hashable) is False for option in values):
+                continue
+
+            if column not in self.indexes:
+                self.indexes[column] = self._index(column)
+
+            index: dict = self.indexes[column]
+
+            if index is not None:
+                return [identity for option in values for identity in index.get(option, ())]
+
+        return list(self.rows.keys())
+
+    def _index(self: r'mirror', column: str) -> dict:
+        # None when a value can not be hashed, such as a list or a dict
+        index: dict = {}
+
+        for identity, row in self.rows.items():
+            if self._add(index, identity, row.get(column)) is False:
+                return None
+
+        return index
+
+    def _add(self: r'mirror', index: dict, identity, value) -> bool:
+        try:
+            index.setdefault(value, set()).add(identity)
+
+        except TypeError:
+            return False
+
+        return True
+
+    def _unindex(self: r'mirror', identity) -> None:
+        row = self.rows.get(identity)
+
+        if row is None:
+            return
+
+        for column, index in self.indexes.items():
+            if index is not None and row.get(column) in index:
+                index[row.get(column)].discard(identity)
+
+                if 0 == len(index[row.get(column)]):
+                    del index[row.get(column)]
+
+#######################################################################
+#                                                                     #
+#         PGMIRROR                                                    #
+#                                                                     #
+#######################################################################
+class pgmirror(mirror):
+    # follows a Postgres table through the notifications sent by triggers
+    # on it, reading the changed rows again by key on its own connection
+    # which sits outside of the pool and the scheduler, a lost connection
+    # or a truncate reloads the whole table
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'pgmirror', db, table: str, key: str, retry_interval: float = 1.0) -> None:
+        super().__init__(table, key, True, lambda column: db.compiler.fold(column)[-1], retry_interval)
+        self.db = db
+        self.source_key: str = key
+        self.key_type: str = None
+
+    ###################################################################
+    #     FOLLOW                                                      #
+    ###################################################################
+    def _follow(self: r'pgmirror') -> None:
+        while self.stop.is_set() is False:
+            dbconn = None
+
+            try:
+                dbconn = self.db._connect()
+                dbconn.autocommit = True
+
+                # listening first means no change made during the load is lost
+                with dbconn.cursor() as dbcursor:
+                    dbcursor.execute(self.db.compiler.listen(self.table, self.source_key))
+                    dbcursor.execute(*self.db.compiler.key_type(self.table, self.source_key))
+                    self.key_type = dbcursor.fetchone()[0]
+
+                mark: int = self.marks
+                self._load(self._read(dbconn))
+                self._caught_up(mark)
+
+                while self.stop.is_set() is False:
+                    mark = self.marks
+
+                    if self.synced < mark:
+                        # a round trip brings in the notifications of every
+                        # write committed before it, writes mark the mirror
+                        # after they commit
+                        with dbconn.cursor() as dbcursor:
+                            dbcursor.execute(r'SELECT 1')
+
+                    elif ([], [], []) == select.select([dbconn], [], [], self.retry_interval):
+                        continue
+
+                    else:
+                        dbconn.poll()
+                        mark = None
+
+                    payloads: set = { notify.payload for notify in dbconn.notifies }
+                    del dbconn.notifies[:]
+
+                    if r't' in payloads:
+                        self._load(self._read(dbconn))
+
+                    elif 0 < len(payloads):
+                        self._refresh(dbconn, { payload[1:] for payload in payloads })
+
+                    if mark is not None:
+                        self._caught_up(mark)
+
+            except Exception as mirror_exception:
+                self._gap(mirror_exception)
+                self.stop.wait(self.retry_interval)
+
+            finally:
+                if dbconn is not None:
+                    dbconn.close()
+
+    def _read(self: r'pgmirror', dbconn, identities: set = None) -> list:
+        with dbconn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as dbcursor:
+            dbcursor.execute(*self.db.compiler.mirror_rows(self.table, self.source_key, self.key_type, identities))
+
+            return [(row.pop(r'mdbpg_mirror_key'), row) for row in dbcursor.fetchall()]
+
+    def _refresh(self: r'pgmirror', dbconn, identities: set) -> None:
+        # the rows which are gone were deleted or had their key changed
+        rows: list = self._read(dbconn, identities)
+
+        for identity, row in rows:
+            self._put(identity, row)
+
+        for identity in identities - { identity for identity, row in rows }:
+            self._remove(identity)
+
+#######################################################################
+#                                                                     #
+#         MDBMIRROR                                                   #
+#                                                                     #
+#######################################################################
+class mdbmirror(mirror):
+    # follows a collection through a change stream, which needs a replica
+    # set, rows are held by _id and a dropped connection resumes from the
+    # last resume token, the collection is only reloaded when that fails
+    # or the stream ends with a drop, rename or invalidate
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'mdbmirror', db, collection: str, key: str = r'_id', retry_interval: float = 1.0) -> None:
+        super().__init__(collection, key, False, lambda column: column, retry_interval)
+        self.db = db
+        self.token = None
+
+    ###################################################################
+    #     FOLLOW                                                      #
+    ###################################################################
+    def _follow(self: r'mdbmirror') -> None:
+        while self.stop.is_set() is False:
+            try:
+                dbcollection = self.db._collection(self.table)
+
+                with dbcollection.watch(full_document=r'updateLookup', resume_after=self.token, max_await_time_ms=int(self.retry_interval * 1000)) as stream:
+                    # opening the stream first means no change made during
+                    # the load is lost
+                    if self.token is None:
+                        mark: int = self.marks
+                        self.token = stream.resume_token
+                        self._load([(document[r'_id'], document) for document in dbcollection.find({})])
+                        self._caught_up(mark)
+
+                    else:
+                        self.ready.set()
+
+                    while self.stop.is_set() is False and stream.alive is True:
+                        mark = self.marks
+                        change: dict = stream.try_next()
+                        self.token = stream.resume_token
+
+                        if change is None:
+                            # an empty batch asked for after a write has
+                            # seen it, since writes are acknowledged once a
+                            # majority has them, MongoDB's default from 5.0
+                            self._caught_up(mark)
+
+                            continue
+
+                        if change[r'operationType'] in GAPS:
+                            self.token = None
+                            self._gap(RuntimeError(r'the change stream ended with ' + change[r'operationType']))
+
+                            break
+
+                        if r'_id' not in change.get(r'documentKey', {}):
+                            continue
+
+                        if r'delete' == change[r'operationType'] or change.get(r'fullDocument') is None:
+                            self._remove(change[r'documentKey'][r'_id'])
+
+                        else:
+                            self._put(change[r'documentKey'][r'_id'], change[r'fullDocument'])
+
+            except Exception as mirror_exception:
+                # resuming is tried first, a token which can no longer be
+                # resumed from is dropped so that the next attempt reloads
+                if self.token is not None and self.ready.is_set() is False:
+                    self.token = None
+
+                self._gap(mirror_exception)
+                self.stop.wait(self.retry_interval)
+
+#######################################################################
+#                                                                     #
+#         HELPERS                                                     #
+#                                                                     #
+#######################################################################
+def _kind(value):
+    # what finds compare a value by, None for a missing or null value, and
+    # naive and aware times apart since they do not compare with each other
+    if value is None:
+        return None
+
+    if isinstance(value, (datetime, time)):
+        return (type(value), value.tzinfo is None)
+
+    return type(value)
+
+def _equalities(value) -> list:
+    # the values a criteria value compares for equality, or None
+    if is_operators(value) is False:
+        return [value]
+
+    if r'$in' in value:
+        return list(value[r'$in'])
+
+    if r'$eq' in value:
+        return [value[r'$eq']]
+
+    return None
@@ -11,14 +11,98 @@
 #         IMPORTS                                                     #
 #                                                                     #
 #######################################################################
+from contextlib import contextmanager
+from contextvars import ContextVar
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from datetime import datetime
-from pymongo import MongoClient
+from functools import partial
+from mdbpg.advisor import advisor, covered, mongo_summary
+from mdbpg.bulk import batch_result, chunks, has_keys, is_document, is_update, latest, upsert_result
+from mdbpg.cache import resultcache
+from mdbpg.config import load_config
+from mdbpg.criteria import mongo_criteria
+from mdbpg.metrics import NULLSPAN, metrics
+from mdbpg.mirror import mdbmirror
+from mdbpg.paging import decode_token, mongo_filter, mongo_projection, mongo_sort, next_page, order_spec, with_order
+from mdbpg.partitions import merge, mongo_range, ranges, split_range
+from mdbpg.resilience import IDEMPOTENT, resilience
+from mdbpg.results import FORMATS, count_rows, shape_documents
+from mdbpg.scheduler import scheduler, scheduler_for
+from mdbpg.singleflight import singleflight
+from mdbpg.transaction import mdbtransaction
+from mdbpg.transfer import FILE_FORMATS, csv_row, encode_document, mapped, progresswriter, read_documents, transfer_result
+from mdbpg.writer import bufferedwriter
+from pymongo import ASCENDING, DeleteMany, MongoClient, ReadPreference, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
 from sys import stderr
-from threading import Semaphore
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterable, Iterator
 
-import mtoml
 import os
 
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# the field of a BulkWriteError's details holding each bulk method's count
+BULK_COUNTS: dict = { r'insert_many': { r'count': r'nInserted' },
+                      r'update_many_rows': { r'count': r'nMatched' },
+                      r'delete_many': { r'count': r'nRemoved' },
+                      r'upsert_many': { r'inserted': r'nUpserted', r'updated': r'nMatched' },
+                      r'import_table': { r'count': r'nInserted' } }
+
+# the write error code for a document whose _id is already taken
+DUPLICATE_KEY: int = 11000
+
+# documents stay encoded until a field is read with result_format='raw'
+RAW_OPTIONS: CodecOptions = CodecOptions(document_class=RawBSONDocument)
+
+#######################################################################
+#                                                                     #
+#         CONNECTION STRING, CLIENT OPTIONS                           #
+#                                                                     #
+#######################################################################
+def connection_string(username: str, password: str, hostname: str, authsrc: str, dbname: str) -> str:
+    if username is None or password is None or hostname is None or authsrc is None or dbname is None:
+        return r''
+
+    connstr: str = r'mongodb+srv://' + str(username) + r':' + str(password) + r'@' + str(hostname) + r'/?retryWrites=true&w=majority'
+
+    if 0 < len(str(authsrc)):
+        connstr += r'&authSource=' + str(authsrc)
+
+    return connstr
+
+def client_options(max_conns: int, pool_size: int = None, wait_queue_timeout_ms: int = None, compressors: str = None, server_selection_timeout_ms: int = None, read_preference: str = None, max_staleness_seconds: int = None) -> dict:
+    # the scheduler already caps concurrent operations at max_conns so
+    # the driver's pool never needs more sockets than that by default
+    options: dict = { r'maxPoolSize': pool_size if pool_size is not None and 0 < pool_size else (max_conns if 0 < max_conns else 10) }
+
+    if wait_queue_timeout_ms is not None:
+        options[r'waitQueueTimeoutMS'] = wait_queue_timeout_ms
+
+    if compressors is not None and 0 < len(compressors):
+        options[r'compressors'] = compressors if type(compressors) is str else r','.join(compressors)
+
+    if server_selection_timeout_ms is not None:
+        options[r'serverSelectionTimeoutMS'] = server_selection_timeout_ms
+
+    # reads go to the members the read preference allows and the driver
+    # picks among those within its latency window, writes always go to the
+    # primary, a staleness bound only applies to non-primary reads and
+    # MongoDB requires it to be at least 90 seconds
+    if read_preference is not None and 0 < len(read_preference):
+        options[r'readPreference'] = read_preference
+
+        if max_staleness_seconds is not None and r'' != max_staleness_seconds and r'primary' != read_preference:
+            options[r'maxStalenessSeconds'] = int(max_staleness_seconds)
+
+    return options
+
 #######################################################################
 #                                                                     #
 #         MONGODB                                                     #
@@ -28,130 +112,855 @@ class mongodb():
     ###################################################################
     #     CONSTRUCTOR, INSTANCE VARIABLES                             #
     ###################################################################
-    def __init__(self: r'mongodb', max_conns: int = 10, use_env_vars: bool = True) -> None:
-        if 0 >= max_conns:
-            self.sema = Semaphore(10)
-        
-        else:
-            self.sema = Semaphore(max_conns)
+    def __init__(self: r'mongodb', max_conns: int = 10, use_env_vars: bool = True, pool_size: int = None, wait_queue_timeout_ms: int = None, compressors: str = None, server_selection_timeout_ms: int = None, cache: resultcache = None, metrics: metrics = None, writer: bufferedwriter = None, scheduler: scheduler = None, resilience: resilience = None, singleflight: singleflight = None, read_preference: str = None, max_staleness_seconds: int = None, advisor: advisor = None) -> None:
+        self.cache: resultcache = cache
+        self.singleflight: singleflight = singleflight
+        self.advisor: advisor = advisor
+        self.mirrors: dict = {}             # collection -> mdbmirror
+        self.metrics: metrics = metrics
+        self.writer: bufferedwriter = writer
+        self.resilience: resilience = resilience
+
+        if writer is not None:
+            writer.attach(self.insert_many)
+
+        self.scheduler: scheduler = scheduler_for(scheduler, max_conns)
+
+        self.client: MongoClient = None
+        self.client_lock: Lock = Lock()
+        self.client_key: tuple = None
+
+        # set by session() to send reads to the primary after a write
+        self.session_state: ContextVar = ContextVar(r'mdbpg_session', default=None)
+
+        config: dict = load_config(r'mongodb', (r'username', r'password', r'hostname', r'dbname', r'read_preference', r'max_staleness_seconds'), (r'authsrc', r'pool_size', r'wait_queue_timeout_ms', r'compressors', r'server_selection_timeout_ms'), use_env_vars=use_env_vars)
+
+        self.username: str = config[r'username']
+        self.password: str = config[r'password']
+        self.hostname: str = config[r'hostname']
+        self.authsrc: str = r'' if use_env_vars is True else config[r'authsrc']
+        self.dbname: str = config[r'dbname']
+
+        # constructor arguments take precedence over the configuration
+        self.client_options: dict = client_options(max_conns,
+                                                   config[r'pool_size'] if pool_size is None else pool_size,
+                                                   config[r'wait_queue_timeout_ms'] if wait_queue_timeout_ms is None else wait_queue_timeout_ms,
+                                                   config[r'compressors'] if compressors is None else compressors,
+                                                   config[r'server_selection_timeout_ms'] if server_selection_timeout_ms is None else server_selection_timeout_ms,
+                                                   config[r'read_preference'] if read_preference is None else read_preference,
+                                                   config[r'max_staleness_seconds'] if max_staleness_seconds is None else max_staleness_seconds)
+
+        self.connstr: str = connection_string(self.username, self.password, self.hostname, self.authsrc, self.dbname)
 
-        if use_env_vars is True:
-            self.username: str = os.getenv(r'MONGODB_USERNAME')
-            self.password: str = os.getenv(r'MONGODB_PASSWORD')
-            self.hostname: str = os.getenv(r'MONGODB_HOSTNAME')
-            self.authsrc: str = r''
-            self.dbname: str = os.getenv(r'MONGODB_DBNAME')
+        if r'' == self.connstr:
+            print('[{0}] Failed to load the configuration for MongoDB.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
 
-        else:
-            if mtoml.is_loaded(config = r'database') is False:
-                if mtoml.load(config = r'database') is False:
-                    print('[{0}] Failed to load the \'database\' configuration.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+    ###################################################################
+    #     CONTEXT MANAGER                                             #
+    ###################################################################
+    def __enter__(self: r'mongodb') -> r'mongodb':
+        return self
 
-            self.username: str = mtoml.get(config = r'database', group = r'mongodb', field = r'username')
-            self.password: str = mtoml.get(config = r'database', group = r'mongodb', field = r'password')
-            self.hostname: str = mtoml.get(config = r'database', group = r'mongodb', field = r'hostname')
-            self.authsrc: str = mtoml.get(config = r'database', group = r'mongodb', field = r'authsrc')
-            self.dbname: str = mtoml.get(config = r'database', group = r'mongodb', field = r'dbname')
+    def __exit__(self: r'mongodb', exc_type, exc_value, traceback) -> None:
+        self.close()
 
-        if self.username is None or self.password is None or self.hostname is None or self.authsrc is None or self.dbname is None:
-            self.connstr = r''
+    ###################################################################
+    #     CLOSE                                                       #
+    ###################################################################
+    def close(self: r'mongodb') -> None:
+        if self.writer is not None:
+            self.writer.close()
 
-            print('[{0}] Failed to load the configuration for MongoDB.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+        for mirrored in list(self.mirrors.values()):
+            mirrored.close()
 
-        else:
-            self.connstr = r'mongodb+srv://' + str(self.username) + r':' + str(self.password) + r'@' + str(self.hostname) + r'/?retryWrites=true&w=majority'
+        with self.client_lock:
+            client: MongoClient = self.client
+            self.client = None
+            self.client_key = None
 
-            if 0 < len(str(self.authsrc)):
-                self.connstr += r'&authSource=' + str(self.authsrc)
+        if client is not None:
+            client.close()
 
     ###################################################################
-    #     FIND                                                        #
+    #     FLUSH                                                       #
     ###################################################################
-    def find(self: r'mongodb', collection: str, criteria: dict) -> list:
-        dbresult: list = None
+    def flush(self: r'mongodb') -> bool:
+        if self.writer is None:
+            return True
 
-        if r'' == self.connstr:
-            return dbresult
+        return self.writer.flush()
+
+    ###################################################################
+    #     METRICS                                                     #
+    ###################################################################
+    def _span(self: r'mongodb', operation: str, collection: str = None):
+        if self.metrics is None:
+            return NULLSPAN
+
+        return self.metrics.span(operation, collection)
+
+    ###################################################################
+    #     CACHE                                                       #
+    ###################################################################
+    def _invalidate(self: r'mongodb', collection: str) -> None:
+        # every write ends up here, including the ones which failed
+        state: dict = self.session_state.get()
+
+        if state is not None:
+            state[r'wrote'] = True
+
+        if self.cache is not None:
+            self.cache.invalidate(collection)
+
+        if self.singleflight is not None:
+            self.singleflight.forget(collection)
+
+        for name, mirrored in list(self.mirrors.items()):
+            if collection is None or collection == name:
+                mirrored.behind()
+
+    ###################################################################
+    #     ADVISOR                                                     #
+    ###################################################################
+    def _advise(self: r'mongodb', collection: str, criteria: dict, started: float) -> None:
+        if self.advisor is not None:
+            self.advisor.record(collection, criteria, perf_counter() - started)
+
+    ###################################################################
+    #     CLIENT                                                      #
+    ###################################################################
+    def _client(self: r'mongodb') -> MongoClient:
+        # one client per process and connection string, MongoClient is
+        # thread safe but must not be reused across a fork
+        key: tuple = (os.getpid(), self.connstr)
+        client: MongoClient = self.client
+
+        if client is not None and key == self.client_key:
+            return client
+
+        with self.client_lock:
+            if self.client is None or key != self.client_key:
+                if self.client is not None and self.client_key[0] == key[0]:
+                    self.client.close()
+
+                self.client = MongoClient(self.connstr, **self.client_options)
+                self.client_key = key
+
+            return self.client
 
-        self.sema.acquire()
+    def _collection(self: r'mongodb', collection: str, read: bool = False):
+        dbcollection = self._client()[str(self.dbname)][collection]
+
+        if read is True and self._wrote() is True:
+            return dbcollection.with_options(read_preference=ReadPreference.PRIMARY)
+
+        return dbcollection
+
+    ###################################################################
+    #     SESSION                                                     #
+    ###################################################################
+    @contextmanager
+    def session(self: r'mongodb'):
+        # reads in the block follow the read preference until the block
+        # writes, after which they go to the primary to see the write
+        token = self.session_state.set({ r'wrote': False })
+
+        try:
+            yield self
+
+        finally:
+            self.session_state.reset(token)
+
+    def _wrote(self: r'mongodb') -> bool:
+        state: dict = self.session_state.get()
+
+        return state is not None and state[r'wrote'] is True
+
+    ###################################################################
+    #     RUN                                                         #
+    ###################################################################
+    def _run(self: r'mongodb', operation: str, collection: str, action: Callable, description: str) -> tuple:
+        # runs action against the collection within a scheduler slot and
+        # returns (value, None) or (None, exception)
+        span = self._span(operation, collection)
+        value = None
+        error: Exception = None
+
+        def attempt():
+            with self.scheduler.slot(span=span):
+                dbcollection = self._collection(collection, r'find' == operation)
+                span.phase(r'connect')
+
+                result = action(dbcollection)
+                span.phase(r'execute')
+
+                return result
 
         try:
-            dbresult = list(MongoClient(self.connstr)[str(self.dbname)][collection].find(criteria))
+            value = self._attempt(operation, attempt)
 
         except Exception as mongodb_exception:
-            dbresult = None
+            error = mongodb_exception
+
+            print('[{0}] An exception was thrown while trying to {1} the collection \'{2}\' using MongoDB: {3}'.format(datetime.now().strftime('%m/%d %I:%M %p'), description, collection, str(mongodb_exception)), file=stderr)
+
+        span.finish(value if type(value) is int else count_rows(value), value, error)
 
-            print('[{0}] An exception was thrown while trying to find a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+        return value, error
 
-        self.sema.release()
+    def _attempt(self: r'mongodb', operation: str, action: Callable):
+        # retries and the circuit breaker only apply with a resilience set
+        if self.resilience is None:
+            return action()
+
+        return self.resilience.run(action, operation in IDEMPOTENT)
+
+    ###################################################################
+    #     TRANSACTION                                                 #
+    ###################################################################
+    @contextmanager
+    def transaction(self: r'mongodb'):
+        # runs the block in one ClientSession transaction holding a single
+        # scheduler slot, committed at the end or aborted if it raises or
+        # an operation failed, transactions need a replica set or sharded
+        # cluster and MongoDB has no savepoints
+        session = None
+        acquired: bool = False
+
+        try:
+            self.scheduler.acquire()
+            acquired = True
+
+        except Exception as scheduler_exception:
+            print('[{0}] An exception was thrown while trying to start a transaction using MongoDB: {1}'.format(datetime.now().strftime('%m/%d %I:%M %p'), str(scheduler_exception)), file=stderr)
+
+        try:
+            if r'' != self.connstr and acquired is True:
+                try:
+                    session = self._client().start_session()
+                    session.start_transaction()
+
+                except Exception as mongodb_exception:
+                    if session is not None:
+                        session.end_session()
+                        session = None
+
+                    print('[{0}] An exception was thrown while trying to start a transaction using MongoDB: {1}'.format(datetime.now().strftime('%m/%d %I:%M %p'), str(mongodb_exception)), file=stderr)
+
+            tx: mdbtransaction = mdbtransaction(self, session)
+
+            try:
+                yield tx
+
+            except BaseException:
+                tx._finish(False)
+
+                raise
+
+            else:
+                tx._finish(tx.failed is False)
+
+        finally:
+            if session is not None:
+                session.end_session()
+
+            if acquired is True:
+                self.scheduler.release()
+
+    ###################################################################
+    #     FIND                                                        #
+    ###################################################################
+    def find(self: r'mongodb', collection: str, criteria: dict, fields: list = None, limit: int = None, order_by=None, after: str = None, result_format: str = r'dicts') -> list:
+        # fields becomes a projection, limit and order_by the cursor's limit
+        # and sort and after is a page token from find_page
+        if result_format not in FORMATS + (r'raw',):
+            print('[{0}] The result_format \'{1}\' is not one of {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), result_format, r', '.join(FORMATS + (r'raw',))), file=stderr)
+
+            return None
+
+        query: tuple = self._query(collection, criteria, fields, order_by, after)
+
+        if query is None:
+            return None
+
+        options: tuple = (None if fields is None else tuple(fields), limit, order_spec(order_by), after)
+        started: float = perf_counter()
+        dbresult: list = self._mirrored(collection, criteria, fields, limit, order_by, after, result_format)
+
+        if dbresult is not None:
+            return dbresult
+
+        # reads after a write in a session must not join a flight which
+        # may have been sent to a replica
+        if self.singleflight is None or self._wrote() is True:
+            dbresult = self._lookup(collection, query, criteria, options, result_format)
+
+        else:
+            dbresult = self.singleflight.run(collection, criteria, options + (result_format,), lambda: self._lookup(collection, query, criteria, options, result_format))
+
+        self._advise(collection, criteria, started)
+
+        return dbresult
+
+    def _lookup(self: r'mongodb', collection: str, query: tuple, criteria: dict, options: tuple, result_format: str) -> list:
+        # only lists of dicts are cached, options[1] is the limit
+        if self.cache is None or r'dicts' != result_format:
+            return self._find(collection, query, options[1], result_format)
+
+        dbresult: list = self.cache.get(collection, criteria, options)
+
+        if dbresult is None:
+            token: tuple = self.cache.token(collection)
+            dbresult = self._find(collection, query, options[1])
+
+            self.cache.put(collection, criteria, dbresult, token, options)
 
         return dbresult
 
+    def _find(self: r'mongodb', collection: str, query: tuple, limit: int = None, result_format: str = r'dicts') -> list:
+        if r'' == self.connstr:
+            return None
+
+        return self._run(r'find', collection, lambda dbcollection: self._documents(dbcollection, query, limit, result_format), r'find a document from')[0]
+
+    def _documents(self: r'mongodb', dbcollection, query: tuple, limit: int = None, result_format: str = r'dicts', session=None) -> list:
+        if r'raw' == result_format:
+            return list(self._cursor(dbcollection.with_options(codec_options=RAW_OPTIONS), query, limit, session))
+
+        # the projection's fields, when there is one, make up the header
+        header: list = None if query[1] is None else [field for field, included in query[1].items() if 1 == included]
+
+        return shape_documents(list(self._cursor(dbcollection, query, limit, session)), header, result_format)
+
+    def _query(self: r'mongodb', collection: str, criteria: dict, fields: list, order_by, after: str) -> tuple:
+        # (filter, projection, sort) for find
+        order: tuple = order_spec(order_by)
+        values: tuple = None
+
+        if after is not None:
+            values = decode_token(after)
+
+            if values is None or len(values) != len(order) or 0 == len(order):
+                print('[{0}] The page token passed to find on the collection \'{1}\' does not match its order_by.'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection), file=stderr)
+
+                return None
+
+        return mongo_filter(mongo_criteria(criteria), order, values), mongo_projection(with_order(fields, order)), mongo_sort(order)
+
+    def _cursor(self: r'mongodb', dbcollection, query: tuple, limit: int = None, session=None):
+        # session is only passed inside a transaction
+        dbcursor = dbcollection.find(query[0], query[1]) if session is None else dbcollection.find(query[0], query[1], session=session)
+
+        if 0 < len(query[2]):
+            dbcursor = dbcursor.sort(query[2])
+
+        if limit is not None and 0 < limit:
+            dbcursor = dbcursor.limit(limit)
+
+        return dbcursor
+
     ###################################################################
-    #     INSERT                                                      #
+    #     FIND PAGE                                                   #
     ###################################################################
-    def insert(self: r'mongodb', collection: str, document: dict) -> bool:
-        result: bool = True
+    def find_page(self: r'mongodb', collection: str, criteria: dict, limit: int, order_by, fields: list = None, after: str = None) -> tuple:
+        # returns (documents, token) where token is passed as after to get
+        # the next page or is None on the last one, order_by should end with
+        # a unique field such as _id so that pages never overlap
+        order: tuple = order_spec(order_by)
+
+        if 0 == len(order) or limit is None or 0 >= limit:
+            print('[{0}] find_page on the collection \'{1}\' needs an order_by and a positive limit.'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection), file=stderr)
 
+            return None, None
+
+        return next_page(self.find(collection, criteria, fields, limit + 1, order, after), tuple(column for column, ascending in order), limit)
+
+    ###################################################################
+    #     ITER FIND                                                   #
+    ###################################################################
+    def iter_find(self: r'mongodb', collection: str, criteria: dict, batch_size: int = 1000) -> Iterator[dict]:
         if r'' == self.connstr:
-            return False
+            return None
 
-        self.sema.acquire()
+        return self._iter_find(collection, mongo_criteria(criteria), batch_size)
+
+    def _iter_find(self: r'mongodb', collection: str, criteria: dict, batch_size: int, operation: str = r'iter_find', sort: list = None, raises: bool = False) -> Iterator[dict]:
+        # the scheduler slot is only held while the generator is running and
+        # the server side cursor is killed if the caller stops early, a
+        # failure ends the documents early unless raises is True
+        span = self._span(operation, collection)
+        error: Exception = None
+        rows: int = 0
 
         try:
-            MongoClient(self.connstr)[str(self.dbname)][collection].insert_one(document)
+            with self.scheduler.slot(lane=r'batch', span=span):
+                with self._collection(collection, True).find(criteria, batch_size=batch_size if 0 < batch_size else 1000, sort=sort) as dbcursor:
+                    span.phase(r'connect')
+
+                    for document in dbcursor:
+                        rows += 1
+                        yield document
+
+                    span.phase(r'execute')
 
         except Exception as mongodb_exception:
-            result = False
+            error = mongodb_exception
 
-            print('[{0}] An exception was thrown while trying to insert a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+            print('[{0}] An exception was thrown while trying to iterate over documents from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
 
-        self.sema.release()
+            if raises is True:
+                raise
 
-        return result
+        finally:
+            span.finish(rows, None, error)
 
     ###################################################################
-    #     UPDATE                                                      #
+    #     PARALLEL FIND                                               #
     ###################################################################
-    def update(self: r'mongodb', collection: str, criteria: dict, changes: dict) -> bool:
-        result: bool = True
+    def parallel_find(self: r'mongodb', collection: str, criteria: dict, partition_key: str = r'_id', workers: int = 4, batch_size: int = 1000, ordered: bool = False) -> Iterator[dict]:
+        # splits the collection into up to workers ranges of partition_key
+        # read at once, which needs ObjectIds, numbers or dates as keys and
+        # is a single scan otherwise, documents arrive in no particular order
+        # unless ordered is True which sorts each range by partition_key and
+        # returns the ranges one by one, a range which fails raises its
+        # exception from the iterator
+        if r'' == self.connstr:
+            return None
+
+        criteria = mongo_criteria(criteria)
+        workers = max(1, min(workers, self.scheduler.max_conns))
+        bounds, error = self._run(r'find', collection, lambda dbcollection: self._bounds(dbcollection, criteria, partition_key), r'find the bounds of')
+
+        if error is not None:
+            return None
+
+        low, high = bounds
+
+        if type(low) is ObjectId and type(high) is ObjectId:
+            # ObjectIds start with their creation time in seconds
+            boundaries: list = [ObjectId.from_datetime(boundary) for boundary in split_range(low.generation_time, high.generation_time, workers)]
+            boundaries = [boundary for i, boundary in enumerate(boundaries) if low < boundary and (0 == i or boundaries[i - 1] < boundary)]
+
+        else:
+            boundaries = split_range(low, high, workers) or []
 
+        sort: list = [(partition_key, 1)] if ordered is True else None
+
+        return merge([partial(self._iter_find, collection, mongo_range(criteria, partition_key, lower, upper), batch_size, r'parallel_find', sort, True) for lower, upper in ranges(boundaries)], ordered)
+
+    def _bounds(self: r'mongodb', dbcollection, criteria: dict, partition_key: str) -> tuple:
+        # the lowest and highest non-null partition_key
+        present: dict = { partition_key: { r'$ne': None } }
+        matched: dict = present if criteria is None or 0 == len(criteria) else { r'$and': [criteria, present] }
+        bounds: list = []
+
+        for direction in (1, -1):
+            value = next(iter(dbcollection.find(matched, { partition_key: 1 }).sort(partition_key, direction).limit(1)), None)
+
+            for part in partition_key.split(r'.'):
+                value = value.get(part) if isinstance(value, dict) else None
+
+            bounds.append(value)
+
+        return tuple(bounds)
+
+    ###################################################################
+    #     MIRROR, UNMIRROR                                            #
+    ###################################################################
+    def mirror(self: r'mongodb', collection: str, key: str = r'_id', timeout: float = 30.0) -> mdbmirror:
+        # loads the collection into memory and keeps it current through a
+        # change stream, which needs a replica set, from then on find
+        # answers from memory whatever it can, key is indexed up front,
+        # returns the mirror once it is loaded or timeout passed
         if r'' == self.connstr:
+            return None
+
+        mirrored: mdbmirror = mdbmirror(self, collection, key)
+        previous: mdbmirror = self.mirrors.get(collection)
+        self.mirrors[collection] = mirrored
+
+        if previous is not None:
+            previous.close()
+
+        if mirrored.start(timeout) is False:
+            print('[{0}] The mirror of the collection \'{1}\' was not loaded within {2} seconds, find uses the database until it is.'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, timeout), file=stderr)
+
+        return mirrored
+
+    def unmirror(self: r'mongodb', collection: str) -> bool:
+        mirrored: mdbmirror = self.mirrors.pop(collection, None)
+
+        if mirrored is None:
             return False
 
-        self.sema.acquire()
+        mirrored.close()
+
+        return True
+
+    def _mirrored(self: r'mongodb', collection: str, criteria: dict, fields: list, limit: int, order_by, after: str, result_format: str) -> list:
+        # None unless a mirror can answer the find, reads after a write in
+        # a session go to the database which the mirror may not have caught
+        mirrored: mdbmirror = self.mirrors.get(collection) if 0 < len(self.mirrors) else None
+
+        if mirrored is None or order_by is not None or after is not None or r'dicts' != result_format or self._wrote() is True:
+            return None
+
+        return mirrored.find(criteria, fields, limit)
+
+    ###################################################################
+    #     EXPLAIN                                                     #
+    ###################################################################
+    def explain(self: r'mongodb', collection: str, criteria: dict) -> dict:
+        # the plan find would use summarized as scan, index, estimated_rows,
+        # actual_rows and seconds from the cursor's explain()
+        if r'' == self.connstr:
+            return None
+
+        explained: dict = self._run(r'explain', collection, lambda dbcollection: dbcollection.find(mongo_criteria(criteria)).explain(), r'explain a find on')[0]
+
+        if explained is None:
+            return None
+
+        return mongo_summary(explained)
+
+    ###################################################################
+    #     SUGGEST INDEXES, ENSURE INDEXES                             #
+    ###################################################################
+    def suggest_indexes(self: r'mongodb', min_count: int = 1, min_seconds: float = 0.0) -> list:
+        # the indexes missing for the criteria recorded by the advisor, as
+        # its candidates with the most time spent first
+        if r'' == self.connstr:
+            return None
+
+        if self.advisor is None:
+            print('[{0}] suggest_indexes and ensure_indexes need an advisor to be passed to mongodb.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+
+            return None
+
+        suggestions: list = []
+        indexes: dict = {}
+
+        for candidate in self.advisor.candidates(min_count, min_seconds):
+            collection: str = candidate[r'table']
+
+            if collection not in indexes:
+                information: dict = self._run(r'suggest_indexes', collection, lambda dbcollection: dbcollection.index_information(), r'list the indexes of')[0]
+                indexes[collection] = None if information is None else [[field for field, direction in index[r'key']] for index in information.values()]
+
+            if indexes[collection] is None or covered(candidate[r'columns'], indexes[collection]) is True:
+                continue
+
+            # later shapes needing the same index are covered by this one
+            indexes[collection].append([column for column, kind in candidate[r'columns']])
+            suggestions.append(candidate)
+
+        return suggestions
+
+    def ensure_indexes(self: r'mongodb', min_count: int = 1, min_seconds: float = 0.0) -> list:
+        # creates the suggested indexes and returns the names of the ones it
+        # created, index builds only lock the collection at their start and
+        # end on MongoDB 4.2+
+        suggestions: list = self.suggest_indexes(min_count, min_seconds)
+
+        if suggestions is None:
+            return None
+
+        created: list = []
+
+        for suggestion in suggestions:
+            keys: list = [(column, ASCENDING) for column, kind in suggestion[r'columns']]
+            name: str = self._run(r'ensure_indexes', suggestion[r'table'], lambda dbcollection: dbcollection.create_index(keys), r'create an index on')[0]
+
+            if name is not None:
+                created.append(name)
+
+        return created
+
+    ###################################################################
+    #     EXPORT TABLE, IMPORT TABLE                                  #
+    ###################################################################
+    def export_table(self: r'mongodb', collection: str, path: str, file_format: str = r'bson', criteria: dict = None, progress: Callable = None, fields: list = None, batch_size: int = 1000) -> dict:
+        # bson files are the raw documents back to back as mongodump writes
+        # them and are never decoded, jsonl holds one extended JSON document
+        # per line and csv needs fields for its header, progress(offset) is
+        # called as the file grows
+        if self._transfer_format(collection, file_format) is False:
+            return None
+
+        if r'csv' == file_format and (fields is None or 0 == len(fields)):
+            print('[{0}] Exporting the collection \'{1}\' as csv needs fields for its header.'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection), file=stderr)
+
+            return None
+
+        span = self._span(r'export_table', collection)
+        result: dict = transfer_result()
+        error: Exception = None
+        writer: progresswriter = None
 
         try:
-            MongoClient(self.connstr)[str(self.dbname)][collection].update_many(criteria, { r'$set': changes })
+            writer = progresswriter(path, progress)
+
+            if r'csv' == file_format:
+                writer.write(csv_row(list(fields)))
+
+            with self.scheduler.slot(lane=r'batch', span=span):
+                dbcollection = self._collection(collection, True)
+
+                if r'bson' == file_format:
+                    dbcollection = dbcollection.with_options(codec_options=RAW_OPTIONS)
+
+                with dbcollection.find({} if criteria is None else mongo_criteria(criteria), batch_size=batch_size if 0 < batch_size else 1000) as dbcursor:
+                    span.phase(r'connect')
+
+                    for document in dbcursor:
+                        writer.write(encode_document(document, file_format, fields))
+                        result[r'count'] += 1
+
+                    span.phase(r'execute')
 
         except Exception as mongodb_exception:
-            result = False
+            error = mongodb_exception
+            result[r'error'] = str(mongodb_exception)
 
-            print('[{0}] An exception was thrown while trying to update a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+            print('[{0}] An exception was thrown while trying to export the collection \'{1}\' to \'{2}\' using MongoDB: {3}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, path, str(mongodb_exception)), file=stderr)
 
-        self.sema.release()
+        finally:
+            if writer is not None:
+                writer.close()
+                result[r'offset'] = writer.offset
+
+        span.finish(result[r'count'], None, error)
+
+        return result
+
+    def import_table(self: r'mongodb', collection: str, path: str, file_format: str = r'bson', offset: int = 0, progress: Callable = None, batch_size: int = 1000) -> dict:
+        # inserts a memory mapped file batch_size documents at a time, bson
+        # documents are sent without being decoded and csv values are read
+        # as strings, it stops at the first batch which fails outright and
+        # passing its offset back resumes from there, documents whose _id
+        # was already loaded are skipped
+        if self._transfer_format(collection, file_format) is False:
+            return None
+
+        result: dict = transfer_result(offset=offset)
+
+        try:
+            with mapped(path) as mapped_view:
+                for batch in chunks([] if mapped_view is None else read_documents(mapped_view, offset, file_format), batch_size):
+                    written: dict = self._write_batch(r'import_table', collection, [document for document, end in batch], is_document, self._import_batch)
+
+                    result[r'count'] += written[r'count']
+                    result[r'failed'] += len(written[r'failed'])
+                    result[r'error'] = written[r'error'] or result[r'error']
+
+                    if 0 == written[r'count'] and written[r'error'] is not None:
+                        break
+
+                    result[r'offset'] = batch[-1][1]
+
+                    if progress is not None:
+                        progress(result[r'offset'])
+
+        except Exception as mongodb_exception:
+            result[r'error'] = str(mongodb_exception)
+
+            print('[{0}] An exception was thrown while trying to import \'{1}\' into the collection \'{2}\' using MongoDB: {3}'.format(datetime.now().strftime('%m/%d %I:%M %p'), path, collection, str(mongodb_exception)), file=stderr)
+
+        self._invalidate(collection)
 
         return result
 
+    def _transfer_format(self: r'mongodb', collection: str, file_format: str) -> bool:
+        if r'' == self.connstr:
+            return False
+
+        if file_format not in FILE_FORMATS:
+            print('[{0}] The format \'{1}\' for the collection \'{2}\' is not one of {3}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), file_format, collection, r', '.join(FILE_FORMATS)), file=stderr)
+
+            return False
+
+        return True
+
+    ###################################################################
+    #     INSERT                                                      #
+    ###################################################################
+    def insert(self: r'mongodb', collection: str, document: dict) -> bool:
+        if r'' == self.connstr:
+            return False
+
+        if self.writer is not None:
+            # the document is written later in a batch by the writer's thread
+            return self.writer.put(collection, document)
+
+        error: Exception = self._run(r'insert', collection, lambda dbcollection: dbcollection.insert_one(document) and 1, r'insert a document from')[1]
+        self._invalidate(collection)
+
+        return error is None
+
+    ###################################################################
+    #     UPDATE                                                      #
+    ###################################################################
+    def update(self: r'mongodb', collection: str, criteria: dict, changes: dict) -> bool:
+        if r'' == self.connstr:
+            return False
+
+        started: float = perf_counter()
+        error: Exception = self._run(r'update', collection, lambda dbcollection: dbcollection.update_many(mongo_criteria(criteria), { r'$set': changes }).matched_count, r'update a document from')[1]
+        self._invalidate(collection)
+        self._advise(collection, criteria, started)
+
+        return error is None
+
     ###################################################################
     #     DELETE                                                      #
     ###################################################################
     def delete(self: r'mongodb', collection: str, criteria: dict) -> bool:
-        result: bool = True
-
         if r'' == self.connstr:
             return False
 
-        self.sema.acquire()
+        started: float = perf_counter()
+        error: Exception = self._run(r'delete', collection, lambda dbcollection: dbcollection.delete_many(mongo_criteria(criteria)).deleted_count, r'delete a document from')[1]
+        self._invalidate(collection)
+        self._advise(collection, criteria, started)
+
+        return error is None
+
+    ###################################################################
+    #     INSERT MANY                                                 #
+    ###################################################################
+    def insert_many(self: r'mongodb', collection: str, documents: Iterable, batch_size: int = 1000) -> list:
+        if r'' == self.connstr:
+            return None
+
+        return [self._write_batch(r'insert_many', collection, batch, is_document, self._insert_batch) for batch in chunks(documents, batch_size)]
+
+    ###################################################################
+    #     UPDATE MANY ROWS                                            #
+    ###################################################################
+    def update_many_rows(self: r'mongodb', collection: str, updates: Iterable, batch_size: int = 1000) -> list:
+        if r'' == self.connstr:
+            return None
+
+        return [self._write_batch(r'update_many_rows', collection, batch, is_update, self._update_batch) for batch in chunks(updates, batch_size)]
+
+    ###################################################################
+    #     DELETE MANY                                                 #
+    ###################################################################
+    def delete_many(self: r'mongodb', collection: str, criteria_list: Iterable, batch_size: int = 1000) -> list:
+        if r'' == self.connstr:
+            return None
+
+        return [self._write_batch(r'delete_many', collection, batch, is_document, self._delete_batch) for batch in chunks(criteria_list, batch_size)]
+
+    ###################################################################
+    #     UPSERT MANY                                                 #
+    ###################################################################
+    def upsert_many(self: r'mongodb', collection: str, documents: Iterable, key_columns, batch_size: int = 1000) -> list:
+        # a unique index on key_columns keeps concurrent upserts from
+        # inserting the same key twice, documents missing any of them are
+        # reported as failed
+        if r'' == self.connstr:
+            return None
+
+        keys: tuple = (key_columns,) if type(key_columns) is str else tuple(key_columns)
+
+        if 0 == len(keys):
+            print('[{0}] upsert_many on the collection \'{1}\' needs at least one key field.'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection), file=stderr)
+
+            return None
+
+        writer: Callable = lambda dbcollection, documents: self._upsert_batch(dbcollection, documents, keys)
+
+        return [upsert_result(self._write_batch(r'upsert_many', collection, latest(batch, keys), has_keys(keys), writer)) for batch in chunks(documents, batch_size)]
+
+    ###################################################################
+    #     BATCHES                                                     #
+    ###################################################################
+    def _write_batch(self: r'mongodb', operation: str, collection: str, batch: list, is_valid: Callable, writer: Callable) -> dict:
+        valid: list = []
+        invalid: list = []
+
+        for item in batch:
+            if is_valid(item) is True:
+                valid.append(item)
+
+            else:
+                invalid.append(item)
+
+        result: dict = batch_result(failed=invalid, error=None if 0 == len(invalid) else r'Skipped empty or malformed items')
+
+        if 0 == len(valid):
+            return result
+
+        span = self._span(operation, collection)
+        error: Exception = None
+
+        def attempt():
+            with self.scheduler.slot(lane=r'batch', span=span):
+                dbcollection = self._collection(collection)
+                span.phase(r'connect')
+
+                counts = writer(dbcollection, valid)
+                span.phase(r'execute')
+
+                return counts
 
         try:
-            MongoClient(self.connstr)[str(self.dbname)][collection].delete_many(criteria)
+            counts = self._attempt(operation, attempt)
+            result.update(counts if type(counts) is dict else { r'count': counts })
+
+        except BulkWriteError as bulk_exception:
+            # unordered bulk writes keep going past individual failures
+            details: dict = bulk_exception.details
+            write_errors: list = details.get(r'writeErrors', [])
+
+            counts: dict = { name: details.get(field, 0) for name, field in BULK_COUNTS[operation].items() }
+            result.update(counts, count=sum(counts.values()))
+            result[r'failed'] += [valid[write_error[r'index']] for write_error in write_errors]
+            result[r'error'] = write_errors[0].get(r'errmsg') if 0 < len(write_errors) else str(bulk_exception)
+            error = bulk_exception
+
+            print('[{0}] {1} documents failed in {2} on the collection \'{3}\' using MongoDB: {4}'.format(datetime.now().strftime('%m/%d %I:%M %p'), len(write_errors), operation, collection, result[r'error']), file=stderr)
 
         except Exception as mongodb_exception:
-            result = False
+            result = batch_result(failed=batch, error=str(mongodb_exception))
+            error = mongodb_exception
 
-            print('[{0}] An exception was thrown while trying to delete a document from the collection \'{1}\' using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), collection, str(mongodb_exception)), file=stderr)
+            print('[{0}] An exception was thrown while trying to run {1} with {2} documents on the collection \'{3}\' using MongoDB: {4}'.format(datetime.now().strftime('%m/%d %I:%M %p'), operation, len(batch), collection, str(mongodb_exception)), file=stderr)
 
-        self.sema.release()
+        span.finish(result[r'count'], None, error)
+        self._invalidate(collection)
 
         return result
+
+    def _insert_batch(self: r'mongodb', dbcollection, documents: list) -> int:
+        return len(dbcollection.insert_many(documents, ordered=False).inserted_ids)
+
+    def _import_batch(self: r'mongodb', dbcollection, documents: list) -> int:
+        # documents left behind by an interrupted import are not failures
+        try:
+            return self._insert_batch(dbcollection, documents)
+
+        except BulkWriteError as bulk_exception:
+            if all(DUPLICATE_KEY == write_error.get(r'code') for write_error in bulk_exception.details.get(r'writeErrors', [])):
+                return bulk_exception.details.get(r'nInserted', 0)
+
+            raise
+
+    def _upsert_batch(self: r'mongodb', dbcollection, documents: list, keys: tuple) -> dict:
+        requests: list = []
+
+        for document in documents:
+            changes: dict = { field: value for field, value in document.items() if field not in keys }
+            requests.append(UpdateOne({ key: document[key] for key in keys }, { r'$set': changes } if 0 < len(changes) else { r'$setOnInsert': { key: document[key] for key in keys } }, upsert=True))
+
+        bulk = dbcollection.bulk_write(requests, ordered=False)
+
+        return { r'count': bulk.upserted_count + bulk.matched_count, r'inserted': bulk.upserted_count, r'updated': bulk.matched_count }
+
+    def _update_batch(self: r'mongodb', dbcollection, updates: list) -> int:
+        return dbcollection.bulk_write([UpdateMany({} if criteria is None else mongo_criteria(criteria), { r'$set': changes }) for criteria, changes in updates], ordered=False).matched_count
+
+    def _delete_batch(self: r'mongodb', dbcollection, criteria_list: list) -> int:
+        return dbcollection.bulk_write([DeleteMany(mongo_criteria(criteria)) for criteria in criteria_list], ordered=False).deleted_count
@@ -0,0 +1,200 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from base64 import b64decode, b64encode, urlsafe_b64decode, urlsafe_b64encode
+from bson import ObjectId
+from collections.abc import Mapping
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+import json
+
+#######################################################################
+#                                                                     #
+#         ORDER SPEC                                                  #
+#                                                                     #
+#######################################################################
+def order_spec(order_by) -> tuple:
+    # accepts 'age', '-age', ('age', 1), ('age', -1), ('age', 'desc') or a
+    # list of them and returns ((name, ascending), ...)
+    if order_by is None:
+        return ()
+
+    if type(order_by) is str or _is_pair(order_by) is True:
+        order_by = [order_by]
+
+    order: list = []
+
+    for item in order_by:
+        if type(item) is str:
+            order.append((item[1:], False) if item.startswith(r'-') else (item, True))
+
+        else:
+            name, direction = item
+            order.append((name, not (direction in (-1, False) or str(direction).lower() == r'desc')))
+
+    return tuple(order)
+
+def with_order(fields, order: tuple) -> tuple:
+    # the order_by columns are always selected so that a page token can
+    # be built from the last row
+    if fields is None:
+        return None
+
+    fields = tuple(fields)
+
+    return fields + tuple(name for name, ascending in order if name not in fields)
+
+#######################################################################
+#                                                                     #
+#         PAGE TOKENS                                                 #
+#                                                                     #
+#######################################################################
+def encode_token(values: tuple) -> str:
+    return urlsafe_b64encode(json.dumps([_pack(value) for value in values], separators=(r',', r':')).encode()).decode().rstrip(r'=')
+
+def decode_token(token: str) -> tuple:
+    # returns None for anything that is not a token made by encode_token
+    try:
+        items: list = json.loads(urlsafe_b64decode(str(token) + r'=' * (-len(str(token)) % 4)).decode())
+
+        return tuple(_unpack(item) for item in items)
+
+    except Exception:
+        return None
+
+def next_page(rows: list, names: tuple, limit: int) -> tuple:
+    # rows were fetched with a limit of limit + 1, an extra row means that
+    # there is another page which starts after the last row kept
+    if rows is None:
+        return None, None
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+
+    return rows, encode_token(tuple(_lookup(rows[-1], name) for name in names))
+
+#######################################################################
+#                                                                     #
+#         MONGODB                                                     #
+#                                                                     #
+#######################################################################
+def mongo_filter(criteria: dict, order: tuple, values: tuple) -> dict:
+    criteria = {} if criteria is None else criteria
+
+    if values is None:
+        return criteria
+
+    clauses: list = []
+
+    for i, (name, ascending) in enumerate(order):
+        clause: dict = { previous: value for (previous, direction), value in zip(order[:i], values[:i]) }
+        clause[name] = { r'$gt' if ascending is True else r'$lt': values[i] }
+        clauses.append(clause)
+
+    keyset: dict = clauses[0] if 1 == len(clauses) else { r'$or': clauses }
+
+    return keyset if 0 == len(criteria) else { r'$and': [criteria, keyset] }
+
+def mongo_projection(fields: tuple) -> dict:
+    if fields is None:
+        return None
+
+    projection: dict = { field: 1 for field in fields }
+
+    if r'_id' not in projection:
+        projection[r'_id'] = 0
+
+    return projection
+
+def mongo_sort(order: tuple) -> list:
+    return [(name, 1 if ascending is True else -1) for name, ascending in order]
+
+#######################################################################
+#                                                                     #
+#         PRIVATE                                                     #
+#                                                                     #
+#######################################################################
+def _is_pair(item) -> bool:
+    # ('age', 'name') names two columns while ('age', -1) is one column
+    return type(item) in (tuple, list) and 2 == len(item) and type(item[0]) is str and (type(item[1]) is not str or item[1].lower() in (r'asc', r'desc'))
+
+def _lookup(row, name: str):
+    if isinstance(row, Mapping) and name in row:
+        return row[name]
+
+    # dotted MongoDB paths into embedded documents
+    value = row
+
+    for part in name.split(r'.'):
+        value = value[part]
+
+    return value
+
+def _pack(value) -> list:
+    # tagged so that values come back as the same type and with the same
+    # precision, which keyset comparisons depend on
+    if isinstance(value, datetime):
+        return [r'datetime', value.isoformat()]
+
+    if isinstance(value, date):
+        return [r'date', value.isoformat()]
+
+    if isinstance(value, time):
+        return [r'time', value.isoformat()]
+
+    if isinstance(value, Decimal):
+        return [r'decimal', str(value)]
+
+    if isinstance(value, UUID):
+        return [r'uuid', str(value)]
+
+    if isinstance(value, ObjectId):
+        return [r'objectid', str(value)]
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return [r'bytes', b64encode(bytes(value)).decode()]
+
+    return [r'json', value]
+
+def _unpack(item: list):
+    tag, value = item
+
+    if r'datetime' == tag:
+        return datetime.fromisoformat(value)
+
+    if r'date' == tag:
+        return date.fromisoformat(value)
+
+    if r'time' == tag:
+        return time.fromisoformat(value)
+
+    if r'decimal' == tag:
+        return Decimal(value)
+
+    if r'uuid' == tag:
+        return UUID(value)
+
+    if r'objectid' == tag:
+        return ObjectId(value)
+
+    if r'bytes' == tag:
+        return b64decode(value)
+
+    if r'json' == tag:
+        return value
+
+    raise ValueError(tag)
@@ -0,0 +1,181 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import date, datetime
+from decimal import Decimal
+from queue import Empty, Full, Queue
+from threading import Event
+from typing import Callable, Iterator
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# key types whose range can be cut into evenly spaced pieces
+SPLITTABLE: tuple = (int, float, Decimal, datetime, date)
+
+# rows waiting to be read across every partition of an unordered scan
+QUEUE_SIZE: int = 10000
+
+# marks the end of a partition in the queues, as (DONE, exception) when
+# the partition failed
+DONE: object = object()
+
+#######################################################################
+#                                                                     #
+#         SPLIT RANGE, RANGES                                         #
+#                                                                     #
+#######################################################################
+def split_range(low, high, count: int) -> list:
+    # up to count - 1 evenly spaced boundaries above low and no higher than
+    # high, [] when there is nothing to split and None for keys which can
+    # not be split such as text
+    if low is None or high is None:
+        return []
+
+    if type(low) in (int, float) and type(high) in (int, float) and float in (type(low), type(high)):
+        low, high = float(low), float(high)
+
+    if type(low) is not type(high) or type(low) not in SPLITTABLE:
+        return None
+
+    boundaries: list = []
+
+    try:
+        for i in range(1, count):
+            step = (high - low) * i
+            boundary = low + (step // count if type(low) is int else step / count)
+
+            if low < boundary <= high and (0 == len(boundaries) or boundaries[-1] < boundary):
+                boundaries.append(boundary)
+
+    except (TypeError, ArithmeticError):
+        # such as naive and aware datetimes
+        return None
+
+    return boundaries
+
+def ranges(boundaries: list) -> list:
+    # [(None, b1), (b1, b2), ..., (bn, None)], the open ends take in keys
+    # written after the bounds were read
+    edges: list = [None] + list(boundaries) + [None]
+
+    return [(edges[i], edges[i + 1]) for i in range(len(edges) - 1)]
+
+#######################################################################
+#                                                                     #
+#         MONGO RANGE                                                 #
+#                                                                     #
+#######################################################################
+def mongo_range(criteria: dict, field: str, lower, upper) -> dict:
+    # the first range also takes in missing, null and differently typed
+    # values, which $gte never matches because of type bracketing
+    criteria = {} if criteria is None else criteria
+
+    if lower is None and upper is None:
+        return criteria
+
+    if lower is None:
+        bounds: dict = { field: { r'$not': { r'$gte': upper } } }
+
+    elif upper is None:
+        bounds = { field: { r'$gte': lower } }
+
+    else:
+        bounds = { field: { r'$gte': lower, r'$lt': upper } }
+
+    return bounds if 0 == len(criteria) else { r'$and': [criteria, bounds] }
+
+#######################################################################
+#                                                                     #
+#         MERGE                                                       #
+#                                                                     #
+#######################################################################
+def merge(partitions: list, ordered: bool = False) -> Iterator:
+    # runs every partition, a callable returning an iterator, on its own
+    # thread and yields their rows as they arrive, or partition by partition
+    # when ordered while the later ones are read ahead into memory, the
+    # threads stop and close their iterators when the caller stops early or
+    # a partition fails, whose exception is then raised to the caller
+    stop: Event = Event()
+    queues: list = [Queue(QUEUE_SIZE)] * len(partitions) if ordered is False else [Queue() for partition in partitions]
+
+    def produce(partition: Callable, queue: Queue) -> None:
+        rows = None
+        end = DONE
+
+        try:
+            rows = partition()
+
+            for row in [] if rows is None else rows:
+                while stop.is_set() is False:
+                    try:
+                        queue.put(row, timeout=0.1)
+                        break
+
+                    except Full:
+                        continue
+
+                if stop.is_set() is True:
+                    return
+
+        except Exception as partition_exception:
+            end = (DONE, partition_exception)
+
+        finally:
+            if hasattr(rows, r'close') is True:
+                rows.close()
+
+            queue.put(end)
+
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max(1, len(partitions)), thread_name_prefix=r'mdbpg_partition')
+
+    try:
+        # each thread gets a copy of the caller's context so that using()
+        # and session() apply to the partitions
+        for partition, queue in zip(partitions, queues):
+            executor.submit(copy_context().run, produce, partition, queue)
+
+        remaining: int = len(partitions)
+        current: int = 0
+
+        while 0 < remaining:
+            row = queues[current].get()
+
+            if type(row) is tuple and 2 == len(row) and row[0] is DONE:
+                raise row[1]
+
+            if row is DONE:
+                remaining -= 1
+                current += 1 if ordered is True else 0
+
+                continue
+
+            yield row
+
+    finally:
+        stop.set()
+
+        # unblock producers waiting on a full queue
+        for queue in set(queues):
+            try:
+                while True:
+                    queue.get_nowait()
+
+            except Empty:
+                pass
+
+        executor.shutdown(wait=True)
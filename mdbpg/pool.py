@@ -0,0 +1,334 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from collections import deque
+from contextlib import contextmanager
+from mdbpg.metrics import NULLSPAN
+from mdbpg.scheduler import scheduler
+from threading import Condition
+from time import monotonic
+from typing import Callable
+
+import os
+import psycopg2
+import psycopg2.extensions
+
+#######################################################################
+#                                                                     #
+#         EXCEPTIONS                                                  #
+#                                                                     #
+#######################################################################
+class poolclosed(Exception):
+    pass
+
+#######################################################################
+#                                                                     #
+#         PGPOOL                                                      #
+#                                                                     #
+#######################################################################
+class pgpool():
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'pgpool', connect: Callable, max_conns: int = 10, max_lifetime: float = 3600.0, max_idle: float = 300.0, check_interval: float = 30.0, scheduler: scheduler = None) -> None:
+        self.connect: Callable = connect
+        self.scheduler: scheduler = scheduler       # a slot is held from checkout to checkin
+        self.max_conns: int = max_conns if 0 < max_conns else 10
+        self.max_lifetime: float = max_lifetime
+        self.max_idle: float = max_idle
+        self.check_interval: float = check_interval
+
+        self.cond: Condition = Condition()
+        self.idle: deque = deque()      # [conn, last_used], most recently used on the right
+        self.created: dict = {}         # conn -> creation time, for every conn this process owns
+        self.statements: dict = {}      # conn -> names of the statements prepared on it
+        self.orphans: list = []         # conns inherited across a fork, kept alive but never used
+        self.pending: int = 0           # conns being opened outside of the lock
+        self.pid: int = os.getpid()
+        self.closed: bool = False
+
+    ###################################################################
+    #     CONTEXT MANAGER                                             #
+    ###################################################################
+    def __enter__(self: r'pgpool') -> r'pgpool':
+        return self
+
+    def __exit__(self: r'pgpool', exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    ###################################################################
+    #     SIZE                                                        #
+    ###################################################################
+    def size(self: r'pgpool') -> int:
+        with self.cond:
+            return len(self.created) + self.pending
+
+    def idle_size(self: r'pgpool') -> int:
+        with self.cond:
+            return len(self.idle)
+
+    def owns(self: r'pgpool', dbconn) -> bool:
+        with self.cond:
+            return dbconn in self.created
+
+    ###################################################################
+    #     CONNECTION                                                  #
+    ###################################################################
+    @contextmanager
+    def connection(self: r'pgpool', timeout: float = None, span=NULLSPAN, lane: str = r'interactive'):
+        dbconn = self.checkout(timeout, span, lane)
+        discard: bool = False
+
+        try:
+            yield dbconn
+
+        except BaseException:
+            discard = self.is_broken(dbconn)
+            raise
+
+        finally:
+            self.checkin(dbconn, discard)
+
+    ###################################################################
+    #     CHECKOUT                                                    #
+    ###################################################################
+    def checkout(self: r'pgpool', timeout: float = None, span=NULLSPAN, lane: str = r'interactive'):
+        # one deadline covers waiting for a scheduler slot and then for a
+        # connection, since a shared scheduler can have more slots than
+        # this pool has connections
+        if self.scheduler is not None:
+            lane, timeout = self.scheduler.resolve(lane, timeout)
+
+        deadline: float = None if timeout is None else monotonic() + timeout
+
+        if self.scheduler is None:
+            return self._checkout(deadline, span)
+
+        self.scheduler.acquire(lane, timeout, span)
+
+        try:
+            return self._checkout(deadline, span)
+
+        except BaseException:
+            self.scheduler.release()
+            raise
+
+    def _checkout(self: r'pgpool', deadline: float, span):
+        while True:
+            candidate: list = None
+
+            with self.cond:
+                self._detect_fork()
+
+                while True:
+                    if self.closed is True:
+                        raise poolclosed(r'The connection pool has been closed')
+
+                    self._prune()
+
+                    if 0 < len(self.idle):
+                        candidate = self.idle.pop()
+                        break
+
+                    if len(self.created) + self.pending < self.max_conns:
+                        # reserve the slot so connecting can happen outside of the lock
+                        self.pending += 1
+                        break
+
+                    remaining: float = None if deadline is None else deadline - monotonic()
+
+                    if remaining is not None and 0 >= remaining:
+                        raise TimeoutError(r'Timed out waiting for a pooled Postgres connection')
+
+                    self.cond.wait(remaining)
+
+            span.phase(r'queue')
+
+            if candidate is None:
+                dbconn = self._open()
+                span.phase(r'connect')
+
+                return dbconn
+
+            if self._is_healthy(candidate[0], candidate[1]) is True:
+                span.phase(r'connect')
+
+                return candidate[0]
+
+            self._discard(candidate[0])
+
+    ###################################################################
+    #     CHECKIN                                                     #
+    ###################################################################
+    def checkin(self: r'pgpool', dbconn, discard: bool = False) -> None:
+        if dbconn is None:
+            return
+
+        try:
+            self._checkin(dbconn, discard)
+
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release()
+
+    def _checkin(self: r'pgpool', dbconn, discard: bool) -> None:
+        with self.cond:
+            owned: bool = dbconn in self.created and os.getpid() == self.pid
+
+        if owned is False:
+            return
+
+        if discard is False and self.closed is False:
+            discard = self._reset(dbconn) is False
+
+        if discard is True or self.closed is True or self._is_expired(dbconn, monotonic()) is True:
+            self._discard(dbconn)
+            return
+
+        with self.cond:
+            self.idle.append([dbconn, monotonic()])
+            self.cond.notify()
+
+    ###################################################################
+    #     CLOSE                                                       #
+    ###################################################################
+    def close(self: r'pgpool') -> None:
+        with self.cond:
+            self.closed = True
+            idle: list = [entry[0] for entry in self.idle]
+            self.idle.clear()
+            self.cond.notify_all()
+
+        for dbconn in idle:
+            self._discard(dbconn)
+
+    ###################################################################
+    #     PREPARED                                                    #
+    ###################################################################
+    def prepared(self: r'pgpool', dbconn) -> set:
+        with self.cond:
+            return self.statements.setdefault(dbconn, set())
+
+    ###################################################################
+    #     IS BROKEN                                                   #
+    ###################################################################
+    def is_broken(self: r'pgpool', dbconn) -> bool:
+        try:
+            return 0 != dbconn.closed or psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN == dbconn.get_transaction_status()
+
+        except Exception:
+            return True
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _open(self: r'pgpool'):
+        try:
+            dbconn = self.connect()
+
+        except BaseException:
+            with self.cond:
+                self.pending -= 1
+                self.cond.notify()
+
+            raise
+
+        with self.cond:
+            self.pending -= 1
+
+            if os.getpid() == self.pid:
+                self.created[dbconn] = monotonic()
+
+        return dbconn
+
+    def _discard(self: r'pgpool', dbconn) -> None:
+        with self.cond:
+            owned: bool = self.created.pop(dbconn, None) is not None
+            self.statements.pop(dbconn, None)
+            self.cond.notify()
+
+        if owned is True:
+            try:
+                dbconn.close()
+
+            except Exception:
+                pass
+
+    def _detect_fork(self: r'pgpool') -> None:
+        # a forked child must never speak on its parent's sockets, and closing
+        # them would send a terminate message on the parent's behalf as well
+        if os.getpid() == self.pid:
+            return
+
+        self.orphans.extend(self.created.keys())
+        self.created = {}
+        self.statements = {}
+        self.idle.clear()
+        self.pending = 0
+        self.pid = os.getpid()
+
+    def _prune(self: r'pgpool') -> None:
+        now: float = monotonic()
+
+        while 0 < len(self.idle) and self._is_expired(self.idle[0][0], now, self.idle[0][1]) is True:
+            dbconn = self.idle.popleft()[0]
+            self.created.pop(dbconn, None)
+            self.statements.pop(dbconn, None)
+
+            try:
+                dbconn.close()
+
+            except Exception:
+                pass
+
+    def _is_expired(self: r'pgpool', dbconn, now: float, last_used: float = None) -> bool:
+        created: float = self.created.get(dbconn, now)
+
+        if 0 < self.max_lifetime and self.max_lifetime <= now - created:
+            return True
+
+        if last_used is not None and 0 < self.max_idle and self.max_idle <= now - last_used:
+            return True
+
+        return False
+
+    def _is_healthy(self: r'pgpool', dbconn, last_used: float) -> bool:
+        if self.is_broken(dbconn) is True:
+            return False
+
+        if self.check_interval > monotonic() - last_used:
+            return True
+
+        try:
+            with dbconn.cursor() as dbcursor:
+                dbcursor.execute(r'SELECT 1')
+
+            dbconn.rollback()
+
+        except Exception:
+            return False
+
+        return True
+
+    def _reset(self: r'pgpool', dbconn) -> bool:
+        if self.is_broken(dbconn) is True:
+            return False
+
+        try:
+            if psycopg2.extensions.TRANSACTION_STATUS_IDLE != dbconn.get_transaction_status():
+                dbconn.rollback()
+
+        except Exception:
+            return False
+
+        return True
@@ -11,13 +11,34 @@
 #         IMPORTS                                                     #
 #                                                                     #
 #######################################################################
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from functools import partial
+from mdbpg.advisor import advisor, covered, pg_summary
+from mdbpg.bulk import batch_result, chunks, has_keys, is_criteria, is_criteria_update, is_row, latest, upsert_result
+from mdbpg.cache import resultcache
+from mdbpg.config import load_config
+from mdbpg.criteria import criteria_error, criteria_terms
+from mdbpg.metrics import NULLSPAN, metrics
+from mdbpg.mirror import pgmirror
+from mdbpg.paging import decode_token, next_page, order_spec, with_order
+from mdbpg.partitions import merge, ranges, split_range
+from mdbpg.pool import pgpool
+from mdbpg.replicas import replica, replicaset, split_hosts
+from mdbpg.resilience import IDEMPOTENT, resilience
+from mdbpg.results import BATCH_SIZE, FORMATS, count_rows, shape_rows
+from mdbpg.scheduler import scheduler, scheduler_for
+from mdbpg.singleflight import singleflight
+from mdbpg.statements import sqlcompiler, statement
+from mdbpg.transaction import pgtransaction
+from mdbpg.transfer import BUFFER_SIZE, CHUNK_SIZE, COPY_FORMATS, csv_header, mapped, mappedreader, progresswriter, record_end, transfer_result
+from mdbpg.writer import bufferedwriter
 from sys import stderr
-from threading import Semaphore
-from typing import Type
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, Type
+from uuid import uuid4
 
-import mtoml
-import os
 import psycopg2
 import psycopg2.extras
 
@@ -30,28 +51,45 @@ class postgres():
     ###################################################################
     #     CONSTRUCTOR, INSTANCE VARIABLES                             #
     ###################################################################
-    def __init__(self: r'postgres', max_conns: int = 10, use_env_vars: bool = True):
-        if 0 >= max_conns:
-            self.sema = Semaphore(10)
-        
-        else:
-            self.sema = Semaphore(max_conns)
+    def __init__(self: r'postgres', max_conns: int = 10, use_env_vars: bool = True, max_lifetime: float = 3600.0, max_idle: float = 300.0, statement_cache_size: int = 256, prepare_statements: bool = False, cache: resultcache = None, metrics: metrics = None, writer: bufferedwriter = None, scheduler: scheduler = None, resilience: resilience = None, singleflight: singleflight = None, replicas: list = None, max_replica_lag: float = None, replica_check_interval: float = 30.0, advisor: advisor = None, connect_timeout: int = 10):
+        self.cache: resultcache = cache
+        self.singleflight: singleflight = singleflight
+        self.advisor: advisor = advisor
+        self.mirrors: dict = {}             # table key -> pgmirror
+        self.metrics: metrics = metrics
+        self.writer: bufferedwriter = writer
+        self.resilience: resilience = resilience
+        self.connect_timeout: int = connect_timeout     # seconds, 0 waits forever
 
-        if use_env_vars is True:
-            self.username: str = os.getenv(r'POSTGRES_USERNAME')
-            self.password: str = os.getenv(r'POSTGRES_PASSWORD')
-            self.hostname: str = os.getenv(r'POSTGRES_HOSTNAME')
-            self.dbname: str = os.getenv(r'POSTGRES_DBNAME')
+        if writer is not None:
+            writer.attach(self.insert_many)
 
-        else:
-            if mtoml.is_loaded(config = r'database') is False:
-                if mtoml.load(config = r'database') is False:
-                    print('[{0}] Failed to load the \'database\' configuration.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+        self.compiler: sqlcompiler = sqlcompiler(cache_size=statement_cache_size)
+        self.prepare_statements: bool = prepare_statements
+
+        # set by session() to send reads to the primary after a write
+        self.session_state: ContextVar = ContextVar(r'mdbpg_session', default=None)
+
+        config: dict = load_config(r'postgres', (r'username', r'password', r'hostname', r'dbname', r'replicas', r'max_replica_lag'), use_env_vars=use_env_vars)
+
+        self.username: str = config[r'username']
+        self.password: str = config[r'password']
+        self.hostname: str = config[r'hostname']
+        self.dbname: str = config[r'dbname']
+
+        # constructor arguments take precedence over the configuration, the
+        # scheduler's default limit covers max_conns on every host
+        hosts: list = split_hosts(config[r'replicas'] if replicas is None else replicas)
+        max_lag = config[r'max_replica_lag'] if max_replica_lag is None else max_replica_lag
+        conns: int = max_conns if 0 < max_conns else 10
 
-            self.username: str = mtoml.get(config = r'database', group = r'postgres', field = r'username')
-            self.password: str = mtoml.get(config = r'database', group = r'postgres', field = r'password')
-            self.hostname: str = mtoml.get(config = r'database', group = r'postgres', field = r'hostname')
-            self.dbname: str = mtoml.get(config = r'database', group = r'postgres', field = r'dbname')
+        self.scheduler: scheduler = scheduler_for(scheduler, conns * (1 + len(hosts)))
+        self.pool: pgpool = pgpool(self._connect, max_conns=conns, max_lifetime=max_lifetime, max_idle=max_idle, scheduler=self.scheduler)
+        self.replicas: replicaset = None
+
+        if 0 < len(hosts):
+            self.replicas = replicaset([replica(host, pgpool(partial(self._connect, host), max_conns=conns, max_lifetime=max_lifetime, max_idle=max_idle, scheduler=self.scheduler)) for host in hosts],
+                                       None if max_lag is None or r'' == max_lag else float(max_lag), replica_check_interval)
 
         if self.username is None or self.password is None or self.hostname is None or self.dbname is None:
             self.loaded = False
@@ -61,173 +99,957 @@ class postgres():
         else:
             self.loaded = True
 
+    ###################################################################
+    #     CONTEXT MANAGER                                             #
+    ###################################################################
+    def __enter__(self: r'postgres') -> r'postgres':
+        return self
+
+    def __exit__(self: r'postgres', exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    ###################################################################
+    #     CLOSE                                                       #
+    ###################################################################
+    def close(self: r'postgres') -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+        for mirrored in list(self.mirrors.values()):
+            mirrored.close()
+
+        self.pool.close()
+
+        if self.replicas is not None:
+            self.replicas.close()
+
+    ###################################################################
+    #     FLUSH                                                       #
+    ###################################################################
+    def flush(self: r'postgres') -> bool:
+        if self.writer is None:
+            return True
+
+        return self.writer.flush()
+
+    ###################################################################
+    #     CONNECT                                                     #
+    ###################################################################
+    def _connect(self: r'postgres', hostname: str = None) -> Type[psycopg2.extensions.connection]:
+        return psycopg2.connect(host=str(self.hostname if hostname is None else hostname), database=str(self.dbname), user=str(self.username), password=str(self.password), connect_timeout=int(self.connect_timeout))
+
+    ###################################################################
+    #     SESSION                                                     #
+    ###################################################################
+    @contextmanager
+    def session(self: r'postgres'):
+        # reads in the block go to replicas until the block writes, after
+        # which they go to the primary so that they see the write
+        token = self.session_state.set({ r'wrote': False })
+
+        try:
+            yield self
+
+        finally:
+            self.session_state.reset(token)
+
+    def _wrote(self: r'postgres') -> bool:
+        state: dict = self.session_state.get()
+
+        return state is not None and state[r'wrote'] is True
+
+    def _read_connection(self: r'postgres', span, lane: str = r'interactive', to_replica: bool = True):
+        # a pooled connection to a replica, or to the primary when there
+        # are none, none can serve the read, the session has written or
+        # to_replica is False
+        chosen: replica = None
+
+        if to_replica is True and self.replicas is not None and self._wrote() is False:
+            chosen = self.replicas.choose()
+
+        if chosen is not None:
+            try:
+                return chosen.pool, chosen.pool.checkout(None, span, lane)
+
+            except psycopg2.Error as replica_exception:
+                # the read falls back to the primary, timeouts waiting for a
+                # slot or connection are not the replica's fault
+                self.replicas.failed(chosen, replica_exception)
+
+        return self.pool, self.pool.checkout(None, span, lane)
+
+    @contextmanager
+    def _reading(self: r'postgres', span, lane: str = r'interactive', to_replica: bool = True):
+        pool, dbconn = self._read_connection(span, lane, to_replica)
+        discard: bool = False
+
+        try:
+            yield dbconn
+
+        except BaseException:
+            discard = pool.is_broken(dbconn)
+            raise
+
+        finally:
+            pool.checkin(dbconn, discard)
+
+    ###################################################################
+    #     METRICS                                                     #
+    ###################################################################
+    def _span(self: r'postgres', operation: str, table: str = None):
+        if self.metrics is None:
+            return NULLSPAN
+
+        return self.metrics.span(operation, table)
+
+    ###################################################################
+    #     RESILIENCE                                                  #
+    ###################################################################
+    def _attempt(self: r'postgres', operation: str, action: Callable):
+        # retries and the circuit breaker only apply with a resilience set
+        if self.resilience is None:
+            return action()
+
+        return self.resilience.run(action, operation in IDEMPOTENT)
+
+    ###################################################################
+    #     CRITERIA                                                    #
+    ###################################################################
+    def _valid_criteria(self: r'postgres', table: str, criteria: dict) -> bool:
+        error: str = criteria_error(criteria)
+
+        if error is not None:
+            print('[{0}] The criteria for the Postgres table \'{1}\' are invalid: {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table, error), file=stderr)
+
+            return False
+
+        return True
+
+    ###################################################################
+    #     ADVISOR                                                     #
+    ###################################################################
+    def _advise(self: r'postgres', table: str, criteria: dict, started: float) -> None:
+        if self.advisor is not None:
+            self.advisor.record(table, criteria, perf_counter() - started)
+
+    ###################################################################
+    #     CACHE                                                       #
+    ###################################################################
+    def _table_key(self: r'postgres', table: str) -> str:
+        return r'.'.join(self.compiler.fold(table))
+
+    def _invalidate(self: r'postgres', table: str) -> None:
+        # every write ends up here, including the ones which failed
+        state: dict = self.session_state.get()
+
+        if state is not None:
+            state[r'wrote'] = True
+
+        if self.cache is not None:
+            self.cache.invalidate(None if table is None else self._table_key(table))
+
+        if self.singleflight is not None:
+            self.singleflight.forget(None if table is None else self._table_key(table))
+
+        for key, mirrored in list(self.mirrors.items()):
+            if table is None or self._table_key(table) == key:
+                mirrored.behind()
+
+    ###################################################################
+    #     EXECUTE                                                     #
+    ###################################################################
+    def _execute(self: r'postgres', dbcursor: Type[psycopg2.extensions.cursor], sql_query, params: tuple = None) -> None:
+        if type(sql_query) is not statement:
+            dbcursor.execute(sql_query, params)
+
+        elif self.prepare_statements is False:
+            dbcursor.execute(sql_query.query, params)
+
+        else:
+            # prepared statements outlive transactions, so each pooled
+            # connection only has to prepare a given statement once
+            pool: pgpool = None if self.replicas is None else self.replicas.owner(dbcursor.connection)
+            prepared: set = (self.pool if pool is None else pool).prepared(dbcursor.connection)
+
+            if sql_query.name not in prepared:
+                dbcursor.execute(sql_query.prepare)
+                prepared.add(sql_query.name)
+
+            dbcursor.execute(sql_query.execute, params)
+
+    ###################################################################
+    #     TRANSACTION                                                 #
+    ###################################################################
+    @contextmanager
+    def transaction(self: r'postgres', timeout: float = None):
+        # pins one pooled connection for the whole block which is committed
+        # at the end, or rolled back if it raises or an operation failed
+        dbconn = None
+
+        if self.loaded is True:
+            try:
+                dbconn = self.pool.checkout(timeout)
+
+            except Exception as sql_exception:
+                print('[{0}] An exception was thrown while trying to start a transaction on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.dbname, str(sql_exception)), file=stderr)
+
+        tx: pgtransaction = pgtransaction(self, dbconn)
+        healthy: bool = True
+
+        try:
+            yield tx
+
+        except BaseException:
+            healthy = tx._finish(False)
+
+            raise
+
+        else:
+            healthy = tx._finish(tx.failed is False)
+
+        finally:
+            if dbconn is not None:
+                self.pool.checkin(dbconn, discard=healthy is False)
+
     ###################################################################
     #     FETCH                                                       #
     ###################################################################
-    def fetch(self: r'postgres', sql_query: str) -> list:
+    def fetch(self: r'postgres', sql_query: str, params: tuple = None, result_format: str = r'dicts', replica: bool = False) -> list:
+        # the query may write, such as INSERT ... RETURNING, so it only goes
+        # to a replica when the caller says it is a read
+        return self._fetch(sql_query, params, result_format=result_format, replica=replica)
+
+    def _fetch(self: r'postgres', sql_query: str, params: tuple = None, operation: str = r'fetch', table: str = None, result_format: str = r'dicts', replica: bool = True) -> list:
         if self.loaded is False:
             return None
 
-        dbconn: Type[psycopg2.connection] = None
-        dbcursor: Type[psycopg2.cursor] = None
+        if result_format not in FORMATS:
+            print('[{0}] The result_format \'{1}\' is not one of {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), result_format, r', '.join(FORMATS)), file=stderr)
+
+            return None
+
+        span = self._span(operation, table)
         dbresult: list = []
+        error: Exception = None
 
-        self.sema.acquire()
+        def attempt() -> list:
+            with self._reading(span, to_replica=replica) as dbconn:
+                with dbconn.cursor(cursor_factory=psycopg2.extras.RealDictCursor if r'dicts' == result_format else None) as dbcursor:
+                    self._execute(dbcursor, sql_query, params)
+                    span.phase(r'execute')
 
-        try:
-            dbconn = psycopg2.connect(host=str(self.hostname), database=str(self.dbname), user=str(self.username), password=str(self.password))
-            dbcursor = dbconn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+                    if r'dicts' == result_format:
+                        rows: list = list(dbcursor.fetchall())
+
+                    else:
+                        # plain tuples are never turned into a dict per row
+                        rows = shape_rows([column.name for column in dbcursor.description], iter(lambda: dbcursor.fetchmany(BATCH_SIZE), []), result_format)
+
+                    span.phase(r'fetch')
 
-            dbcursor.execute(sql_query)
-            dbresult = list(dbcursor.fetchall())
+                    return rows
+
+        try:
+            dbresult = self._attempt(operation, attempt)
 
         except Exception as sql_exception:
             dbresult = None
+            error = sql_exception
 
             print('[{0}] An exception was thrown while trying to run a fetch query on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.dbname, str(sql_exception)), file=stderr)
 
-        finally:
-            if dbcursor:
-                dbcursor.close()
-
-            if dbconn:
-                dbconn.close()
-
-        self.sema.release()
+        span.finish(count_rows(dbresult), dbresult, error)
 
         return dbresult
 
     ###################################################################
     #     COMMIT                                                      #
     ###################################################################
-    def commit(self: r'postgres', sql_query: str) -> bool:
+    def commit(self: r'postgres', sql_query: str, params: tuple = None) -> bool:
+        # there is no telling which tables a raw query changed
+        dbresult: bool = self._commit(sql_query, params)
+        self._invalidate(None)
+
+        return dbresult
+
+    def _commit(self: r'postgres', sql_query: str, params: tuple = None, operation: str = r'commit', table: str = None) -> bool:
         if self.loaded is False:
             return False
 
-        dbconn: Type[psycopg2.connection] = None
-        dbcursor: Type[psycopg2.cursor] = None
+        span = self._span(operation, table)
         dbresult: bool = True
+        error: Exception = None
+        rows: int = 0
 
-        self.sema.acquire()
+        def attempt() -> int:
+            with self.pool.connection(span=span) as dbconn:
+                with dbconn.cursor() as dbcursor:
+                    self._execute(dbcursor, sql_query, params)
+                    count: int = max(dbcursor.rowcount, 0)
 
-        try:
-            dbconn = psycopg2.connect(host=self.hostname, database=self.dbname, user=self.username, password=self.password)
-            dbcursor = dbconn.cursor()
+                dbconn.commit()
+                span.phase(r'execute')
 
-            dbcursor.execute(sql_query)
-            dbconn.commit()
+                return count
+
+        try:
+            rows = self._attempt(operation, attempt)
 
         except Exception as sql_exception:
             dbresult = False
+            error = sql_exception
             
             print('[{0}] An exception was thrown while trying to run an update query on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.dbname, str(sql_exception)), file=stderr)
 
-        finally:
-            if dbcursor:
-                dbcursor.close()
+        span.finish(rows, None, error)
 
-            if dbconn:
-                dbconn.close()
+        return dbresult
 
-        self.sema.release()
+    ###################################################################
+    #     FIND                                                        #
+    ###################################################################
+    def find(self: r'postgres', table: str, criteria: dict, fields: list = None, limit: int = None, order_by=None, after: str = None, result_format: str = r'dicts') -> list:
+        # fields limits the columns returned, limit the rows, order_by sorts
+        # them and after is a page token from find_page
+        query: tuple = self._select(table, criteria, fields, limit, order_by, after)
+
+        if query is None:
+            return None
+
+        options: tuple = (None if fields is None else tuple(fields), limit, order_spec(order_by), after)
+        started: float = perf_counter()
+        dbresult: list = self._mirrored(table, criteria, fields, limit, order_by, after, result_format)
+
+        if dbresult is not None:
+            return dbresult
+
+        # reads after a write in a session must not join a flight which
+        # may have been sent to a replica
+        if self.singleflight is None or self._wrote() is True:
+            dbresult = self._lookup(table, query, criteria, options, result_format)
+
+        else:
+            dbresult = self.singleflight.run(self._table_key(table), criteria, options + (result_format,), lambda: self._lookup(table, query, criteria, options, result_format))
+
+        self._advise(table, criteria, started)
+
+        return dbresult
+
+    def _lookup(self: r'postgres', table: str, query: tuple, criteria: dict, options: tuple, result_format: str) -> list:
+        # only lists of dicts are cached
+        if self.cache is None or r'dicts' != result_format:
+            return self._fetch(*query, r'find', table, result_format)
+
+        table_key: str = self._table_key(table)
+        dbresult: list = self.cache.get(table_key, criteria, options)
+
+        if dbresult is None:
+            token: tuple = self.cache.token(table_key)
+            dbresult = self._fetch(*query, r'find', table)
+
+            self.cache.put(table_key, criteria, dbresult, token, options)
 
         return dbresult
 
+    def _select(self: r'postgres', table: str, criteria: dict, fields: list, limit: int, order_by, after: str) -> tuple:
+        if self._valid_criteria(table, criteria) is False:
+            return None
+
+        order: tuple = order_spec(order_by)
+        values: tuple = None
+
+        if after is not None:
+            values = decode_token(after)
+
+            if values is None or len(values) != len(order) or 0 == len(order):
+                print('[{0}] The page token passed to find on the Postgres table \'{1}\' does not match its order_by.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table), file=stderr)
+
+                return None
+
+        return self.compiler.select(table, criteria, with_order(fields, order), order, limit if limit is not None and 0 < limit else None, values)
+
     ###################################################################
-    #     FIND                                                        #
+    #     FIND PAGE                                                   #
     ###################################################################
-    def find(self: r'postgres', table: str, criteria: dict) -> list:
-        sql_query: str = r'SELECT * FROM ' + table
+    def find_page(self: r'postgres', table: str, criteria: dict, limit: int, order_by, fields: list = None, after: str = None) -> tuple:
+        # returns (rows, token) where token is passed as after to get the
+        # next page or is None on the last one, order_by should end with a
+        # unique column so that pages never overlap
+        order: tuple = order_spec(order_by)
 
-        if criteria is None or 0 == len(criteria.keys()):
-            return self.fetch(sql_query)
+        if 0 == len(order) or limit is None or 0 >= limit:
+            print('[{0}] find_page on the Postgres table \'{1}\' needs an order_by and a positive limit.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table), file=stderr)
 
-        sql_query += r' WHERE '
+            return None, None
 
-        for column in criteria.keys():
-            if type(criteria[column]) is str:
-                sql_query += column + r"='" + str(criteria[column]) +r"',"
+        return next_page(self.find(table, criteria, fields, limit + 1, order, after), tuple(self.compiler.fold(column)[-1] for column, ascending in order), limit)
 
-            else:
-                sql_query += column + r'=' + str(criteria[column]) +r','
+    ###################################################################
+    #     ITER FETCH, ITER FIND                                       #
+    ###################################################################
+    def iter_fetch(self: r'postgres', sql_query: str, batch_size: int = 1000) -> Iterator[dict]:
+        if self.loaded is False:
+            return None
+
+        return self._iter_fetch(sql_query, None, batch_size, r'iter_fetch')
+
+    def iter_find(self: r'postgres', table: str, criteria: dict, batch_size: int = 1000) -> Iterator[dict]:
+        if self.loaded is False or self._valid_criteria(table, criteria) is False:
+            return None
+
+        sql_query, params = self.compiler.select(table, criteria)
 
-        sql_query = sql_query[:-1] + r';'
+        # a named cursor can only be declared for the plain statement
+        return self._iter_fetch(sql_query.query, params, batch_size, r'iter_find', table)
 
-        return self.fetch(sql_query)
+    def _iter_fetch(self: r'postgres', sql_query: str, params: tuple, batch_size: int, operation: str, table: str = None, raises: bool = False) -> Iterator[dict]:
+        # the pooled connection is only checked out once iteration starts and
+        # goes back as soon as the generator finishes, fails or is closed,
+        # a failure ends the rows early unless raises is True
+        span = self._span(operation, table)
+        error: Exception = None
+        rows: int = 0
+
+        try:
+            with self._reading(span, r'batch') as dbconn:
+                with dbconn.cursor(name=r'mdbpg_' + uuid4().hex, cursor_factory=psycopg2.extras.RealDictCursor) as dbcursor:
+                    dbcursor.itersize = batch_size if 0 < batch_size else 1000
+                    dbcursor.execute(sql_query, params)
+                    span.phase(r'execute')
+
+                    for row in dbcursor:
+                        rows += 1
+                        yield row
+
+                    span.phase(r'fetch')
+
+        except Exception as sql_exception:
+            error = sql_exception
+
+            print('[{0}] An exception was thrown while trying to iterate over a fetch query on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.dbname, str(sql_exception)), file=stderr)
+
+            if raises is True:
+                raise
+
+        finally:
+            span.finish(rows, None, error)
 
     ###################################################################
-    #     INSERT                                                      #
+    #     PARALLEL FIND                                               #
     ###################################################################
-    def insert(self: r'postgres', table: str, row: dict) -> bool:
-        sql_query: str = r'INSERT INTO ' + table + r'('
+    def parallel_find(self: r'postgres', table: str, criteria: dict, partition_key: str = None, workers: int = 4, batch_size: int = 1000, ordered: bool = False) -> Iterator[dict]:
+        # splits the table into up to workers partitions read at once on
+        # their own connections, by ranges of partition_key when it is a
+        # number or date, hash buckets of it otherwise or heap pages without
+        # one, rows arrive in no particular order unless ordered is True
+        # which sorts key ranges and returns the partitions one by one, a
+        # partition which fails raises its exception from the iterator
+        if self.loaded is False or self._valid_criteria(table, criteria) is False:
+            return None
 
-        if row is None or 0 == len(row.keys()):
-            return False
+        workers = max(1, min(workers, self.scheduler.max_conns))
+        plan: list = self._partition(table, criteria, partition_key, workers, ordered)
+
+        if plan is None:
+            return None
+
+        return merge([partial(self._iter_fetch, sql_query, params, batch_size, r'parallel_find', table, True) for sql_query, params in plan], ordered)
+
+    def _partition(self: r'postgres', table: str, criteria: dict, partition_key: str, workers: int, ordered: bool) -> list:
+        order_column: str = None
+
+        if partition_key is None:
+            blocks: list = self._fetch(*self.compiler.relation_blocks(table), r'parallel_find', table, r'tuples')
+
+            if blocks is None:
+                return None
+
+            conditions: list = [self.compiler.tid_range(lower, upper) for lower, upper in ranges(split_range(0, int(blocks[0][0]), workers))]
 
-        for column in row.keys():
-            sql_query += column + r','
+        else:
+            bounds: list = self._fetch(*self.compiler.key_bounds(table, criteria, partition_key), r'parallel_find', table, r'tuples')
+
+            if bounds is None:
+                return None
 
-        sql_query = sql_query[:-1] + r')' + '\n' + r'VALUES('
+            boundaries: list = split_range(bounds[0][0], bounds[0][1], workers)
 
-        for column in row.keys():
-            if type(row[column]) is str:
-                sql_query += r"'" + str(row[column]) + r"',"
+            if boundaries is None:
+                conditions = [self.compiler.hash_bucket(partition_key, bucket, workers) for bucket in range(workers)]
 
             else:
-                sql_query += str(row[column]) + r','
+                conditions = [self.compiler.key_range(partition_key, lower, upper) for lower, upper in ranges(boundaries)]
+                order_column = partition_key if ordered is True else None
+
+        return [self.compiler.partition(table, criteria, condition, order_column) for condition in conditions]
+
+    ###################################################################
+    #     MIRROR, UNMIRROR                                            #
+    ###################################################################
+    def mirror(self: r'postgres', table: str, key: str, timeout: float = 30.0) -> pgmirror:
+        # loads the table into memory and keeps it current through triggers
+        # which NOTIFY the mirror of every change, from then on find answers
+        # from memory whatever it can, key has to be unique such as the
+        # primary key, returns the mirror once it is loaded or timeout
+        # passed, or None when the triggers could not be created
+        if self.loaded is False:
+            return None
+
+        if self._commit(self.compiler.mirror_function(), None, r'mirror', table) is False or self._commit(self.compiler.mirror_triggers(table, key), None, r'mirror', table) is False:
+            return None
+
+        mirrored: pgmirror = pgmirror(self, table, key)
+        previous: pgmirror = self.mirrors.get(self._table_key(table))
+        self.mirrors[self._table_key(table)] = mirrored
 
-        sql_query = sql_query[:-1] + r');'
+        if previous is not None:
+            previous.close()
 
-        return self.commit(sql_query)
+        if mirrored.start(timeout) is False:
+            print('[{0}] The mirror of the Postgres table \'{1}\' was not loaded within {2} seconds, find uses the database until it is.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table, timeout), file=stderr)
+
+        return mirrored
+
+    def unmirror(self: r'postgres', table: str) -> bool:
+        # stops following the table and drops its triggers, which are not
+        # counted, so every other mirror of the table, in this process or
+        # any other, stops seeing changes and goes stale until mirror is
+        # called on it again
+        mirrored: pgmirror = self.mirrors.pop(self._table_key(table), None)
+
+        if mirrored is None:
+            return False
+
+        mirrored.close()
+
+        return self._commit(self.compiler.drop_mirror_triggers(table, mirrored.source_key), None, r'unmirror', table)
+
+    def _mirrored(self: r'postgres', table: str, criteria: dict, fields: list, limit: int, order_by, after: str, result_format: str) -> list:
+        # None unless a mirror can answer the find, reads after a write in
+        # a session go to the database which the mirror may not have caught
+        mirrored: pgmirror = self.mirrors.get(self._table_key(table)) if 0 < len(self.mirrors) else None
+
+        if mirrored is None or order_by is not None or after is not None or r'dicts' != result_format or self._wrote() is True:
+            return None
+
+        return mirrored.find(criteria, fields, limit)
 
     ###################################################################
-    #     UPDATE                                                      #
+    #     EXPLAIN                                                     #
     ###################################################################
-    def update(self: r'postgres', table: str, criteria: dict, changes: dict) -> bool:
-        sql_query: str = r'UPDATE ' + table + '\n' + r'SET '
+    def explain(self: r'postgres', table: str, criteria: dict, analyze: bool = True) -> dict:
+        # the plan find would use summarized as scan, index, estimated_rows,
+        # actual_rows and seconds, with analyze the query is run to measure
+        # them so the last two are None without it
+        if self.loaded is False or self._valid_criteria(table, criteria) is False:
+            return None
+
+        dbresult: list = self._fetch(*self.compiler.explain(table, criteria, analyze), r'explain', table, r'tuples')
+
+        if dbresult is None:
+            return None
+
+        return pg_summary(dbresult[0][0])
+
+    ###################################################################
+    #     SUGGEST INDEXES, ENSURE INDEXES                             #
+    ###################################################################
+    def suggest_indexes(self: r'postgres', min_count: int = 1, min_seconds: float = 0.0) -> list:
+        # the indexes missing for the criteria recorded by the advisor, as
+        # its candidates with the most time spent first
+        if self.loaded is False:
+            return None
+
+        if self.advisor is None:
+            print('[{0}] suggest_indexes and ensure_indexes need an advisor to be passed to postgres.'.format(datetime.now().strftime('%m/%d %I:%M %p')), file=stderr)
+
+            return None
+
+        suggestions: list = []
+        indexes: dict = {}
+
+        for candidate in self.advisor.candidates(min_count, min_seconds):
+            table: str = self._table_key(candidate[r'table'])
+
+            # folded the same way as the column names in the catalog
+            columns: tuple = tuple((self.compiler.fold(column)[-1], kind) for column, kind in candidate[r'columns'])
+
+            if table not in indexes:
+                dbresult: list = self._fetch(*self.compiler.table_indexes(candidate[r'table']), r'suggest_indexes', candidate[r'table'], r'tuples')
+                indexes[table] = None if dbresult is None else [row[0] for row in dbresult]
+
+            if indexes[table] is None or covered(columns, indexes[table]) is True:
+                continue
+
+            # later shapes needing the same index are covered by this one
+            indexes[table].append(tuple(column for column, kind in columns))
+            suggestions.append(dict(candidate, columns=columns))
+
+        return suggestions
+
+    def ensure_indexes(self: r'postgres', min_count: int = 1, min_seconds: float = 0.0, concurrently: bool = True) -> list:
+        # creates the suggested indexes and returns the names of the ones it
+        # created, CONCURRENTLY keeps the tables writable in the meantime
+        suggestions: list = self.suggest_indexes(min_count, min_seconds)
+
+        if suggestions is None:
+            return None
+
+        created: list = []
+
+        for suggestion in suggestions:
+            sql_query, name = self.compiler.create_index(suggestion[r'table'], suggestion[r'columns'], concurrently)
+
+            if self._create_index(suggestion[r'table'], sql_query, concurrently) is True:
+                created.append(name)
+
+        return created
+
+    def _create_index(self: r'postgres', table: str, sql_query, concurrently: bool) -> bool:
+        span = self._span(r'ensure_indexes', table)
+        error: Exception = None
+
+        try:
+            with self.pool.connection(span=span, lane=r'batch') as dbconn:
+                # CREATE INDEX CONCURRENTLY can not run inside a transaction
+                dbconn.autocommit = concurrently
+
+                try:
+                    with dbconn.cursor() as dbcursor:
+                        dbcursor.execute(sql_query)
+
+                    dbconn.commit()
+
+                finally:
+                    dbconn.autocommit = False
 
-        if changes is None or 0 == len(changes.keys()):
+                span.phase(r'execute')
+
+        except Exception as sql_exception:
+            error = sql_exception
+
+            print('[{0}] An exception was thrown while trying to create an index on the Postgres table \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table, str(sql_exception)), file=stderr)
+
+        span.finish(0, None, error)
+
+        return error is None
+
+    ###################################################################
+    #     EXPORT TABLE, IMPORT TABLE                                  #
+    ###################################################################
+    def export_table(self: r'postgres', table: str, path: str, file_format: str = r'csv', criteria: dict = None, progress: Callable = None) -> dict:
+        # streams COPY TO STDOUT into the file in the csv (with a header),
+        # text or binary format without building a Python object per row,
+        # progress(offset) is called as the file grows
+        if self._transfer_format(table, file_format) is False or self._valid_criteria(table, criteria) is False:
+            return None
+
+        span = self._span(r'export_table', table)
+        result: dict = transfer_result()
+        error: Exception = None
+        writer: progresswriter = None
+
+        try:
+            writer = progresswriter(path, progress)
+
+            with self._reading(span, r'batch') as dbconn:
+                with dbconn.cursor() as dbcursor:
+                    sql_query, params = self.compiler.copy_to(table, criteria, file_format)
+                    dbcursor.copy_expert(dbcursor.mogrify(sql_query, params or None).decode(psycopg2.extensions.encodings[dbconn.encoding]), writer, size=BUFFER_SIZE)
+                    result[r'count'] = dbcursor.rowcount
+
+                span.phase(r'execute')
+
+        except Exception as copy_exception:
+            error = copy_exception
+            result[r'error'] = str(copy_exception)
+
+            print('[{0}] An exception was thrown while trying to export the Postgres table \'{1}\' to \'{2}\': {3}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table, path, str(copy_exception)), file=stderr)
+
+        finally:
+            if writer is not None:
+                writer.close()
+                result[r'offset'] = writer.offset
+
+        span.finish(result[r'count'], None, error)
+
+        return result
+
+    def import_table(self: r'postgres', table: str, path: str, file_format: str = r'csv', offset: int = 0, progress: Callable = None, chunk_size: int = CHUNK_SIZE) -> dict:
+        # loads a memory mapped file through COPY FROM STDIN one chunk of
+        # whole records per transaction, csv files need a header naming the
+        # columns, after a failure offset is where the loaded chunks end and
+        # passing it back resumes from there, binary files load in one go
+        if self._transfer_format(table, file_format) is False:
+            return None
+
+        if r'binary' == file_format and 0 != offset:
+            print('[{0}] Binary files can not be imported into the Postgres table \'{1}\' from an offset.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table), file=stderr)
+
+            return None
+
+        result: dict = transfer_result(offset=offset)
+
+        try:
+            with mapped(path) as mapped_view:
+                columns: tuple = None
+
+                if mapped_view is not None and r'csv' == file_format:
+                    columns, first = csv_header(mapped_view)
+                    result[r'offset'] = max(offset, first)
+
+                sql_query = self.compiler.copy_from(table, columns, file_format)
+
+                while mapped_view is not None and result[r'offset'] < len(mapped_view):
+                    end: int = len(mapped_view) if r'binary' == file_format else record_end(mapped_view, result[r'offset'], chunk_size if 0 < chunk_size else CHUNK_SIZE, file_format)
+
+                    result[r'count'] += self._copy_chunk(table, sql_query, mapped_view, result[r'offset'], end)
+                    result[r'offset'] = end
+
+                    if progress is not None:
+                        progress(end)
+
+        except Exception as copy_exception:
+            result[r'error'] = str(copy_exception)
+
+            print('[{0}] An exception was thrown while trying to import \'{1}\' into the Postgres table \'{2}\': {3}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), path, table, str(copy_exception)), file=stderr)
+
+        self._invalidate(table)
+
+        return result
+
+    def _transfer_format(self: r'postgres', table: str, file_format: str) -> bool:
+        if self.loaded is False:
             return False
 
-        for column in changes.keys():
-            if type(changes[column]) is str:
-                sql_query += column + r"='" + str(changes[column]) +r"',"
+        if file_format not in COPY_FORMATS:
+            print('[{0}] The format \'{1}\' for the Postgres table \'{2}\' is not one of {3}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), file_format, table, r', '.join(COPY_FORMATS)), file=stderr)
 
-            else:
-                sql_query += column + r'=' + str(changes[column]) +r','
+            return False
 
-        if criteria is None or 0 == len(criteria.keys()):
-            return self.commit(sql_query[:-1])
+        return True
 
-        sql_query = sql_query[:-1] + '\n' + r'WHERE '
+    def _copy_chunk(self: r'postgres', table: str, sql_query, mapped_view, start: int, end: int) -> int:
+        span = self._span(r'import_table', table)
+        count: int = 0
+        error: Exception = None
 
-        for column in criteria.keys():
-            if type(criteria[column]) is str:
-                sql_query += column + r"='" + str(criteria[column]) +r"',"
+        def attempt() -> int:
+            with self.pool.connection(span=span, lane=r'batch') as dbconn:
+                with dbconn.cursor() as dbcursor:
+                    dbcursor.copy_expert(sql_query, mappedreader(mapped_view, start, end), size=BUFFER_SIZE)
+                    copied: int = dbcursor.rowcount
 
-            else:
-                sql_query += column + r'=' + str(criteria[column]) +r','
+                dbconn.commit()
+                span.phase(r'execute')
+
+                return copied
+
+        try:
+            count = self._attempt(r'import_table', attempt)
 
-        sql_query = sql_query[:-1] + r';'
+        except Exception as copy_exception:
+            error = copy_exception
+            raise
 
-        return self.commit(sql_query)
+        finally:
+            span.finish(count, None, error)
+
+        return count
+
+    ###################################################################
+    #     INSERT                                                      #
+    ###################################################################
+    def insert(self: r'postgres', table: str, row: dict) -> bool:
+        if row is None or 0 == len(row.keys()):
+            return False
+
+        if self.writer is not None:
+            # the row is written later in a batch by the writer's thread
+            return self.loaded is True and self.writer.put(table, row)
+
+        dbresult: bool = self._commit(*self.compiler.insert(table, row), r'insert', table)
+        self._invalidate(table)
+
+        return dbresult
+
+    ###################################################################
+    #     UPDATE                                                      #
+    ###################################################################
+    def update(self: r'postgres', table: str, criteria: dict, changes: dict) -> bool:
+        if changes is None or 0 == len(changes.keys()) or self._valid_criteria(table, criteria) is False:
+            return False
+
+        started: float = perf_counter()
+        dbresult: bool = self._commit(*self.compiler.update(table, criteria, changes), r'update', table)
+        self._invalidate(table)
+        self._advise(table, criteria, started)
+
+        return dbresult
     
     ###################################################################
     #     DELETE                                                      #
     ###################################################################
     def delete(self: r'postgres', table: str, criteria: dict) -> bool:
-        sql_query: str = r'DELETE FROM ' + table + r' WHERE '
-
-        if criteria is None or 0 == len(criteria.keys()):
+        if criteria is None or 0 == len(criteria.keys()) or self._valid_criteria(table, criteria) is False:
             return False
 
-        for column in criteria.keys():
-            if type(criteria[column]) is str:
-                sql_query += column + r"='" + str(criteria[column]) +r"',"
+        started: float = perf_counter()
+        dbresult: bool = self._commit(*self.compiler.delete(table, criteria), r'delete', table)
+        self._invalidate(table)
+        self._advise(table, criteria, started)
+
+        return dbresult
+
+    ###################################################################
+    #     INSERT MANY                                                 #
+    ###################################################################
+    def insert_many(self: r'postgres', table: str, rows: Iterable, batch_size: int = 1000) -> list:
+        if self.loaded is False:
+            return None
+
+        return [self._write_batch(r'insert_many', table, batch, is_row, self._insert_batch) for batch in chunks(rows, batch_size)]
+
+    ###################################################################
+    #     UPDATE MANY ROWS                                            #
+    ###################################################################
+    def update_many_rows(self: r'postgres', table: str, updates: Iterable, batch_size: int = 1000) -> list:
+        if self.loaded is False:
+            return None
+
+        return [self._write_batch(r'update_many_rows', table, batch, is_criteria_update, self._update_batch) for batch in chunks(updates, batch_size)]
+
+    ###################################################################
+    #     DELETE MANY                                                 #
+    ###################################################################
+    def delete_many(self: r'postgres', table: str, criteria_list: Iterable, batch_size: int = 1000) -> list:
+        if self.loaded is False:
+            return None
+
+        return [self._write_batch(r'delete_many', table, batch, is_criteria, self._delete_batch) for batch in chunks(criteria_list, batch_size)]
+
+    ###################################################################
+    #     UPSERT MANY                                                 #
+    ###################################################################
+    def upsert_many(self: r'postgres', table: str, rows: Iterable, key_columns, batch_size: int = 1000) -> list:
+        # key_columns must match a unique index or constraint on the table,
+        # rows missing any of them are reported as failed
+        if self.loaded is False:
+            return None
+
+        keys: tuple = (key_columns,) if type(key_columns) is str else tuple(key_columns)
+
+        if 0 == len(keys):
+            print('[{0}] upsert_many on the table \'{1}\' needs at least one key column.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table), file=stderr)
+
+            return None
+
+        writer: Callable = lambda dbcursor, table, rows: self._upsert_batch(dbcursor, table, rows, keys)
+
+        return [upsert_result(self._write_batch(r'upsert_many', table, latest(batch, keys), has_keys(keys), writer)) for batch in chunks(rows, batch_size)]
+
+    ###################################################################
+    #     BATCHES                                                     #
+    ###################################################################
+    def _write_batch(self: r'postgres', operation: str, table: str, batch: list, is_valid: Callable, writer: Callable) -> dict:
+        # every batch runs as a single transaction on one pooled connection,
+        # so a failure rolls back and reports the whole batch
+        valid: list = []
+        invalid: list = []
+
+        for item in batch:
+            if is_valid(item) is True:
+                valid.append(item)
 
             else:
-                sql_query += column + r'=' + str(criteria[column]) +r','
+                invalid.append(item)
+
+        result: dict = batch_result(failed=invalid, error=None if 0 == len(invalid) else r'Skipped empty or malformed items')
+
+        if 0 == len(valid):
+            return result
+
+        span = self._span(operation, table)
+        error: Exception = None
+
+        def attempt():
+            with self.pool.connection(span=span, lane=r'batch') as dbconn:
+                with dbconn.cursor() as dbcursor:
+                    counts = writer(dbcursor, table, valid)
+
+                dbconn.commit()
+                span.phase(r'execute')
+
+                return counts
+
+        try:
+            counts = self._attempt(operation, attempt)
+            result.update(counts if type(counts) is dict else { r'count': counts })
+
+        except Exception as sql_exception:
+            result = batch_result(failed=batch, error=str(sql_exception))
+            error = sql_exception
+
+            print('[{0}] An exception was thrown while trying to run {1} with {2} rows on the Postgres database \'{3}\': {4}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), operation, len(batch), self.dbname, str(sql_exception)), file=stderr)
+
+        span.finish(result[r'count'], None, error)
+        self._invalidate(table)
+
+        return result
+
+    def _insert_batch(self: r'postgres', dbcursor: Type[psycopg2.extensions.cursor], table: str, rows: list) -> int:
+        count: int = 0
+
+        # rows with the same columns share one multi-row VALUES statement
+        for columns, values in _group(rows, lambda row: (tuple(row.keys()), tuple(row.values()))).items():
+            psycopg2.extras.execute_values(dbcursor, self.compiler.insert_values(table, columns), values, page_size=len(values))
+            count += len(values)
+
+        return count
+
+    def _upsert_batch(self: r'postgres', dbcursor: Type[psycopg2.extensions.cursor], table: str, rows: list, keys: tuple) -> dict:
+        inserted: int = 0
+        updated: int = 0
+
+        for columns, values in _group(rows, lambda row: (tuple(row.keys()), tuple(row.values()))).items():
+            for (fresh,) in psycopg2.extras.execute_values(dbcursor, self.compiler.upsert_values(table, columns, keys), values, page_size=len(values), fetch=True):
+                if fresh is True:
+                    inserted += 1
+
+                else:
+                    updated += 1
+
+        return { r'count': inserted + updated, r'inserted': inserted, r'updated': updated }
+
+    def _update_batch(self: r'postgres', dbcursor: Type[psycopg2.extensions.cursor], table: str, updates: list) -> int:
+        count: int = 0
+
+        for criteria, changes in updates:
+            self._execute(dbcursor, *self.compiler.update(table, criteria, changes))
+            count += dbcursor.rowcount
+
+        return count
+
+    def _delete_batch(self: r'postgres', dbcursor: Type[psycopg2.extensions.cursor], table: str, criteria_list: list) -> int:
+        count: int = 0
+
+        # criteria on the same columns are OR'ed into one DELETE statement
+        for columns, values in _group(criteria_list, criteria_terms).items():
+            dbcursor.execute(self.compiler.delete_any(table, columns, len(values)), [value for params in values for value in params])
+            count += dbcursor.rowcount
+
+        return count
+
+#######################################################################
+#                                                                     #
+#         HELPERS                                                     #
+#                                                                     #
+#######################################################################
+def _group(items: list, split: Callable) -> dict:
+    groups: dict = {}
 
-        sql_query = sql_query[:-1] + r';'
+    for item in items:
+        key, params = split(item)
+        groups.setdefault(key, []).append(params)
 
-        return self.commit(sql_query)
+    return groups
@@ -0,0 +1,203 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from datetime import datetime
+from mdbpg.pool import pgpool
+from random import sample
+from sys import stderr
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# seconds behind the primary, 0 when every WAL record received has been
+# replayed since an idle primary leaves the last replay timestamp behind
+LAG_QUERY: str = r'''SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'''
+
+# weight of the newest round trip in a replica's average latency
+ALPHA: float = 0.3
+
+# seconds a probe waits for a connection from the replica's pool
+PROBE_TIMEOUT: float = 5.0
+
+#######################################################################
+#                                                                     #
+#         SPLIT HOSTS                                                 #
+#                                                                     #
+#######################################################################
+def split_hosts(value) -> list:
+    # 'a,b' from an environment variable or ['a', 'b'] from the toml file
+    if value is None:
+        return []
+
+    if type(value) is str:
+        value = value.split(r',')
+
+    return [str(host).strip() for host in value if 0 < len(str(host).strip())]
+
+#######################################################################
+#                                                                     #
+#         REPLICA                                                     #
+#                                                                     #
+#######################################################################
+class replica():
+    __slots__ = (r'host', r'pool', r'latency', r'lag', r'healthy', r'checked', r'probing', r'failures')
+
+    def __init__(self: r'replica', host: str, pool: pgpool) -> None:
+        self.host: str = host
+        self.pool: pgpool = pool
+        self.latency: float = None      # moving average of probe round trips
+        self.lag: float = None
+        self.healthy: bool = True
+        self.checked: float = None      # when it was last probed
+        self.probing: bool = False
+        self.failures: int = 0
+
+#######################################################################
+#                                                                     #
+#         REPLICASET                                                  #
+#                                                                     #
+#######################################################################
+class replicaset():
+    # picks the replica for each read, replicas are probed at most every
+    # check_interval seconds on a thread started by the caller which finds
+    # them stale, reads never wait for a probe, and a replica which has not
+    # been probed yet, failed or is more than max_lag seconds behind is
+    # skipped until a later probe shows it has recovered
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'replicaset', replicas: list, max_lag: float = None, check_interval: float = 30.0) -> None:
+        self.replicas: list = replicas
+        self.max_lag: float = max_lag           # None reads from replicas however far behind
+        self.check_interval: float = check_interval
+        self.lock: Lock = Lock()
+        self.probes: list = []                  # running probe threads
+
+    ###################################################################
+    #     CHOOSE                                                      #
+    ###################################################################
+    def choose(self: r'replicaset') -> replica:
+        # returns None when no replica can serve the read
+        for stale in self._stale():
+            probe: Thread = Thread(target=self._probe, args=(stale,), name=r'mdbpg_replica_probe', daemon=True)
+            probe.start()
+
+            with self.lock:
+                self.probes = [running for running in self.probes if running.is_alive() is True] + [probe]
+
+        with self.lock:
+            candidates: list = [candidate for candidate in self.replicas if candidate.healthy is True and candidate.checked is not None and (self.max_lag is None or (candidate.lag is not None and candidate.lag <= self.max_lag))]
+
+        if 0 == len(candidates):
+            return None
+
+        if 1 == len(candidates):
+            return candidates[0]
+
+        # the lower latency of two random replicas spreads reads out while
+        # still steering them away from slow hosts
+        first, second = sample(candidates, 2)
+
+        return first if (first.latency or 0.0) <= (second.latency or 0.0) else second
+
+    ###################################################################
+    #     OWNER                                                       #
+    ###################################################################
+    def owner(self: r'replicaset', dbconn) -> pgpool:
+        for candidate in self.replicas:
+            if candidate.pool.owns(dbconn) is True:
+                return candidate.pool
+
+        return None
+
+    ###################################################################
+    #     FAILED                                                      #
+    ###################################################################
+    def failed(self: r'replicaset', failed: replica, error: Exception) -> None:
+        with self.lock:
+            failed.healthy = False
+            failed.failures += 1
+            failed.checked = monotonic()
+
+        print('[{0}] The Postgres replica \'{1}\' is skipped for {2} seconds after an exception: {3}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), failed.host, self.check_interval, str(error)), file=stderr)
+
+    ###################################################################
+    #     CLOSE                                                       #
+    ###################################################################
+    def close(self: r'replicaset') -> None:
+        with self.lock:
+            probes: list = list(self.probes)
+
+        # probes are bounded by PROBE_TIMEOUT and the connect timeout
+        for probe in probes:
+            probe.join()
+
+        for candidate in self.replicas:
+            candidate.pool.close()
+
+    ###################################################################
+    #     STATS                                                       #
+    ###################################################################
+    def stats(self: r'replicaset') -> dict:
+        with self.lock:
+            return { candidate.host: { r'healthy': candidate.healthy, r'latency': candidate.latency, r'lag': candidate.lag, r'failures': candidate.failures } for candidate in self.replicas }
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _stale(self: r'replicaset') -> list:
+        # claims the replicas due for a probe so that only one caller
+        # probes each of them
+        now: float = monotonic()
+        stale: list = []
+
+        with self.lock:
+            for candidate in self.replicas:
+                if candidate.probing is False and (candidate.checked is None or self.check_interval <= now - candidate.checked):
+                    candidate.probing = True
+                    stale.append(candidate)
+
+        return stale
+
+    def _probe(self: r'replicaset', probed: replica) -> None:
+        started: float = perf_counter()
+
+        try:
+            with probed.pool.connection(PROBE_TIMEOUT) as dbconn:
+                with dbconn.cursor() as dbcursor:
+                    dbcursor.execute(LAG_QUERY)
+                    lag: float = float(dbcursor.fetchone()[0])
+
+                dbconn.rollback()
+
+        except Exception as probe_exception:
+            with self.lock:
+                probed.probing = False
+
+            self.failed(probed, probe_exception)
+
+            return
+
+        seconds: float = perf_counter() - started
+
+        with self.lock:
+            probed.latency = seconds if probed.latency is None else ALPHA * seconds + (1.0 - ALPHA) * probed.latency
+            probed.lag = lag
+            probed.healthy = True
+            probed.checked = monotonic()
+            probed.probing = False
@@ -0,0 +1,192 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from pymongo.errors import ConnectionFailure, PyMongoError
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable
+
+import psycopg2
+import psycopg2.extensions
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# operations which leave the same result behind however many times they
+# run, only these are retried after an error which may have happened
+# once the server had already applied them, raw fetch and commit queries
+# could do anything and are never retried
+IDEMPOTENT: tuple = (r'find', r'update', r'delete', r'update_many_rows', r'delete_many', r'upsert_many')
+
+#######################################################################
+#                                                                     #
+#         EXCEPTIONS                                                  #
+#                                                                     #
+#######################################################################
+class circuitopen(Exception):
+    pass
+
+#######################################################################
+#                                                                     #
+#         IS TRANSIENT, IS RETRYABLE                                  #
+#                                                                     #
+#######################################################################
+def is_transient(exception: BaseException) -> bool:
+    # lost connections, failed connects, deadlocks and serialization
+    # failures, but not a statement_timeout which would only run again
+    if isinstance(exception, psycopg2.extensions.QueryCanceledError):
+        return False
+
+    if isinstance(exception, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return True
+
+    if isinstance(exception, ConnectionFailure):
+        return True
+
+    return isinstance(exception, PyMongoError) and exception.has_error_label(r'RetryableWriteError')
+
+def is_retryable(exception: BaseException, idempotent: bool) -> bool:
+    # MongoDB labels the writes it knows are safe to send again
+    if isinstance(exception, PyMongoError) and exception.has_error_label(r'RetryableWriteError'):
+        return True
+
+    return idempotent is True and is_transient(exception) is True
+
+#######################################################################
+#                                                                     #
+#         RESILIENCE                                                  #
+#                                                                     #
+#######################################################################
+class resilience():
+    # retries transient failures with jittered exponential backoff and
+    # trips a circuit breaker after failure_threshold of them in a row,
+    # while it is open calls raise circuitopen without touching the
+    # database until reset_timeout has passed and up to half_open_calls
+    # probes are let through, one success closes it and one failure
+    # opens it again
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'resilience', attempts: int = 3, base_delay: float = 0.05, max_delay: float = 2.0, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_calls: int = 1) -> None:
+        self.attempts: int = attempts if 0 < attempts else 1
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.failure_threshold: int = failure_threshold     # 0 turns the breaker off
+        self.reset_timeout: float = reset_timeout
+        self.half_open_calls: int = half_open_calls if 0 < half_open_calls else 1
+
+        self.lock: Lock = Lock()
+        self.state: str = r'closed'
+        self.failures: int = 0          # consecutive transient failures
+        self.opened: float = 0.0
+        self.probes: int = 0            # half open calls still running
+
+        self.retries: int = 0
+        self.opens: int = 0
+        self.rejected: int = 0
+
+    ###################################################################
+    #     RUN                                                         #
+    ###################################################################
+    def run(self: r'resilience', action: Callable, idempotent: bool = False):
+        # returns action() or raises its last exception, or circuitopen
+        attempt: int = 0
+
+        while True:
+            probe: bool = self._admit()
+
+            try:
+                value = action()
+
+            except Exception as exception:
+                transient: bool = is_transient(exception)
+                self._finish(probe, r'failure' if transient is True else (r'neutral' if isinstance(exception, TimeoutError) else r'success'))
+
+                attempt += 1
+
+                if attempt >= self.attempts or is_retryable(exception, idempotent) is False:
+                    raise
+
+                with self.lock:
+                    self.retries += 1
+
+                # full jitter keeps retrying callers from moving in step
+                sleep(uniform(0.0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+
+                continue
+
+            except BaseException:
+                self._finish(probe, r'neutral')
+                raise
+
+            self._finish(probe, r'success')
+
+            return value
+
+    ###################################################################
+    #     STATS                                                       #
+    ###################################################################
+    def stats(self: r'resilience') -> dict:
+        with self.lock:
+            return { r'state': self.state, r'failures': self.failures, r'retries': self.retries, r'opens': self.opens, r'rejected': self.rejected }
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _admit(self: r'resilience') -> bool:
+        # returns True for a half open probe, raises circuitopen when open
+        with self.lock:
+            if r'open' == self.state:
+                if self.reset_timeout > monotonic() - self.opened:
+                    self.rejected += 1
+
+                    raise circuitopen(r'The circuit breaker is open after {0} consecutive failures'.format(self.failures))
+
+                self.state = r'half_open'
+
+            if r'half_open' == self.state:
+                if self.half_open_calls <= self.probes:
+                    self.rejected += 1
+
+                    raise circuitopen(r'The circuit breaker is half open and waiting on its probes')
+
+                self.probes += 1
+
+                return True
+
+            return False
+
+    def _finish(self: r'resilience', probe: bool, outcome: str) -> None:
+        # a server error other than a transient one still shows that the
+        # database is reachable and counts as a success, timeouts waiting
+        # for a local slot count as neither
+        with self.lock:
+            if probe is True:
+                self.probes -= 1
+
+            if r'failure' == outcome:
+                self.failures += 1
+
+                if 0 < self.failure_threshold and r'open' != self.state and (probe is True or self.failure_threshold <= self.failures):
+                    self.state = r'open'
+                    self.opened = monotonic()
+                    self.opens += 1
+
+            elif r'success' == outcome:
+                self.failures = 0
+
+                if probe is True:
+                    self.state = r'closed'
@@ -0,0 +1,151 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from array import array
+from collections.abc import Mapping
+from typing import Iterable
+
+try:
+    import numpy
+
+except ImportError:
+    numpy = None
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# 'dicts' is a list of dicts, 'tuples' a rowtuples list and 'columns' a
+# dict of one NumPy array, or array.array or list without NumPy, per column
+FORMATS: tuple = (r'dicts', r'tuples', r'columns')
+
+# rows fetched per round trip while building columns
+BATCH_SIZE: int = 10000
+
+#######################################################################
+#                                                                     #
+#         ROWTUPLES                                                   #
+#                                                                     #
+#######################################################################
+class rowtuples(list):
+    # a list of row tuples sharing one header instead of a dict per row
+    def __init__(self: r'rowtuples', columns: Iterable, rows: Iterable = ()) -> None:
+        super().__init__(rows)
+        self.columns: tuple = tuple(columns)
+
+#######################################################################
+#                                                                     #
+#         COLUMNBUILDER                                               #
+#                                                                     #
+#######################################################################
+class columnbuilder():
+    # appends batches of row tuples to one typed array per column, which
+    # holds bools, ints and floats unboxed, and falls back to a list once
+    # a column holds None or anything else
+    def __init__(self: r'columnbuilder', columns: Iterable) -> None:
+        self.columns: tuple = tuple(columns)
+        self.values: list = [None] * len(self.columns)
+
+    def extend(self: r'columnbuilder', rows: list) -> None:
+        for index in range(len(self.columns)):
+            self.values[index] = self._append(self.values[index], [row[index] for row in rows])
+
+    def result(self: r'columnbuilder') -> dict:
+        return { column: self._finish(values) for column, values in zip(self.columns, self.values) }
+
+    def _append(self: r'columnbuilder', values, column: list):
+        if values is None:
+            values = self._new(column)
+
+        if type(values) is array:
+            count: int = len(values)
+
+            try:
+                values.extend(column)
+
+                return values
+
+            except (TypeError, OverflowError):
+                # extend may have appended part of the batch before failing
+                del values[count:]
+                values = values.tolist()
+
+        values.extend(column)
+
+        return values
+
+    def _new(self: r'columnbuilder', column: list):
+        first = next((value for value in column if value is not None), None)
+
+        if type(first) is bool:
+            return array(r'b')
+
+        if type(first) is int:
+            return array(r'q')
+
+        if type(first) is float:
+            return array(r'd')
+
+        return []
+
+    def _finish(self: r'columnbuilder', values):
+        values = [] if values is None else values
+
+        if numpy is None:
+            return values
+
+        if type(values) is array:
+            converted = numpy.asarray(values)
+
+            return converted.astype(bool) if r'b' == values.typecode else converted
+
+        return numpy.array(values, dtype=object)
+
+#######################################################################
+#                                                                     #
+#         SHAPE ROWS, SHAPE DOCUMENTS                                 #
+#                                                                     #
+#######################################################################
+def shape_rows(columns: Iterable, batches: Iterable, result_format: str):
+    # batches yields lists of row tuples such as a cursor's fetchmany
+    if r'tuples' == result_format:
+        return rowtuples(columns, (row for batch in batches for row in batch))
+
+    builder: columnbuilder = columnbuilder(columns)
+
+    for batch in batches:
+        builder.extend(batch)
+
+    return builder.result()
+
+def shape_documents(documents: list, fields: Iterable, result_format: str):
+    if r'dicts' == result_format:
+        return documents
+
+    # without fields the header is every field seen, in order of appearance
+    if fields is None:
+        fields = list(dict.fromkeys(field for document in documents for field in document))
+
+    rows: list = [tuple(document.get(field) for field in fields) for document in documents]
+
+    return shape_rows(fields, [rows[i:i + BATCH_SIZE] for i in range(0, len(rows), BATCH_SIZE)], result_format)
+
+def count_rows(result) -> int:
+    if result is None:
+        return 0
+
+    if isinstance(result, Mapping):
+        return len(next(iter(result.values()), ()))
+
+    return len(result)
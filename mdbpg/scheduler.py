@@ -0,0 +1,261 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from mdbpg.metrics import NULLSPAN, histogram
+from threading import Condition, Lock
+from time import monotonic
+
+import os
+import weakref
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# while both lanes are waiting interactive calls get 4 of every 5 free
+# slots and batch calls the other one, so neither lane starves
+WEIGHTS: dict = { r'interactive': 4, r'batch': 1 }
+
+#######################################################################
+#                                                                     #
+#         TICKET                                                      #
+#                                                                     #
+#######################################################################
+class ticket():
+    __slots__ = (r'lane', r'cond', r'queued', r'granted')
+
+    def __init__(self: r'ticket', lane: str, cond: Condition) -> None:
+        self.lane: str = lane
+        self.cond: Condition = cond
+        self.queued: float = monotonic()
+        self.granted: bool = False
+
+#######################################################################
+#                                                                     #
+#         SCHEDULER                                                   #
+#                                                                     #
+#######################################################################
+class scheduler():
+    # limits how many operations run at once, callers beyond max_conns
+    # wait in their lane and free slots are shared between the lanes by
+    # weight, first come first served within a lane
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'scheduler', max_conns: int = 10, weights: dict = None, timeout: float = None) -> None:
+        self.max_conns: int = max_conns if 0 < max_conns else 10
+        self.weights: dict = dict(WEIGHTS if weights is None else weights)
+        self.timeout: float = timeout       # None waits until a slot is free
+
+        # (lane, timeout) set by using() for the calls made in its block
+        self.context: ContextVar = ContextVar(r'mdbpg_scheduler', default=(None, None))
+
+        self.granted: dict = { lane: 0 for lane in self.weights }
+        self.timeouts: dict = { lane: 0 for lane in self.weights }
+        self.waits: dict = { lane: histogram() for lane in self.weights }
+
+        self._reset()
+
+        # a forked child starts over before any of its threads runs, the
+        # lock may have been held by one of the parent's threads which do
+        # not exist in the child, there is no fork without this hook
+        if hasattr(os, r'register_at_fork') is True:
+            os.register_at_fork(after_in_child=partial(_after_fork, weakref.ref(self)))
+
+    ###################################################################
+    #     USING                                                       #
+    ###################################################################
+    @contextmanager
+    def using(self: r'scheduler', lane: str = None, timeout: float = None):
+        # calls made in the block wait in lane, or give up after timeout
+        # seconds with a TimeoutError, unless they pass their own timeout
+        outer: tuple = self.context.get()
+        token = self.context.set((outer[0] if lane is None else lane, outer[1] if timeout is None else timeout))
+
+        try:
+            yield self
+
+        finally:
+            self.context.reset(token)
+
+    ###################################################################
+    #     SLOT                                                        #
+    ###################################################################
+    @contextmanager
+    def slot(self: r'scheduler', lane: str = r'interactive', timeout: float = None, span=NULLSPAN):
+        self.acquire(lane, timeout, span)
+
+        try:
+            yield
+
+        finally:
+            self.release()
+
+    ###################################################################
+    #     RESOLVE                                                     #
+    ###################################################################
+    def resolve(self: r'scheduler', lane: str = r'interactive', timeout: float = None) -> tuple:
+        # (lane, timeout) for a call, the lane set by using() takes
+        # precedence over the caller's default lane, while a timeout passed
+        # by the caller takes precedence over using()'s
+        context_lane, context_timeout = self.context.get()
+        lane = lane if context_lane is None else context_lane
+        timeout = timeout if timeout is not None else (context_timeout if context_timeout is not None else self.timeout)
+
+        return lane, timeout
+
+    ###################################################################
+    #     ACQUIRE                                                     #
+    ###################################################################
+    def acquire(self: r'scheduler', lane: str = r'interactive', timeout: float = None, span=NULLSPAN) -> None:
+        lane, timeout = self.resolve(lane, timeout)
+
+        with self.lock:
+            if lane not in self.queues:
+                raise ValueError(r'The scheduler has no lane named ' + repr(lane))
+
+            if self.in_flight < self.max_conns and 0 == sum(len(queue) for queue in self.queues.values()):
+                self._start(lane)
+                self.waits[lane].observe(0.0)
+                span.phase(r'queue')
+
+                return
+
+            waiter: ticket = ticket(lane, Condition(self.lock))
+            self._enqueue(waiter)
+
+            deadline: float = None if timeout is None else waiter.queued + timeout
+
+            try:
+                while waiter.granted is False:
+                    remaining: float = None if deadline is None else deadline - monotonic()
+
+                    if remaining is not None and 0 >= remaining:
+                        self.queues[lane].remove(waiter)
+                        self.timeouts[lane] += 1
+
+                        raise TimeoutError(r'Timed out after {0} seconds waiting for a slot in the {1} lane'.format(timeout, lane))
+
+                    waiter.cond.wait(remaining)
+
+            except BaseException:
+                if waiter.granted is True:
+                    # granted while being interrupted, hand the slot on
+                    self.in_flight -= 1
+                    self._grant()
+
+                elif waiter in self.queues[lane]:
+                    self.queues[lane].remove(waiter)
+
+                raise
+
+            self.waits[lane].observe(monotonic() - waiter.queued)
+
+        span.phase(r'queue')
+
+    ###################################################################
+    #     RELEASE                                                     #
+    ###################################################################
+    def release(self: r'scheduler') -> None:
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._grant()
+
+    ###################################################################
+    #     STATS                                                       #
+    ###################################################################
+    def stats(self: r'scheduler') -> dict:
+        # in_flight and queued are gauges, oldest_wait is how long the head
+        # of each lane has been waiting so far and wait the histogram of
+        # waits which ended with a slot
+        with self.lock:
+            now: float = monotonic()
+
+            return { r'in_flight': self.in_flight,
+                     r'max_conns': self.max_conns,
+                     r'queued': sum(len(queue) for queue in self.queues.values()),
+                     r'lanes': { lane: { r'queued': len(self.queues[lane]),
+                                         r'oldest_wait': now - self.queues[lane][0].queued if 0 < len(self.queues[lane]) else 0.0,
+                                         r'granted': self.granted[lane],
+                                         r'timeouts': self.timeouts[lane],
+                                         r'wait': self.waits[lane].snapshot() } for lane in self.weights } }
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _reset(self: r'scheduler') -> None:
+        # slots and waiters belong to the parent's threads after a fork
+        self.lock: Lock = Lock()
+        self.in_flight: int = 0
+        self.queues: dict = { lane: deque() for lane in self.weights }
+        self.finish: dict = { lane: 0.0 for lane in self.weights }      # virtual finish time of each lane's last grant
+
+    def _enqueue(self: r'scheduler', waiter: ticket) -> None:
+        # a lane which sat idle does not bank credit, it rejoins at the
+        # virtual time of the busiest waiting lanes
+        if 0 == len(self.queues[waiter.lane]):
+            waiting: list = [self.finish[lane] for lane, queue in self.queues.items() if 0 < len(queue)]
+
+            if 0 < len(waiting):
+                self.finish[waiter.lane] = max(self.finish[waiter.lane], min(waiting))
+
+        self.queues[waiter.lane].append(waiter)
+
+    def _start(self: r'scheduler', lane: str) -> None:
+        self.in_flight += 1
+        self.granted[lane] += 1
+        self.finish[lane] += 1.0 / self.weights[lane]
+
+    def _grant(self: r'scheduler') -> None:
+        # weighted fair queuing, the waiting lane with the lowest virtual
+        # finish time goes next and ties go to the lane listed first
+        while self.in_flight < self.max_conns:
+            waiting: list = [lane for lane, queue in self.queues.items() if 0 < len(queue)]
+
+            if 0 == len(waiting):
+                return
+
+            lane: str = min(waiting, key=lambda lane: self.finish[lane])
+            waiter: ticket = self.queues[lane].popleft()
+
+            self._start(lane)
+
+            waiter.granted = True
+            waiter.cond.notify()
+
+#######################################################################
+#                                                                     #
+#         SCHEDULER FOR                                               #
+#                                                                     #
+#######################################################################
+def scheduler_for(given: scheduler, max_conns: int) -> scheduler:
+    # each instance gets its own scheduler unless one is passed in, which
+    # lets several instances share a single limit
+    return scheduler(max_conns) if given is None else given
+
+#######################################################################
+#                                                                     #
+#         AFTER FORK                                                  #
+#                                                                     #
+#######################################################################
+def _after_fork(reference: weakref.ref) -> None:
+    # the hook outlives schedulers which have since been collected
+    forked: scheduler = reference()
+
+    if forked is not None:
+        forked._reset()
@@ -0,0 +1,107 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from mdbpg.cache import canonical, copy_rows
+from threading import Event, Lock
+from typing import Callable
+
+#######################################################################
+#                                                                     #
+#         FLIGHT                                                      #
+#                                                                     #
+#######################################################################
+class flight():
+    __slots__ = (r'done', r'result', r'error')
+
+    def __init__(self: r'flight') -> None:
+        self.done: Event = Event()
+        self.result = None
+        self.error: BaseException = None
+
+#######################################################################
+#                                                                     #
+#         SINGLEFLIGHT                                                #
+#                                                                     #
+#######################################################################
+class singleflight():
+    # concurrent finds with the same table, criteria and options share
+    # one query, the first caller runs it and the others wait for it and
+    # get their own copy of its result, or the same exception
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'singleflight') -> None:
+        self.lock: Lock = Lock()
+        self.flights: dict = {}         # (table, criteria, options) -> flight
+        self.leaders: int = 0
+        self.collapsed: int = 0
+
+    ###################################################################
+    #     RUN                                                         #
+    ###################################################################
+    def run(self: r'singleflight', table: str, criteria: dict, options: tuple, loader: Callable):
+        key: tuple = (table, canonical(criteria), options)
+
+        with self.lock:
+            current: flight = self.flights.get(key)
+            leader: bool = current is None
+
+            if leader is True:
+                current = flight()
+                self.flights[key] = current
+                self.leaders += 1
+
+            else:
+                self.collapsed += 1
+
+        if leader is False:
+            current.done.wait()
+
+            if current.error is not None:
+                raise current.error
+
+            return copy_rows(current.result)
+
+        try:
+            current.result = loader()
+
+        except BaseException as loader_exception:
+            current.error = loader_exception
+            raise
+
+        finally:
+            with self.lock:
+                if self.flights.get(key) is current:
+                    del self.flights[key]
+
+            current.done.set()
+
+        return current.result
+
+    ###################################################################
+    #     FORGET                                                      #
+    ###################################################################
+    def forget(self: r'singleflight', table: str = None) -> None:
+        # called on every write so that a find made after it never joins a
+        # query which started before it, the running query is left alone
+        # and only stops taking on new callers
+        with self.lock:
+            for key in [key for key in self.flights if table is None or key[0] == table]:
+                del self.flights[key]
+
+    ###################################################################
+    #     STATS                                                       #
+    ###################################################################
+    def stats(self: r'singleflight') -> dict:
+        with self.lock:
+            return { r'leaders': self.leaders, r'collapsed': self.collapsed, r'in_flight': len(self.flights) }
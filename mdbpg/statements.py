@@ -0,0 +1,418 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from functools import lru_cache
+from hashlib import md5
+from mdbpg.criteria import criteria_terms
+from psycopg2 import sql as psycopg2_sql
+from types import ModuleType
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# {0} is the column and {1} the placeholder, $ne and $nin match NULLs
+# the way they match missing fields on MongoDB
+PREDICATES: dict = { r'$eq': r'{0} = {1}',
+                     r'$ne': r'{0} IS DISTINCT FROM {1}',
+                     r'$gt': r'{0} > {1}',
+                     r'$gte': r'{0} >= {1}',
+                     r'$lt': r'{0} < {1}',
+                     r'$lte': r'{0} <= {1}',
+                     r'$in': r'{0} = ANY({1})',
+                     r'$nin': r'({0} <> ALL({1}) OR {0} IS NULL)',
+                     r'$prefix': r'{0} LIKE {1}' }
+
+#######################################################################
+#                                                                     #
+#         STATEMENT                                                   #
+#                                                                     #
+#######################################################################
+class statement():
+    __slots__ = (r'query', r'name', r'prepare', r'execute')
+
+    def __init__(self: r'statement', query, name: str, prepare, execute) -> None:
+        self.query = query          # the statement using %s parameters
+        self.name: str = name       # a name derived from the cache key, stable across evictions
+        self.prepare = prepare      # PREPARE name AS the statement using $n parameters
+        self.execute = execute      # EXECUTE name using %s parameters
+
+#######################################################################
+#                                                                     #
+#         SQLCOMPILER                                                 #
+#                                                                     #
+#######################################################################
+class sqlcompiler():
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'sqlcompiler', cache_size: int = 256, sql: ModuleType = psycopg2_sql) -> None:
+        # psycopg2.sql and psycopg.sql share the same interface
+        self.sql: ModuleType = sql
+        self.compile = lru_cache(maxsize=cache_size if 0 < cache_size else 256)(self._compile)
+        self.insert_values = lru_cache(maxsize=cache_size if 0 < cache_size else 256)(self._insert_values)
+        self.upsert_values = lru_cache(maxsize=cache_size if 0 < cache_size else 256)(self._upsert_values)
+
+    ###################################################################
+    #     IDENTIFIER                                                  #
+    ###################################################################
+    def identifier(self: r'sqlcompiler', name: str):
+        return self.sql.Identifier(*self.fold(name))
+
+    def fold(self: r'sqlcompiler', name: str) -> tuple:
+        # table and column names have always been passed to Postgres unquoted,
+        # so fold them to lower case the same way the server would unless the
+        # caller quoted them explicitly
+        parts: list = []
+
+        for part in str(name).split(r'.'):
+            if 2 <= len(part) and part.startswith(r'"') and part.endswith(r'"'):
+                parts.append(part[1:-1])
+
+            else:
+                parts.append(part.lower())
+
+        return tuple(parts)
+
+    ###################################################################
+    #     SELECT, INSERT, UPDATE, DELETE                              #
+    ###################################################################
+    def select(self: r'sqlcompiler', table: str, criteria: dict, fields: tuple = None, order: tuple = (), limit: int = None, after: tuple = None) -> tuple:
+        # order is ((column, ascending), ...) and after holds the values of
+        # those columns in the last row of the previous page
+        terms, params = criteria_terms(criteria)
+        options: tuple = (() if fields is None else tuple(fields), order, limit is not None, after is not None)
+
+        if after is not None:
+            params += self._keyset_params(order, after)
+
+        if limit is not None:
+            params += (limit,)
+
+        return self.compile(r'select', table, terms, (), options), params
+
+    def insert(self: r'sqlcompiler', table: str, row: dict) -> tuple:
+        return self.compile(r'insert', table, tuple(row.keys())), tuple(row.values())
+
+    def update(self: r'sqlcompiler', table: str, criteria: dict, changes: dict) -> tuple:
+        terms, params = criteria_terms(criteria)
+
+        return self.compile(r'update', table, terms, tuple(changes.keys())), tuple(changes.values()) + params
+
+    def delete(self: r'sqlcompiler', table: str, criteria: dict) -> tuple:
+        terms, params = criteria_terms(criteria)
+
+        return self.compile(r'delete', table, terms), params
+
+    def delete_any(self: r'sqlcompiler', table: str, columns: tuple, count: int):
+        # not cached, the number of OR'ed terms changes with every batch
+        return self.sql.SQL(r'DELETE FROM {0} WHERE ').format(self.identifier(table)) + self.sql.SQL(r' OR ').join([self.sql.SQL(r'(') + self._conjunction(columns, self._placeholders()) + self.sql.SQL(r')')] * count)
+
+    ###################################################################
+    #     PARTITIONS                                                  #
+    ###################################################################
+    # none of these are cached, the bounds change with every scan and
+    # each returns (query, params) or (condition, params)
+    def relation_blocks(self: r'sqlcompiler', table: str) -> tuple:
+        regclass: str = r'.'.join(r'"' + part.replace(r'"', r'""') + r'"' for part in self.fold(table))
+
+        return self.sql.SQL(r"SELECT pg_relation_size(%s::regclass) / current_setting('block_size')::bigint"), (regclass,)
+
+    def key_bounds(self: r'sqlcompiler', table: str, criteria: dict, column: str) -> tuple:
+        terms, params = criteria_terms(criteria)
+        query = self.sql.SQL(r'SELECT min({0}), max({0}) FROM {1}').format(self.identifier(column), self.identifier(table))
+
+        if 0 < len(terms):
+            query += self.sql.SQL(r' WHERE ') + self._conjunction(terms, self._placeholders())
+
+        return query, params
+
+    def tid_range(self: r'sqlcompiler', lower: int, upper: int) -> tuple:
+        # whole heap pages, scanned with a TID range scan on Postgres 14+
+        return self._range(self.sql.SQL(r'ctid'), None if lower is None else r'({0},0)'.format(lower), None if upper is None else r'({0},0)'.format(upper), self.sql.SQL(r'::tid'))
+
+    def key_range(self: r'sqlcompiler', column: str, lower, upper) -> tuple:
+        return self._range(self.identifier(column), lower, upper, self.sql.SQL(r''))
+
+    def hash_bucket(self: r'sqlcompiler', column: str, bucket: int, buckets: int) -> tuple:
+        # for keys which can not be split into ranges, NULLs go to bucket 0
+        condition = self.sql.SQL(r'mod(hashtext(CAST({0} AS text)) & 2147483647, %s) = %s').format(self.identifier(column))
+
+        if 0 == bucket:
+            condition = self.sql.SQL(r'({0} OR {1} IS NULL)').format(condition, self.identifier(column))
+
+        return condition, (buckets, bucket)
+
+    def partition(self: r'sqlcompiler', table: str, criteria: dict, condition: tuple, order_column: str = None) -> tuple:
+        terms, params = criteria_terms(criteria)
+        conditions: list = []
+
+        if 0 < len(terms):
+            conditions.append(self._conjunction(terms, self._placeholders()))
+
+        if condition[0] is not None:
+            conditions.append(condition[0])
+
+        query = self.sql.SQL(r'SELECT * FROM {0}').format(self.identifier(table))
+
+        if 0 < len(conditions):
+            query += self.sql.SQL(r' WHERE ') + self.sql.SQL(r' AND ').join(conditions)
+
+        if order_column is not None:
+            query += self.sql.SQL(r' ORDER BY {0} ASC NULLS FIRST').format(self.identifier(order_column))
+
+        return query, params + condition[1]
+
+    ###################################################################
+    #     COPY                                                        #
+    ###################################################################
+    def copy_to(self: r'sqlcompiler', table: str, criteria: dict, copy_format: str) -> tuple:
+        terms, params = criteria_terms(criteria)
+        source = self.identifier(table)
+
+        if 0 < len(terms):
+            source = self.sql.SQL(r'(SELECT * FROM {0} WHERE {1})').format(source, self._conjunction(terms, self._placeholders()))
+
+        return self.sql.SQL(r'COPY {0} TO STDOUT WITH (FORMAT {1}{2})').format(source, self.sql.SQL(copy_format), self.sql.SQL(r', HEADER' if r'csv' == copy_format else r'')), params
+
+    def copy_from(self: r'sqlcompiler', table: str, columns: tuple, copy_format: str):
+        # csv headers are read by import_table and never sent to the server
+        target = self.identifier(table)
+
+        if columns is not None and 0 < len(columns):
+            target += self.sql.SQL(r' ({0})').format(self.sql.SQL(r', ').join(self.identifier(column) for column in columns))
+
+        return self.sql.SQL(r'COPY {0} FROM STDIN WITH (FORMAT {1})').format(target, self.sql.SQL(copy_format))
+
+    ###################################################################
+    #     EXPLAIN, INDEXES                                            #
+    ###################################################################
+    def explain(self: r'sqlcompiler', table: str, criteria: dict, analyze: bool = True) -> tuple:
+        sql_query, params = self.select(table, criteria)
+
+        return self.sql.SQL(r'EXPLAIN (ANALYZE, FORMAT JSON) ' if analyze is True else r'EXPLAIN (FORMAT JSON) ') + sql_query.query, params
+
+    def table_indexes(self: r'sqlcompiler', table: str) -> tuple:
+        # the columns of each valid index, expressions are left out
+        regclass: str = r'.'.join(r'"' + part.replace(r'"', r'""') + r'"' for part in self.fold(table))
+
+        return self.sql.SQL(r'''SELECT array_agg(a.attname::text ORDER BY k.position) FROM pg_index i
+                                CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+                                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                                WHERE i.indrelid = %s::regclass AND i.indisvalid GROUP BY i.indexrelid'''), (regclass,)
+
+    def create_index(self: r'sqlcompiler', table: str, columns: tuple, concurrently: bool = True) -> tuple:
+        # (query, name) for the columns from index_columns, prefix columns
+        # use text_pattern_ops so that LIKE 'abc%' can use the index
+        # whatever the collation
+        name: str = r'mdbpg_' + md5(repr((self.fold(table), columns)).encode(), usedforsecurity=False).hexdigest()[:16]
+        keys = self.sql.SQL(r', ').join(self.identifier(column) + self.sql.SQL(r' text_pattern_ops' if r'prefix' == kind else r'') for column, kind in columns)
+
+        return self.sql.SQL(r'CREATE INDEX {0}IF NOT EXISTS {1} ON {2} ({3})').format(self.sql.SQL(r'CONCURRENTLY ' if concurrently is True else r''), self.sql.Identifier(name), self.identifier(table), keys), name
+
+    ###################################################################
+    #     MIRRORS                                                     #
+    ###################################################################
+    # a mirror identifies rows by to_jsonb(row) ->> key, the same text in
+    # the notifications sent by the triggers and in the rows it loads
+    def mirror_channel(self: r'sqlcompiler', table: str, key: str) -> str:
+        return r'mdbpg_' + md5(repr((self.fold(table), self.fold(key)[-1])).encode(), usedforsecurity=False).hexdigest()[:16]
+
+    def mirror_function(self: r'sqlcompiler'):
+        # notifies the channel in TG_ARGV[0] with 'k' and the key in
+        # TG_ARGV[1] of every row changed, or 't' when the table is
+        # truncated, notifications are only sent once the writes commit
+        return self.sql.SQL(r'''CREATE OR REPLACE FUNCTION mdbpg_mirror_notify() RETURNS trigger LANGUAGE plpgsql AS $mdbpg$
+                                BEGIN
+                                    IF TG_OP = 'TRUNCATE' THEN
+                                        PERFORM pg_notify(TG_ARGV[0], 't');
+                                        RETURN NULL;
+                                    END IF;
+                                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                                        PERFORM pg_notify(TG_ARGV[0], 'k' || (to_jsonb(OLD) ->> TG_ARGV[1]));
+                                    END IF;
+                                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                                        PERFORM pg_notify(TG_ARGV[0], 'k' || (to_jsonb(NEW) ->> TG_ARGV[1]));
+                                    END IF;
+                                    RETURN NULL;
+                                END
+                                $mdbpg$''')
+
+    def mirror_triggers(self: r'sqlcompiler', table: str, key: str):
+        channel: str = self.mirror_channel(table, key)
+        names: tuple = (self.sql.Identifier(channel), self.sql.Identifier(channel + r'_truncate'))
+        arguments = self.sql.SQL(r'{0}, {1}').format(self.sql.Literal(channel), self.sql.Literal(self.fold(key)[-1]))
+
+        return self.drop_mirror_triggers(table, key) + self.sql.SQL(r'''; CREATE TRIGGER {0} AFTER INSERT OR UPDATE OR DELETE ON {2} FOR EACH ROW EXECUTE FUNCTION mdbpg_mirror_notify({3})
+                                                                      ; CREATE TRIGGER {1} AFTER TRUNCATE ON {2} FOR EACH STATEMENT EXECUTE FUNCTION mdbpg_mirror_notify({3})''').format(*names, self.identifier(table), arguments)
+
+    def drop_mirror_triggers(self: r'sqlcompiler', table: str, key: str):
+        channel: str = self.mirror_channel(table, key)
+
+        return self.sql.SQL(r'DROP TRIGGER IF EXISTS {0} ON {2}; DROP TRIGGER IF EXISTS {1} ON {2}').format(self.sql.Identifier(channel), self.sql.Identifier(channel + r'_truncate'), self.identifier(table))
+
+    def listen(self: r'sqlcompiler', table: str, key: str):
+        return self.sql.SQL(r'LISTEN {0}').format(self.sql.Identifier(self.mirror_channel(table, key)))
+
+    def key_type(self: r'sqlcompiler', table: str, key: str) -> tuple:
+        regclass: str = r'.'.join(r'"' + part.replace(r'"', r'""') + r'"' for part in self.fold(table))
+
+        return self.sql.SQL(r'SELECT format_type(atttypid, atttypmod) FROM pg_attribute WHERE attrelid = %s::regclass AND attname = %s AND NOT attisdropped'), (regclass, self.fold(key)[-1])
+
+    def mirror_rows(self: r'sqlcompiler', table: str, key: str, key_type: str = None, identities: list = None) -> tuple:
+        # every row, or the rows with the given identities which are cast
+        # back to the key's type so that its index is used
+        query = self.sql.SQL(r'SELECT to_jsonb(mdbpg_mirror) ->> %s AS mdbpg_mirror_key, mdbpg_mirror.* FROM {0} AS mdbpg_mirror').format(self.identifier(table))
+
+        if identities is None:
+            return query, (self.fold(key)[-1],)
+
+        return query + self.sql.SQL(r' WHERE {0} = ANY(CAST(%s AS text[])::{1}[])').format(self.identifier(key), self.sql.SQL(key_type)), (self.fold(key)[-1], list(identities))
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _compile(self: r'sqlcompiler', operation: str, table: str, columns: tuple, changes: tuple = (), options: tuple = ((), (), False, False)) -> statement:
+        name: str = r'mdbpg_' + md5(repr((operation, table, columns, changes, options)).encode(), usedforsecurity=False).hexdigest()[:16]
+        query = self._build(operation, table, columns, changes, self._placeholders(), options)
+        numbered = self._build(operation, table, columns, changes, self._placeholders(numbered=True), options)
+        count: int = len(columns) + len(changes) + (self._keyset_size(options[1]) if options[3] is True else 0) + (1 if options[2] is True else 0)
+
+        prepare = self.sql.SQL(r'PREPARE {0} AS ').format(self.sql.Identifier(name)) + numbered
+        execute = self.sql.SQL(r'EXECUTE {0}').format(self.sql.Identifier(name))
+
+        if 0 < count:
+            execute += self.sql.SQL(r' ({0})').format(self.sql.SQL(r', ').join([self.sql.SQL(r'%s')] * count))
+
+        return statement(query, name, prepare, execute)
+
+    def _insert_values(self: r'sqlcompiler', table: str, columns: tuple):
+        # the VALUES %s template used with psycopg2.extras.execute_values
+        return self.sql.SQL(r'INSERT INTO {0} ({1}) VALUES %s').format(self.identifier(table), self.sql.SQL(r', ').join(self.identifier(column) for column in columns))
+
+    def _upsert_values(self: r'sqlcompiler', table: str, columns: tuple, keys: tuple):
+        # xmax is 0 only for freshly inserted rows, rows made only of keys
+        # are set to themselves so that every row is returned and counted
+        folded: set = { self.fold(key) for key in keys }
+        changes: tuple = tuple(column for column in columns if self.fold(column) not in folded) or keys
+        assignments = self.sql.SQL(r', ').join(self.sql.SQL(r'{0} = EXCLUDED.{0}').format(self.identifier(column)) for column in changes)
+
+        return self._insert_values(table, columns) + self.sql.SQL(r' ON CONFLICT ({0}) DO UPDATE SET {1} RETURNING (xmax = 0)').format(self.sql.SQL(r', ').join(self.identifier(key) for key in keys), assignments)
+
+    def _build(self: r'sqlcompiler', operation: str, table: str, columns: tuple, changes: tuple, placeholder, options: tuple = ((), (), False, False)):
+        if r'select' == operation:
+            return self._build_select(table, columns, placeholder, *options)
+
+        if r'insert' == operation:
+            return self.sql.SQL(r'INSERT INTO {0} ({1}) VALUES ({2})').format(self.identifier(table), self.sql.SQL(r', ').join(self.identifier(column) for column in columns), self.sql.SQL(r', ').join(placeholder() for column in columns))
+
+        elif r'update' == operation:
+            query = self.sql.SQL(r'UPDATE {0} SET {1}').format(self.identifier(table), self.sql.SQL(r', ').join(self.sql.SQL(r'{0} = {1}').format(self.identifier(column), placeholder()) for column in changes))
+
+        else:
+            query = self.sql.SQL(r'DELETE FROM {0}').format(self.identifier(table))
+
+        if 0 == len(columns):
+            return query
+
+        return query + self.sql.SQL(r' WHERE ') + self._conjunction(columns, placeholder)
+
+    def _build_select(self: r'sqlcompiler', table: str, columns: tuple, placeholder, fields: tuple, order: tuple, limit: bool, keyset: bool):
+        selected = self.sql.SQL(r'*') if 0 == len(fields) else self.sql.SQL(r', ').join(self.identifier(field) for field in fields)
+        query = self.sql.SQL(r'SELECT {0} FROM {1}').format(selected, self.identifier(table))
+        conditions: list = []
+
+        if 0 < len(columns):
+            conditions.append(self._conjunction(columns, placeholder))
+
+        if keyset is True:
+            conditions.append(self._keyset(order, placeholder))
+
+        if 0 < len(conditions):
+            query += self.sql.SQL(r' WHERE ') + self.sql.SQL(r' AND ').join(conditions)
+
+        if 0 < len(order):
+            query += self.sql.SQL(r' ORDER BY ') + self.sql.SQL(r', ').join(self.identifier(column) + self.sql.SQL(r' ASC' if ascending is True else r' DESC') for column, ascending in order)
+
+        if limit is True:
+            query += self.sql.SQL(r' LIMIT ') + placeholder()
+
+        return query
+
+    def _keyset(self: r'sqlcompiler', order: tuple, placeholder):
+        # rows after the previous page's last row, a row comparison can use
+        # a multicolumn index when every column sorts the same way
+        if 1 == len(set(ascending for column, ascending in order)):
+            operator = self.sql.SQL(r' > ' if order[0][1] is True else r' < ')
+
+            if 1 == len(order):
+                return self.identifier(order[0][0]) + operator + placeholder()
+
+            return self.sql.SQL(r'({0})').format(self.sql.SQL(r', ').join(self.identifier(column) for column, ascending in order)) + operator + self.sql.SQL(r'({0})').format(self.sql.SQL(r', ').join(placeholder() for column in order))
+
+        terms: list = []
+
+        for i, (column, ascending) in enumerate(order):
+            equal: list = [self.sql.SQL(r'{0} = {1}').format(self.identifier(previous), placeholder()) for previous, direction in order[:i]]
+            terms.append(self.sql.SQL(r'(') + self.sql.SQL(r' AND ').join(equal + [self.identifier(column) + self.sql.SQL(r' > ' if ascending is True else r' < ') + placeholder()]) + self.sql.SQL(r')'))
+
+        return self.sql.SQL(r'(') + self.sql.SQL(r' OR ').join(terms) + self.sql.SQL(r')')
+
+    def _keyset_size(self: r'sqlcompiler', order: tuple) -> int:
+        if 1 == len(set(ascending for column, ascending in order)):
+            return len(order)
+
+        return len(order) * (len(order) + 1) // 2
+
+    def _keyset_params(self: r'sqlcompiler', order: tuple, after: tuple) -> tuple:
+        if 1 == len(set(ascending for column, ascending in order)):
+            return tuple(after)
+
+        return tuple(value for i in range(len(order)) for value in after[:i + 1])
+
+    def _range(self: r'sqlcompiler', column, lower, upper, cast) -> tuple:
+        # the first range also holds the NULLs
+        if lower is None and upper is None:
+            return None, ()
+
+        if lower is None:
+            return self.sql.SQL(r'({0} < %s{1} OR {0} IS NULL)').format(column, cast), (upper,)
+
+        if upper is None:
+            return self.sql.SQL(r'{0} >= %s{1}').format(column, cast), (lower,)
+
+        return self.sql.SQL(r'({0} >= %s{1} AND {0} < %s{1})').format(column, cast), (lower, upper)
+
+    def _conjunction(self: r'sqlcompiler', columns: tuple, placeholder):
+        # columns are the terms from criteria_terms
+        return self.sql.SQL(r' AND ').join(self._condition(term, placeholder) for term in columns)
+
+    def _condition(self: r'sqlcompiler', term, placeholder):
+        if type(term) is tuple:
+            return self.sql.SQL(PREDICATES[term[1]]).format(self.identifier(term[0]), placeholder())
+
+        return self.sql.SQL(r'{0} = {1}').format(self.identifier(term), placeholder())
+
+    def _placeholders(self: r'sqlcompiler', numbered: bool = False):
+        position: list = [0]
+
+        def placeholder():
+            if numbered is False:
+                return self.sql.SQL(r'%s')
+
+            position[0] += 1
+
+            return self.sql.SQL(r'$' + str(position[0]))
+
+        return placeholder
@@ -0,0 +1,339 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from contextlib import contextmanager
+from datetime import datetime
+from mdbpg.criteria import mongo_criteria
+from mdbpg.results import BATCH_SIZE, FORMATS, count_rows, shape_rows
+from sys import stderr
+
+import psycopg2
+import psycopg2.extras
+
+#######################################################################
+#                                                                     #
+#         PGTRANSACTION                                               #
+#                                                                     #
+#######################################################################
+class pgtransaction():
+    # every method runs on the one pooled connection pinned by
+    # postgres.transaction(), failures are printed and returned as None
+    # or False like everywhere else and make the transaction roll back
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'pgtransaction', db, dbconn) -> None:
+        self.db = db
+        self.dbconn = dbconn
+        self.failed: bool = dbconn is None
+        self.committed: bool = False
+        self.depth: int = 0
+        self.tables: set = set()
+        self.invalidate_all: bool = False
+
+    ###################################################################
+    #     FETCH, COMMIT                                               #
+    ###################################################################
+    def fetch(self: r'pgtransaction', sql_query: str, params: tuple = None, result_format: str = r'dicts') -> list:
+        return self._fetch(sql_query, params, r'fetch', None, result_format)
+
+    def commit(self: r'pgtransaction', sql_query: str, params: tuple = None) -> bool:
+        # the statement only runs here, it is committed with the rest of
+        # the transaction
+        self.invalidate_all = True
+
+        return self._run(sql_query, params, r'commit')
+
+    ###################################################################
+    #     FIND, INSERT, UPDATE, DELETE                                #
+    ###################################################################
+    def find(self: r'pgtransaction', table: str, criteria: dict, fields: list = None, limit: int = None, order_by=None, after: str = None, result_format: str = r'dicts') -> list:
+        # takes the same options as postgres.find but is never served from
+        # the cache since it sees this transaction's writes
+        query: tuple = self.db._select(table, criteria, fields, limit, order_by, after)
+
+        if query is None:
+            self.failed = True
+
+            return None
+
+        return self._fetch(*query, r'find', table, result_format)
+
+    def insert(self: r'pgtransaction', table: str, row: dict) -> bool:
+        if row is None or 0 == len(row.keys()):
+            return False
+
+        self.tables.add(table)
+
+        return self._run(*self.db.compiler.insert(table, row), r'insert', table)
+
+    def update(self: r'pgtransaction', table: str, criteria: dict, changes: dict) -> bool:
+        if changes is None or 0 == len(changes.keys()):
+            return False
+
+        if self.db._valid_criteria(table, criteria) is False:
+            self.failed = True
+
+            return False
+
+        self.tables.add(table)
+
+        return self._run(*self.db.compiler.update(table, criteria, changes), r'update', table)
+
+    def delete(self: r'pgtransaction', table: str, criteria: dict) -> bool:
+        if criteria is None or 0 == len(criteria.keys()):
+            return False
+
+        if self.db._valid_criteria(table, criteria) is False:
+            self.failed = True
+
+            return False
+
+        self.tables.add(table)
+
+        return self._run(*self.db.compiler.delete(table, criteria), r'delete', table)
+
+    ###################################################################
+    #     SAVEPOINT                                                   #
+    ###################################################################
+    @contextmanager
+    def savepoint(self: r'pgtransaction'):
+        # a nested block which is rolled back on its own if it raises or
+        # one of its operations fails, the outer transaction carries on
+        if self.dbconn is None:
+            yield self
+            return
+
+        name: str = r'mdbpg_savepoint_' + str(self.depth)
+        failed: bool = self.failed
+
+        if self._run(r'SAVEPOINT ' + name, None, r'savepoint') is False:
+            yield self
+            return
+
+        self.depth += 1
+
+        try:
+            yield self
+
+        except BaseException:
+            self._run(r'ROLLBACK TO SAVEPOINT ' + name, None, r'savepoint')
+            self.failed = failed
+
+            raise
+
+        else:
+            if self.failed is True:
+                self.failed = False
+
+                print('[{0}] Rolled back to a savepoint on the Postgres database \'{1}\' after a failed operation.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.db.dbname), file=stderr)
+
+                self._run(r'ROLLBACK TO SAVEPOINT ' + name, None, r'savepoint')
+
+            else:
+                self._run(r'RELEASE SAVEPOINT ' + name, None, r'savepoint')
+
+            self.failed = self.failed or failed
+
+        finally:
+            self.depth -= 1
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _fetch(self: r'pgtransaction', sql_query: str, params: tuple, operation: str, table: str = None, result_format: str = r'dicts') -> list:
+        if self.dbconn is None:
+            return None
+
+        if result_format not in FORMATS:
+            self.failed = True
+
+            print('[{0}] The result_format \'{1}\' is not one of {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), result_format, r', '.join(FORMATS)), file=stderr)
+
+            return None
+
+        span = self.db._span(operation, table)
+        dbresult: list = None
+        error: Exception = None
+
+        try:
+            with self.dbconn.cursor(cursor_factory=psycopg2.extras.RealDictCursor if r'dicts' == result_format else None) as dbcursor:
+                self.db._execute(dbcursor, sql_query, params)
+                span.phase(r'execute')
+
+                if r'dicts' == result_format:
+                    dbresult = list(dbcursor.fetchall())
+
+                else:
+                    dbresult = shape_rows([column.name for column in dbcursor.description], iter(lambda: dbcursor.fetchmany(BATCH_SIZE), []), result_format)
+
+                span.phase(r'fetch')
+
+        except Exception as sql_exception:
+            self.failed = True
+            error = sql_exception
+
+            print('[{0}] An exception was thrown while trying to run a fetch query in a transaction on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.db.dbname, str(sql_exception)), file=stderr)
+
+        span.finish(count_rows(dbresult), dbresult, error)
+
+        return dbresult
+
+    def _run(self: r'pgtransaction', sql_query: str, params: tuple, operation: str, table: str = None) -> bool:
+        if self.dbconn is None:
+            return False
+
+        span = self.db._span(operation, table)
+        error: Exception = None
+        rows: int = 0
+
+        try:
+            with self.dbconn.cursor() as dbcursor:
+                self.db._execute(dbcursor, sql_query, params)
+                rows = max(dbcursor.rowcount, 0)
+
+            span.phase(r'execute')
+
+        except Exception as sql_exception:
+            self.failed = True
+            error = sql_exception
+
+            print('[{0}] An exception was thrown while trying to run an update query in a transaction on the Postgres database \'{1}\': {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.db.dbname, str(sql_exception)), file=stderr)
+
+        span.finish(rows, None, error)
+
+        return error is None
+
+    def _finish(self: r'pgtransaction', commit: bool) -> bool:
+        # returns False if the connection is no longer usable
+        if self.dbconn is None:
+            return True
+
+        try:
+            if commit is True:
+                self.dbconn.commit()
+                self.committed = True
+
+            else:
+                self.dbconn.rollback()
+
+        except Exception as sql_exception:
+            print('[{0}] An exception was thrown while trying to {1} a transaction on the Postgres database \'{2}\': {3}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), r'commit' if commit is True else r'roll back', self.db.dbname, str(sql_exception)), file=stderr)
+
+            return False
+
+        finally:
+            # even a failed commit may have been applied on the server
+            if self.invalidate_all is True:
+                self.db._invalidate(None)
+
+            else:
+                for table in self.tables:
+                    self.db._invalidate(table)
+
+        return True
+
+#######################################################################
+#                                                                     #
+#         MDBTRANSACTION                                              #
+#                                                                     #
+#######################################################################
+class mdbtransaction():
+    # every method runs in the ClientSession started by
+    # mongodb.transaction(), failures are printed and returned as None
+    # or False like everywhere else and make the transaction abort
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'mdbtransaction', db, session) -> None:
+        self.db = db
+        self.session = session
+        self.failed: bool = session is None
+        self.committed: bool = False
+        self.collections: set = set()
+
+    ###################################################################
+    #     FIND, INSERT, UPDATE, DELETE                                #
+    ###################################################################
+    def find(self: r'mdbtransaction', collection: str, criteria: dict, fields: list = None, limit: int = None, order_by=None, after: str = None, result_format: str = r'dicts') -> list:
+        # takes the same options as mongodb.find
+        query: tuple = self.db._query(collection, criteria, fields, order_by, after)
+
+        if query is None or result_format not in FORMATS + (r'raw',):
+            self.failed = True
+
+            if query is not None:
+                print('[{0}] The result_format \'{1}\' is not one of {2}.'.format(datetime.now().strftime('%m/%d %I:%M %p'), result_format, r', '.join(FORMATS + (r'raw',))), file=stderr)
+
+            return None
+
+        return self._run(r'find', collection, lambda dbcollection: self.db._documents(dbcollection, query, limit, result_format, self.session), r'find a document from')
+
+    def insert(self: r'mdbtransaction', collection: str, document: dict) -> bool:
+        self.collections.add(collection)
+
+        return self._run(r'insert', collection, lambda dbcollection: dbcollection.insert_one(document, session=self.session) and 1, r'insert a document from') is not None
+
+    def update(self: r'mdbtransaction', collection: str, criteria: dict, changes: dict) -> bool:
+        self.collections.add(collection)
+
+        return self._run(r'update', collection, lambda dbcollection: dbcollection.update_many(mongo_criteria(criteria), { r'$set': changes }, session=self.session).matched_count, r'update a document from') is not None
+
+    def delete(self: r'mdbtransaction', collection: str, criteria: dict) -> bool:
+        self.collections.add(collection)
+
+        return self._run(r'delete', collection, lambda dbcollection: dbcollection.delete_many(mongo_criteria(criteria), session=self.session).deleted_count, r'delete a document from') is not None
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _run(self: r'mdbtransaction', operation: str, collection: str, action, description: str):
+        if self.session is None:
+            return None
+
+        span = self.db._span(operation, collection)
+        value = None
+        error: Exception = None
+
+        try:
+            value = action(self.db._collection(collection))
+            span.phase(r'execute')
+
+        except Exception as mongodb_exception:
+            self.failed = True
+            error = mongodb_exception
+
+            print('[{0}] An exception was thrown while trying to {1} the collection \'{2}\' in a transaction using MongoDB: {3}'.format(datetime.now().strftime('%m/%d %I:%M %p'), description, collection, str(mongodb_exception)), file=stderr)
+
+        span.finish(value if type(value) is int else count_rows(value), value, error)
+
+        return value
+
+    def _finish(self: r'mdbtransaction', commit: bool) -> None:
+        if self.session is None:
+            return
+
+        try:
+            if commit is True:
+                self.session.commit_transaction()
+                self.committed = True
+
+            else:
+                self.session.abort_transaction()
+
+        except Exception as mongodb_exception:
+            print('[{0}] An exception was thrown while trying to {1} a transaction using MongoDB: {2}'.format(datetime.now().strftime('%m/%d %I:%M %p'), r'commit' if commit is True else r'abort', str(mongodb_exception)), file=stderr)
+
+        finally:
+            for collection in self.collections:
+                self.db._invalidate(collection)
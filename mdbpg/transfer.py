@@ -0,0 +1,235 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import csv
+import io
+import mmap
+
+#######################################################################
+#                                                                     #
+#         CONSTANTS                                                   #
+#                                                                     #
+#######################################################################
+# COPY formats for Postgres and file formats for MongoDB
+COPY_FORMATS: tuple = (r'csv', r'text', r'binary')
+FILE_FORMATS: tuple = (r'bson', r'jsonl', r'csv')
+
+# bytes moved per read or write and between progress callbacks
+BUFFER_SIZE: int = 1 << 20
+
+# bytes of a file loaded by each COPY FROM transaction
+CHUNK_SIZE: int = 1 << 24
+
+#######################################################################
+#                                                                     #
+#         TRANSFER RESULT                                             #
+#                                                                     #
+#######################################################################
+def transfer_result(count: int = 0, offset: int = 0, failed: int = 0, error: str = None) -> dict:
+    # offset is the number of bytes of the file written, or read and
+    # loaded, passing it back to import_table resumes after them
+    return { r'count': count, r'offset': offset, r'failed': failed, r'error': error }
+
+#######################################################################
+#                                                                     #
+#         PROGRESSWRITER                                              #
+#                                                                     #
+#######################################################################
+class progresswriter():
+    # a buffered binary file which calls progress(offset) every
+    # BUFFER_SIZE bytes and once more when it is closed
+    def __init__(self: r'progresswriter', path: str, progress: Callable = None) -> None:
+        self.file = open(path, r'wb', buffering=BUFFER_SIZE)
+        self.progress: Callable = progress
+        self.offset: int = 0
+        self.reported: int = 0
+
+    def write(self: r'progresswriter', data) -> int:
+        written: int = self.file.write(data)
+        self.offset += written
+
+        if self.progress is not None and BUFFER_SIZE <= self.offset - self.reported:
+            self.reported = self.offset
+            self.progress(self.offset)
+
+        return written
+
+    def close(self: r'progresswriter') -> None:
+        self.file.close()
+
+        if self.progress is not None and self.reported != self.offset:
+            self.progress(self.offset)
+
+#######################################################################
+#                                                                     #
+#         MAPPEDREADER                                                #
+#                                                                     #
+#######################################################################
+class mappedreader():
+    # a file-like view of [start, end) of a memory mapped file for COPY
+    # FROM, the pages are read by the kernel on demand so memory stays
+    # flat however large the file is
+    def __init__(self: r'mappedreader', mapped: mmap.mmap, start: int, end: int) -> None:
+        self.mapped: mmap.mmap = mapped
+        self.position: int = start
+        self.end: int = end
+
+    def read(self: r'mappedreader', size: int = -1) -> bytes:
+        stop: int = self.end if size is None or 0 > size else min(self.end, self.position + size)
+        data: bytes = self.mapped[self.position:stop]
+        self.position = stop
+
+        return data
+
+#######################################################################
+#                                                                     #
+#         MAPPED                                                      #
+#                                                                     #
+#######################################################################
+@contextmanager
+def mapped(path: str):
+    # yields a read only memory map of the file, or None when it is empty
+    # since an empty file can not be mapped
+    with open(path, r'rb') as mapped_file:
+        if 0 == mapped_file.seek(0, io.SEEK_END):
+            yield None
+
+            return
+
+        with mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_view:
+            yield mapped_view
+
+#######################################################################
+#                                                                     #
+#         CSV HEADER, RECORD END                                      #
+#                                                                     #
+#######################################################################
+def csv_header(mapped_view: mmap.mmap) -> tuple:
+    # (columns, offset of the first record)
+    end: int = record_end(mapped_view, 0, 1, r'csv')
+
+    return tuple(next(csv.reader([mapped_view[0:end].decode(r'utf-8-sig')]), [])), end
+
+def record_end(mapped_view: mmap.mmap, start: int, size: int, copy_format: str) -> int:
+    # the end of the last whole record within size bytes of start, or of
+    # the first record when it is longer than that, a newline only ends a
+    # csv record outside of quotes which is when the quotes before it are
+    # even since embedded quotes are doubled
+    length: int = len(mapped_view)
+
+    if length <= start + size:
+        return length
+
+    cut: int = mapped_view.rfind(b'\n', start, start + size)
+
+    if 0 > cut:
+        cut = mapped_view.find(b'\n', start + size)
+
+        if 0 > cut:
+            return length
+
+    if r'csv' != copy_format:
+        return cut + 1
+
+    quotes: int = mapped_view[start:cut].count(b'"')
+
+    while 1 == quotes % 2:
+        following: int = mapped_view.find(b'\n', cut + 1)
+
+        if 0 > following:
+            return length
+
+        quotes += mapped_view[cut:following].count(b'"')
+        cut = following
+
+    return cut + 1
+
+#######################################################################
+#                                                                     #
+#         ENCODE, DECODE                                              #
+#                                                                     #
+#######################################################################
+def encode_document(document, file_format: str, fields: tuple = None) -> bytes:
+    # bson documents are read raw and written as they are
+    if r'bson' == file_format:
+        return document.raw
+
+    if r'jsonl' == file_format:
+        return json_util.dumps(document).encode() + b'\n'
+
+    return csv_row([_csv_value(_field(document, field)) for field in fields])
+
+def csv_row(values: list) -> bytes:
+    line = io.StringIO()
+    csv.writer(line).writerow(values)
+
+    return line.getvalue().encode()
+
+def read_documents(mapped_view: mmap.mmap, offset: int, file_format: str) -> Iterator[tuple]:
+    # yields (document, offset after it) from offset onwards
+    if r'bson' == file_format:
+        length: int = len(mapped_view)
+
+        while offset + 4 <= length:
+            end: int = offset + int.from_bytes(mapped_view[offset:offset + 4], r'little')
+            yield RawBSONDocument(mapped_view[offset:end]), end
+            offset = end
+
+        return
+
+    fields: tuple = None
+
+    if r'csv' == file_format:
+        fields, first = csv_header(mapped_view)
+        offset = max(offset, first)
+
+    while offset < len(mapped_view):
+        end = record_end(mapped_view, offset, 1, file_format)
+        line: str = mapped_view[offset:end].decode(r'utf-8')
+
+        if 0 < len(line.strip()):
+            if r'jsonl' == file_format:
+                yield json_util.loads(line), end
+
+            else:
+                values: list = next(csv.reader([line]))
+                yield { field: value for field, value in zip(fields, values) if r'' != value }, end
+
+        offset = end
+
+#######################################################################
+#                                                                     #
+#         HELPERS                                                     #
+#                                                                     #
+#######################################################################
+def _field(document, field: str):
+    for part in field.split(r'.'):
+        document = document.get(part) if isinstance(document, Mapping) else None
+
+    return document
+
+def _csv_value(value) -> str:
+    # nested values are written as extended JSON, None as an empty field
+    if value is None:
+        return r''
+
+    if isinstance(value, (Mapping, list)):
+        return json_util.dumps(value)
+
+    return str(value)
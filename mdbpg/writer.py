@@ -0,0 +1,237 @@
+#######################################################################
+# Copyright (c) 2022 Jordan Schaffrin                                 #
+#                                                                     #
+# This Source Code Form is subject to the terms of the Mozilla Public #
+# License, v. 2.0. If a copy of the MPL was not distributed with this #
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.            #
+#######################################################################
+
+#######################################################################
+#                                                                     #
+#         IMPORTS                                                     #
+#                                                                     #
+#######################################################################
+from datetime import datetime
+from mdbpg.cache import sizeof
+from sys import stderr
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Callable
+
+import atexit
+import os
+
+#######################################################################
+#                                                                     #
+#         BUFFEREDWRITER                                              #
+#                                                                     #
+#######################################################################
+class bufferedwriter():
+    ###################################################################
+    #     CONSTRUCTOR, INSTANCE VARIABLES                             #
+    ###################################################################
+    def __init__(self: r'bufferedwriter', flush_rows: int = 1000, flush_bytes: int = 0, flush_interval: float = 1.0, max_queue: int = 100000, put_timeout: float = None, on_failure: Callable = None) -> None:
+        self.flush_rows: int = flush_rows if 0 < flush_rows else 1000
+        self.flush_bytes: int = flush_bytes                 # 0 skips measuring rows altogether
+        self.flush_interval: float = flush_interval
+        self.max_queue: int = max_queue if 0 < max_queue else 100000
+        self.put_timeout: float = put_timeout               # None blocks until there is room
+        self.on_failure: Callable = on_failure              # on_failure(table, rows, error)
+
+        self.insert_many: Callable = None
+        self.thread: Thread = None
+        self.closed: bool = False
+
+        self.written: int = 0
+        self.failed: int = 0
+        self.flushes: int = 0
+
+        self._reset()
+
+    ###################################################################
+    #     ATTACH                                                      #
+    ###################################################################
+    def attach(self: r'bufferedwriter', insert_many: Callable) -> None:
+        # insert_many(table, rows) returns one batch result per batch like
+        # the bulk methods of both classes
+        self.insert_many = insert_many
+
+    ###################################################################
+    #     PUT                                                         #
+    ###################################################################
+    def put(self: r'bufferedwriter', table: str, row: dict) -> bool:
+        if os.getpid() != self.pid:
+            # the parent process still owns and writes whatever was queued
+            self._reset()
+
+        nbytes: int = sizeof(row) if 0 < self.flush_bytes else 0
+
+        with self.cond:
+            deadline: float = None if self.put_timeout is None else monotonic() + self.put_timeout
+
+            while self.closed is False and self.max_queue <= len(self.pending):
+                remaining: float = None if deadline is None else deadline - monotonic()
+
+                if remaining is not None and 0 >= remaining:
+                    print('[{0}] The write buffer stayed full for {1} seconds, a row for \'{2}\' was not queued.'.format(datetime.now().strftime('%m/%d %I:%M %p'), self.put_timeout, table), file=stderr)
+
+                    return False
+
+                # a full queue is flushed straight away
+                self.cond.notify_all()
+                self.cond.wait(remaining)
+
+            if self.closed is True or self.insert_many is None:
+                print('[{0}] The write buffer is closed, a row for \'{1}\' was not queued.'.format(datetime.now().strftime('%m/%d %I:%M %p'), table), file=stderr)
+
+                return False
+
+            if 0 == len(self.pending):
+                self.first = monotonic()
+
+            self.pending.append((table, row))
+            self.nbytes += nbytes
+
+            if self.thread is None:
+                self._start()
+
+            if self._is_due() is True:
+                self.cond.notify_all()
+
+        return True
+
+    ###################################################################
+    #     FLUSH                                                       #
+    ###################################################################
+    def flush(self: r'bufferedwriter') -> bool:
+        # writes every row queued before the call, returns False if any of
+        # them could not be written
+        return self._write()
+
+    ###################################################################
+    #     CLOSE                                                       #
+    ###################################################################
+    def close(self: r'bufferedwriter') -> None:
+        with self.cond:
+            self.closed = True
+            thread: Thread = self.thread
+            self.cond.notify_all()
+
+        if thread is not None and os.getpid() == self.pid:
+            thread.join()
+
+        self._write()
+        atexit.unregister(self.close)
+
+    ###################################################################
+    #     STATS                                                       #
+    ###################################################################
+    def stats(self: r'bufferedwriter') -> dict:
+        with self.cond:
+            return { r'queued': len(self.pending), r'written': self.written, r'failed': self.failed, r'flushes': self.flushes }
+
+    ###################################################################
+    #     PRIVATE                                                     #
+    ###################################################################
+    def _reset(self: r'bufferedwriter') -> None:
+        # locks held by another thread at fork time would never be released
+        # in the child so everything is created anew
+        self.cond: Condition = Condition()
+        self.write_lock: Lock = Lock()
+        self.pending: list = []         # (table, row) in the order they were queued
+        self.nbytes: int = 0
+        self.first: float = None        # when the oldest pending row was queued
+        self.thread = None
+        self.pid: int = os.getpid()
+
+    def _start(self: r'bufferedwriter') -> None:
+        # rows still queued at interpreter exit are written before it ends
+        self.thread = Thread(target=self._run, name=r'mdbpg-writer', daemon=True)
+        self.thread.start()
+
+        atexit.register(self.close)
+
+    def _is_due(self: r'bufferedwriter') -> bool:
+        if 0 == len(self.pending):
+            return False
+
+        if self.flush_rows <= len(self.pending) or self.max_queue <= len(self.pending) or (0 < self.flush_bytes and self.flush_bytes <= self.nbytes):
+            return True
+
+        return self.flush_interval <= monotonic() - self.first
+
+    def _run(self: r'bufferedwriter') -> None:
+        while True:
+            with self.cond:
+                while self.closed is False and self._is_due() is False:
+                    self.cond.wait(None if 0 == len(self.pending) else max(0.0, self.first + self.flush_interval - monotonic()))
+
+                if 0 == len(self.pending) and self.closed is True:
+                    return
+
+            self._write()
+
+    def _write(self: r'bufferedwriter') -> bool:
+        # the write lock keeps flushes in queue order, so a flush() returns
+        # only after every row queued before it has been written
+        with self.write_lock:
+            with self.cond:
+                pending: list = self.pending
+                self.pending = []
+                self.nbytes = 0
+                self.first = None
+                self.cond.notify_all()
+
+            if 0 == len(pending):
+                return True
+
+            tables: dict = {}
+
+            for table, row in pending:
+                tables.setdefault(table, []).append(row)
+
+            success: bool = True
+
+            for table, rows in tables.items():
+                if self._write_table(table, rows) is False:
+                    success = False
+
+            with self.cond:
+                self.flushes += 1
+
+            return success
+
+    def _write_table(self: r'bufferedwriter', table: str, rows: list) -> bool:
+        failed: list = rows
+        error: str = None
+
+        try:
+            results: list = self.insert_many(table, rows)
+
+            if results is None:
+                error = r'The database is not configured'
+
+            else:
+                failed = [row for result in results for row in result[r'failed']]
+                error = next((result[r'error'] for result in results if result[r'error'] is not None), None)
+
+        except Exception as writer_exception:
+            error = str(writer_exception)
+
+        with self.cond:
+            self.written += len(rows) - len(failed)
+            self.failed += len(failed)
+
+        if 0 == len(failed):
+            return True
+
+        print('[{0}] The write buffer failed to write {1} rows to \'{2}\': {3}'.format(datetime.now().strftime('%m/%d %I:%M %p'), len(failed), table, error), file=stderr)
+
+        if self.on_failure is not None:
+            try:
+                self.on_failure(table, failed, error)
+
+            except Exception as callback_exception:
+                print('[{0}] An exception was thrown by the write buffer\'s failure callback: {1}'.format(datetime.now().strftime('%m/%d %I:%M %p'), str(callback_exception)), file=stderr)
+
+        return False
@@ -28,12 +28,17 @@ setup(
     author_email=r'mailbox@xrtuen.com',
     license=r'Mozilla Public License 2.0',
     python_requires=r'>=3.9',
-    packages=[r'mdbpg'],
+    packages=[r'mdbpg', r'mdbpg.aio'],
     install_requires=[r'mtoml>=1.2.0',
                       r'psycopg2>=2.9.3',
                       r'pymongo>=4.1.1',
                       r'dnspython>=2.2.1',
                       ],
+    extras_require={
+        r'aio': [r'psycopg[pool]>=3.1', r'pymongo>=4.10'],
+        r'compression': [r'pymongo[snappy,zstd]>=4.1.1'],
+        r'numpy': [r'numpy>=1.21'],
+    },
 
     classifiers=[
         r'License :: OSI Approved :: Mozilla Public License 2.0 (MPL 2.0)',
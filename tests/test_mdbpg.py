@@ -11,14 +11,30 @@
 #         IMPORTS                                                     #
 #                                                                     #
 #######################################################################
+import asyncio
 import os
+import signal
 import sys
+import threading
+import time
 import mtoml
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
 from mtoml import mtoml
+from pymongo.errors import AutoReconnect
 
 sys.path.append(r'.')
 
 import mdbpg
+import mdbpg.aio
+from benchmarks.standins import standinclient, standinconnection, standinfaults
+from mdbpg.partitions import merge, mongo_range, ranges, split_range
+from mdbpg.advisor import covered, index_columns, mongo_summary, pg_summary
+from mdbpg.criteria import criteria_error, criteria_terms, matches, mongo_criteria
+from mdbpg.mirror import mirror
+from mdbpg.pool import pgpool
+from mdbpg.transfer import csv_header, mapped, read_documents, record_end
+from mdbpg.replicas import split_hosts
 
 #######################################################################
 #                                                                     #
@@ -27,7 +43,9 @@ import mdbpg
 #######################################################################
 mtoml.set_dir(r'./tests/')  # set mtoml's working directory
 
-if os.path.exists(mtoml.get_dir() + r'database.toml') is True:
+local_config = os.path.exists(mtoml.get_dir() + r'database.toml')
+
+if local_config is True:
     # this is just so I can run tests on my local device without
     # setting up env vars
     pgdb = mdbpg.postgres(max_conns=0, use_env_vars=False)
@@ -148,4 +166,761 @@ def test_mdb_fake_update():
     assert bad_mdb.update(r'test', {}, {r'testval3': r'changed'}) is False
 
 def test_mdb_fake_delete():
-    assert bad_mdb.delete(r'test', {}) is False
\ No newline at end of file
+    assert bad_mdb.delete(r'test', {}) is False
+
+def test_pgdb_pool_reuse():
+    assert (0 == len(pgdb.find(r'TESTTBL', {}))) is True
+    assert (0 == len(pgdb.find(r'TESTTBL', {}))) is True
+    assert (1 == pgdb.pool.size()) is True
+    assert (1 == pgdb.pool.idle_size()) is True
+
+def test_pgdb_pool_close():
+    with mdbpg.postgres(max_conns=1) as closing_pgdb:
+        closing_pgdb.loaded = True
+        closing_pgdb.hostname = r'TEST-FAKE'
+        assert closing_pgdb.fetch(r'SELECT 1') is None
+        assert (0 == closing_pgdb.pool.size()) is True
+
+    assert closing_pgdb.pool.closed is True
+    assert closing_pgdb.fetch(r'SELECT 1') is None
+    assert closing_pgdb.commit(r'SELECT 1') is False
+
+def test_mdb_client_reuse():
+    with mdbpg.mongodb(max_conns=2, server_selection_timeout_ms=100) as reuse_mdb:
+        reuse_mdb.connstr = r'mongodb://TEST-FAKE'
+        assert reuse_mdb.find(r'test', {}) is None
+        assert (reuse_mdb._client() is reuse_mdb.client) is True
+        assert (2 == reuse_mdb.client.options.pool_options.max_pool_size) is True
+
+    assert reuse_mdb.client is None
+
+def test_pgdb_bulk():
+    assert pgdb.delete_many(r'TESTTBL', [{r'testvar3': r'bulk'}]) == [{r'count': 0, r'failed': [], r'error': None}]
+    assert pgdb.insert_many(r'TESTTBL', ({r'testvar1': False, r'testvar2': i, r'testvar3': r'bulk'} for i in range(5)), batch_size=2) == [{r'count': 2, r'failed': [], r'error': None}, {r'count': 2, r'failed': [], r'error': None}, {r'count': 1, r'failed': [], r'error': None}]
+    assert (5 == pgdb.update_many_rows(r'TESTTBL', [({r'testvar2': 0}, {r'testvar3': r'bulk2'}), ({r'testvar3': r'bulk'}, {r'testvar2': 7}), ({}, {})])[0][r'count']) is True
+    assert (5 == pgdb.delete_many(r'TESTTBL', [{r'testvar3': r'bulk2'}, {r'testvar2': 7, r'testvar3': r'bulk'}, {}])[0][r'count']) is True
+    assert (0 == len(pgdb.find(r'TESTTBL', {r'testvar1': False}))) is True
+
+def test_pgdb_bad_bulk():
+    assert bad_pgdb.insert_many(r'TESTTBL', [{r'testvar1': True}])[0][r'failed'] == [{r'testvar1': True}]
+    assert bad_pgdb.update_many_rows(r'TESTTBL', [({r'testvar1': True}, {r'testvar2': 13})])[0][r'count'] == 0
+    assert bad_pgdb.delete_many(r'TESTTBL', [{}])[0][r'failed'] == [{}]
+
+def test_pgdb_upsert():
+    assert pgdb.commit(r'CREATE TABLE IF NOT EXISTS UPSERTTBL (testvar2 int PRIMARY KEY, testvar3 text)') is True
+    assert pgdb.upsert_many(r'UPSERTTBL', [{r'testvar2': 1, r'testvar3': r'a'}, {r'testvar2': 2}, {r'testvar2': 1, r'testvar3': r'b'}], r'testvar2') == [{r'inserted': 2, r'updated': 0, r'count': 2, r'failed': [], r'error': None}]
+    assert pgdb.upsert_many(r'UPSERTTBL', [{r'testvar2': 1, r'testvar3': r'c'}, {r'testvar2': 3}, {r'testvar3': r'd'}], [r'testvar2']) == [{r'inserted': 1, r'updated': 1, r'count': 2, r'failed': [{r'testvar3': r'd'}], r'error': r'Skipped empty or malformed items'}]
+    assert pgdb.find(r'UPSERTTBL', {r'testvar2': 1}) == [{r'testvar2': 1, r'testvar3': r'c'}]
+    assert pgdb.upsert_many(r'UPSERTTBL', [{r'testvar2': 4}], []) is None
+    assert pgdb.commit(r'DROP TABLE UPSERTTBL') is True
+
+def test_pgdb_bad_upsert():
+    assert bad_pgdb.upsert_many(r'TESTTBL', [{r'testvar2': 1}], r'testvar2')[0][r'failed'] == [{r'testvar2': 1}]
+
+def test_mdb_upsert():
+    assert mdb.upsert_many(r'test', [{r'testval2': 100, r'testval3': r'a'}, {r'testval2': 101}], r'testval2')[0][r'inserted'] == 2
+    assert mdb.upsert_many(r'test', [{r'testval2': 100, r'testval3': r'b'}], r'testval2')[0][r'updated'] == 1
+    assert mdb.delete_many(r'test', [{r'testval2': 100}, {r'testval2': 101}])[0][r'count'] == 2
+
+def test_mdb_bulk():
+    assert mdb.insert_many(r'test', [{r'testval1': False, r'testval2': i} for i in range(3)])[0][r'count'] == 3
+    assert mdb.update_many_rows(r'test', [({r'testval2': 0}, {r'testval3': r'bulk'}), ({r'testval1': False}, {r'testval2': 7})])[0][r'count'] == 4
+    assert mdb.delete_many(r'test', [{r'testval1': False}])[0][r'count'] == 3
+
+def test_mdb_bad_bulk():
+    bad_mdb.connstr = r''
+    assert bad_mdb.insert_many(r'test', [{r'testval1': True}]) is None
+    assert bad_mdb.update_many_rows(r'test', [({}, {r'testval3': r'changed'})]) is None
+    assert bad_mdb.delete_many(r'test', [{}]) is None
+    assert bad_mdb.upsert_many(r'test', [{r'testval2': 1}], r'testval2') is None
+
+def test_pgdb_iter():
+    assert pgdb.insert_many(r'TESTTBL', [{r'testvar1': False, r'testvar2': i, r'testvar3': r'iter'} for i in range(5)])[0][r'count'] == 5
+    assert (5 == sum(1 for row in pgdb.iter_find(r'TESTTBL', {r'testvar3': r'iter'}, batch_size=2))) is True
+    rows = pgdb.iter_fetch(r'SELECT * FROM TESTTBL', batch_size=2)
+    assert next(rows)[r'testvar3'] == r'iter'
+    rows.close()
+    assert (pgdb.pool.size() == pgdb.pool.idle_size()) is True
+    assert pgdb.delete(r'TESTTBL', {r'testvar3': r'iter'}) is True
+
+def test_pgdb_bad_iter():
+    assert (0 == len(list(bad_pgdb.iter_fetch(r'TEST FAKE')))) is True
+    assert (0 == len(list(bad_pgdb.iter_find(r'TESTTBL', {r'testvar1': True})))) is True
+
+def test_mdb_iter():
+    assert mdb.insert_many(r'test', [{r'testval1': False, r'testval2': i} for i in range(5)])[0][r'count'] == 5
+    assert (5 == sum(1 for document in mdb.iter_find(r'test', {r'testval1': False}, batch_size=2))) is True
+    assert mdb.delete(r'test', {r'testval1': False}) is True
+
+def test_mdb_bad_iter():
+    bad_mdb.connstr = r''
+    assert bad_mdb.iter_find(r'test', {}) is None
+
+def test_pgdb_statement_cache():
+    select_statement, params = pgdb.compiler.select(r'TESTTBL', {r'testvar1': True, r'testvar2': 43})
+    assert (select_statement is pgdb.compiler.select(r'TESTTBL', {r'testvar1': False, r'testvar2': 13})[0]) is True
+    assert (select_statement is pgdb.compiler.select(r'TESTTBL', {r'testvar2': 13, r'testvar1': False})[0]) is False
+    assert params == (True, 43)
+
+def test_pgdb_find_criteria():
+    prepared_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, prepare_statements=True)
+    assert prepared_pgdb.insert(r'TESTTBL', {r'testvar1': True, r'testvar2': 1, r'testvar3': r"it's"}) is True
+    assert prepared_pgdb.insert(r'TESTTBL', {r'testvar1': True, r'testvar2': 2, r'testvar3': r"it's"}) is True
+    assert (1 == len(prepared_pgdb.find(r'TESTTBL', {r'testvar2': 2, r'testvar3': r"it's"}))) is True
+
+    with prepared_pgdb.pool.connection() as dbconn:
+        assert (2 == len(prepared_pgdb.pool.prepared(dbconn))) is True
+
+    assert pgdb.delete(r'TESTTBL', {r'testvar3': r"it's"}) is True
+    prepared_pgdb.close()
+
+def test_aio_pgdb():
+    async def run_aio_pgdb():
+        async with mdbpg.aio.postgres(max_conns=2, use_env_vars=not local_config) as aio_pgdb:
+            assert await aio_pgdb.insert(r'TESTTBL', {r'testvar1': True, r'testvar2': 43, r'testvar3': r'aio'}) is True
+            assert (10 == len(await asyncio.gather(*[aio_pgdb.find(r'TESTTBL', {r'testvar3': r'aio'}) for i in range(10)]))) is True
+            assert await aio_pgdb.update(r'TESTTBL', {r'testvar3': r'aio'}, {r'testvar2': 13}) is True
+            assert (0 < len(await aio_pgdb.fetch(r'SELECT * FROM TESTTBL WHERE testvar2 = %s', (13,)))) is True
+            assert await aio_pgdb.delete(r'TESTTBL', {r'testvar3': r'aio'}) is True
+            assert await aio_pgdb.commit(r'TEST FAKE') is False
+
+    asyncio.run(run_aio_pgdb())
+
+def test_aio_bad_pgdb():
+    async def run_aio_bad_pgdb():
+        aio_bad_pgdb = mdbpg.aio.postgres(use_env_vars=local_config)
+        assert await aio_bad_pgdb.find(r'TESTTBL', {r'testvar1': True}) is None
+        assert await aio_bad_pgdb.insert(r'TESTTBL', {r'testvar1': True}) is False
+        assert await aio_bad_pgdb.update(r'TESTTBL', {r'testvar1': True}, {r'testvar2': 13}) is False
+        assert await aio_bad_pgdb.delete(r'TESTTBL', {r'testvar1': True}) is False
+
+    asyncio.run(run_aio_bad_pgdb())
+
+def test_aio_mdb():
+    async def run_aio_mdb():
+        async with mdbpg.aio.mongodb(max_conns=2, use_env_vars=not local_config) as aio_mdb:
+            assert await aio_mdb.insert(r'test', {r'testval1': True, r'testval2': 43, r'testval3': r'aio'}) is True
+            assert (0 < len(await aio_mdb.find(r'test', {r'testval3': r'aio'}))) is True
+            assert await aio_mdb.update(r'test', {r'testval3': r'aio'}, {r'testval2': 13}) is True
+            assert await aio_mdb.delete(r'test', {r'testval3': r'aio'}) is True
+
+    asyncio.run(run_aio_mdb())
+
+def test_aio_bad_mdb():
+    async def run_aio_bad_mdb():
+        async with mdbpg.aio.mongodb(server_selection_timeout_ms=100) as aio_bad_mdb:
+            aio_bad_mdb.connstr = r''
+            assert await aio_bad_mdb.find(r'test', {}) is None
+            aio_bad_mdb.connstr = r'mongodb://TEST-FAKE'
+            assert await aio_bad_mdb.find(r'test', {}) is None
+            assert await aio_bad_mdb.insert(r'test', {r'testval1': True}) is False
+            assert await aio_bad_mdb.update(r'test', {}, {r'testval3': r'changed'}) is False
+            assert await aio_bad_mdb.delete(r'test', {}) is False
+
+    asyncio.run(run_aio_bad_mdb())
+
+def test_result_cache():
+    cache = mdbpg.resultcache(ttl=60.0, max_entries=2, table_ttls={r'nocache': 0})
+    token = cache.token(r'dogs')
+    assert cache.get(r'dogs', {r'color': r'black', r'age': 3}) is None
+    assert cache.put(r'dogs', {r'color': r'black', r'age': 3}, [{r'breed': r'husky'}], token) is True
+    assert cache.get(r'dogs', {r'age': 3, r'color': r'black'}) == [{r'breed': r'husky'}]
+    assert cache.get(r'dogs', {r'age': 3, r'color': r'black'}) is not cache.get(r'dogs', {r'age': 3, r'color': r'black'})
+    assert cache.put(r'nocache', {}, [], cache.token(r'nocache')) is False
+    cache.invalidate(r'dogs')
+    assert cache.put(r'dogs', {r'color': r'black', r'age': 3}, [{r'breed': r'husky'}], token) is False
+    assert cache.get(r'dogs', {r'age': 3, r'color': r'black'}) is None
+
+    for i in range(3):
+        assert cache.put(r'cats', {r'age': i}, [], cache.token(r'cats')) is True
+
+    assert cache.stats() == {r'hits': 3, r'misses': 2, r'evictions': 1, r'invalidations': 1, r'entries': 2, r'bytes': 0}
+
+def test_pgdb_cache():
+    cached_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, cache=mdbpg.resultcache())
+    assert (0 == len(cached_pgdb.find(r'TESTTBL', {r'testvar3': r'cached'}))) is True
+    assert (0 == len(cached_pgdb.find(r'testtbl', {r'testvar3': r'cached'}))) is True
+    assert (1 == cached_pgdb.cache.stats()[r'hits']) is True
+    assert cached_pgdb.insert(r'TESTTBL', {r'testvar1': True, r'testvar2': 43, r'testvar3': r'cached'}) is True
+    assert (1 == len(cached_pgdb.find(r'TESTTBL', {r'testvar3': r'cached'}))) is True
+    assert cached_pgdb.delete(r'TESTTBL', {r'testvar3': r'cached'}) is True
+    assert (0 == len(cached_pgdb.find(r'TESTTBL', {r'testvar3': r'cached'}))) is True
+    cached_pgdb.close()
+
+def test_mdb_cache():
+    cached_mdb = mdbpg.mongodb(max_conns=1, use_env_vars=not local_config, cache=mdbpg.resultcache())
+    assert (0 == len(cached_mdb.find(r'test', {r'testval3': r'cached'}))) is True
+    assert cached_mdb.insert(r'test', {r'testval1': True, r'testval2': 43, r'testval3': r'cached'}) is True
+    assert (1 == len(cached_mdb.find(r'test', {r'testval3': r'cached'}))) is True
+    assert (1 == len(cached_mdb.find(r'test', {r'testval3': r'cached'}))) is True
+    assert cached_mdb.delete(r'test', {r'testval3': r'cached'}) is True
+    assert (0 == len(cached_mdb.find(r'test', {r'testval3': r'cached'}))) is True
+    assert (1 == cached_mdb.cache.stats()[r'hits']) is True
+    cached_mdb.close()
+
+def test_metrics():
+    events = []
+    stats = mdbpg.metrics(measure_bytes=True)
+    stats.add_hook(events.append)
+    span = stats.span(r'find', r'dogs')
+    span.phase(r'queue')
+    span.phase(r'execute')
+    span.finish(1, [{r'breed': r'husky'}])
+    stats.span(r'find', r'dogs').finish(error=ValueError())
+    stats.remove_hook(events.append)
+    stats.span(r'find', r'dogs').finish()
+    assert (2 == len(events)) is True
+    assert (3 == stats.stats()[r'find'][r'count']) is True
+    assert (1 == stats.stats()[r'find'][r'rows']) is True
+    assert (0 < stats.stats()[r'find'][r'bytes']) is True
+    assert (1 == stats.stats()[r'find'][r'phases'][r'execute'][r'count']) is True
+    assert stats.stats()[r'find'][r'errors'] == {r'ValueError': 1}
+    assert mdbpg.metrics(enabled=False).span(r'find').finish() is None
+
+def test_pgdb_metrics():
+    measured_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, metrics=mdbpg.metrics())
+    assert measured_pgdb.insert(r'testtbl', {r'testvar1': True, r'testvar2': 44, r'testvar3': r'measured'}) is True
+    assert (1 == len(measured_pgdb.find(r'testtbl', {r'testvar3': r'measured'}))) is True
+    assert measured_pgdb.fetch(r'SELECT * FROM missingtbl') is None
+    assert measured_pgdb.delete(r'testtbl', {r'testvar3': r'measured'}) is True
+    assert (1 == measured_pgdb.metrics.stats()[r'find'][r'rows']) is True
+    assert (1 == measured_pgdb.metrics.stats()[r'find'][r'phases'][r'queue'][r'count']) is True
+    assert (1 == measured_pgdb.metrics.stats()[r'fetch'][r'errors'][r'UndefinedTable']) is True
+    assert (1 == measured_pgdb.metrics.stats()[r'delete'][r'rows']) is True
+    measured_pgdb.close()
+
+def test_pgdb_writer():
+    failures = []
+    buffered_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, writer=mdbpg.bufferedwriter(flush_rows=2, flush_interval=60.0, on_failure=lambda table, rows, error: failures.extend(rows)))
+
+    for i in range(3):
+        assert buffered_pgdb.insert(r'testtbl', {r'testvar1': True, r'testvar2': i, r'testvar3': r'buffered'}) is True
+
+    assert buffered_pgdb.flush() is True
+    assert (3 == len(buffered_pgdb.find(r'testtbl', {r'testvar3': r'buffered'}))) is True
+    assert buffered_pgdb.insert(r'testtbl', {r'missingvar': True}) is True
+    assert buffered_pgdb.flush() is False
+    assert failures == [{r'missingvar': True}]
+    stats = buffered_pgdb.writer.stats()
+    assert (sorted(stats.keys()) == [r'failed', r'flushes', r'queued', r'written']) is True
+    assert (stats[r'queued'] == 0 and stats[r'written'] == 3 and stats[r'failed'] == 1 and stats[r'flushes'] >= 2) is True
+    assert buffered_pgdb.delete(r'testtbl', {r'testvar3': r'buffered'}) is True
+    buffered_pgdb.close()
+    assert buffered_pgdb.insert(r'testtbl', {r'testvar3': r'buffered'}) is False
+
+def test_pgdb_transaction():
+    with pgdb.transaction() as tx:
+        assert tx.insert(r'testtbl', {r'testvar1': True, r'testvar2': 45, r'testvar3': r'transaction'}) is True
+
+        with tx.savepoint():
+            assert tx.insert(r'testtbl', {r'testvar1': True, r'testvar2': 46, r'testvar3': r'transaction'}) is True
+            assert tx.insert(r'testtbl', {r'missingvar': True}) is False
+
+        assert (1 == len(tx.find(r'testtbl', {r'testvar3': r'transaction'}))) is True
+
+    assert tx.committed is True
+    assert (1 == len(pgdb.find(r'testtbl', {r'testvar3': r'transaction'}))) is True
+
+    try:
+        with pgdb.transaction() as tx:
+            assert tx.delete(r'testtbl', {r'testvar3': r'transaction'}) is True
+            raise ValueError()
+
+    except ValueError:
+        pass
+
+    assert tx.committed is False
+    assert (1 == len(pgdb.find(r'testtbl', {r'testvar3': r'transaction'}))) is True
+
+    with pgdb.transaction() as tx:
+        assert tx.delete(r'testtbl', {r'testvar3': r'transaction'}) is True
+        assert tx.fetch(r'SELECT * FROM missingtbl') is None
+
+    assert tx.committed is False
+    assert (1 == len(pgdb.find(r'testtbl', {r'testvar3': r'transaction'}))) is True
+    assert pgdb.delete(r'testtbl', {r'testvar3': r'transaction'}) is True
+
+def test_pgdb_transaction_find_options():
+    with pgdb.transaction() as tx:
+        for i in range(3):
+            assert tx.insert(r'testtbl', {r'testvar1': True, r'testvar2': i, r'testvar3': r'txoptions'}) is True
+
+        assert tx.find(r'testtbl', {r'testvar3': r'txoptions'}, fields=[r'testvar2'], limit=2, order_by=r'-testvar2') == [{r'testvar2': 2}, {r'testvar2': 1}]
+        rows = tx.find(r'testtbl', {r'testvar3': r'txoptions'}, fields=[r'testvar2'], order_by=r'testvar2', result_format=r'tuples')
+        assert (rows.columns == (r'testvar2',) and [row[0] for row in rows] == [0, 1, 2]) is True
+        assert tx.delete(r'testtbl', {r'testvar3': r'txoptions'}) is True
+
+    assert tx.committed is True
+
+    with pgdb.transaction() as tx:
+        assert tx.find(r'testtbl', {}, result_format=r'bogus') is None
+
+    assert tx.committed is False
+
+def test_bad_transaction():
+    with bad_pgdb.transaction() as tx:
+        assert tx.find(r'testtbl', {}) is None
+        assert tx.insert(r'testtbl', {r'testvar1': True}) is False
+
+    assert tx.committed is False
+
+    bad_mdb.connstr = r''
+
+    with bad_mdb.transaction() as tx:
+        assert tx.find(r'test', {}) is None
+        assert tx.insert(r'test', {r'testval1': True}) is False
+
+    assert tx.committed is False
+
+def test_pgdb_find_page():
+    assert (5 == pgdb.insert_many(r'testtbl', [{r'testvar1': 0 == i % 2, r'testvar2': i, r'testvar3': r'paged'} for i in range(5)])[0][r'count']) is True
+    assert pgdb.find(r'testtbl', {r'testvar3': r'paged'}, fields=[r'testvar2'], limit=2, order_by=r'-testvar2') == [{r'testvar2': 4}, {r'testvar2': 3}]
+    rows, token = pgdb.find_page(r'testtbl', {r'testvar3': r'paged'}, 2, [(r'testvar1', r'desc'), r'testvar2'], fields=[r'testvar2'])
+    assert [row[r'testvar2'] for row in rows] == [0, 2]
+    rows, token = pgdb.find_page(r'testtbl', {r'testvar3': r'paged'}, 2, [(r'testvar1', r'desc'), r'testvar2'], fields=[r'testvar2'], after=token)
+    assert [row[r'testvar2'] for row in rows] == [4, 1]
+    rows, token = pgdb.find_page(r'testtbl', {r'testvar3': r'paged'}, 2, [(r'testvar1', r'desc'), r'testvar2'], fields=[r'testvar2'], after=token)
+    assert [row[r'testvar2'] for row in rows] == [3]
+    assert token is None
+    assert pgdb.find(r'testtbl', {r'testvar3': r'paged'}, order_by=r'testvar2', after=r'not-a-token') is None
+    assert pgdb.find_page(r'testtbl', {r'testvar3': r'paged'}, 2, None) == (None, None)
+    assert pgdb.delete(r'testtbl', {r'testvar3': r'paged'}) is True
+
+def test_mdb_find_page():
+    assert (3 == mdb.insert_many(r'test', [{r'testval2': i, r'testval3': r'paged'} for i in range(3)])[0][r'count']) is True
+    rows, token = mdb.find_page(r'test', {r'testval3': r'paged'}, 2, r'-testval2', fields=[r'testval2'])
+    assert rows == [{r'testval2': 2}, {r'testval2': 1}]
+    rows, token = mdb.find_page(r'test', {r'testval3': r'paged'}, 2, r'-testval2', fields=[r'testval2'], after=token)
+    assert rows == [{r'testval2': 0}] and token is None
+    assert mdb.delete(r'test', {r'testval3': r'paged'}) is True
+
+def test_pgdb_result_format():
+    assert (2 == pgdb.insert_many(r'testtbl', [{r'testvar1': True, r'testvar2': i, r'testvar3': r'formatted'} for i in range(2)])[0][r'count']) is True
+    rows = pgdb.find(r'testtbl', {r'testvar3': r'formatted'}, order_by=r'testvar2', result_format=r'tuples')
+    assert rows.columns == (r'testvar1', r'testvar2', r'testvar3')
+    assert rows == [(True, 0, r'formatted'), (True, 1, r'formatted')]
+    columns = pgdb.fetch(r'SELECT testvar2, testvar3 FROM testtbl WHERE testvar3 = %s ORDER BY testvar2', (r'formatted',), result_format=r'columns')
+    assert list(columns[r'testvar2']) == [0, 1]
+    assert list(columns[r'testvar3']) == [r'formatted', r'formatted']
+    assert pgdb.fetch(r'SELECT 1', result_format=r'records') is None
+    assert pgdb.delete(r'testtbl', {r'testvar3': r'formatted'}) is True
+
+def test_scheduler():
+    limiter = mdbpg.scheduler(max_conns=1, timeout=0.05)
+    limiter.acquire()
+
+    try:
+        limiter.acquire(r'batch')
+        assert False
+    except TimeoutError:
+        pass
+
+    with limiter.using(r'batch', timeout=0.01):
+        try:
+            limiter.acquire()
+            assert False
+        except TimeoutError:
+            pass
+
+    limiter.release()
+
+    with limiter.slot(r'batch'):
+        assert (1 == limiter.stats()[r'in_flight']) is True
+
+    assert (0 == limiter.stats()[r'in_flight']) is True
+    assert (2 == limiter.stats()[r'lanes'][r'batch'][r'timeouts']) is True
+    assert (1 == limiter.stats()[r'lanes'][r'batch'][r'granted']) is True
+
+def test_scheduler_fork():
+    if hasattr(os, r'fork') is False:
+        return
+    forked = mdbpg.scheduler(max_conns=1)
+    forked.acquire()
+    # another thread is inside the scheduler when the fork happens
+    locked = threading.Event()
+    unlock = threading.Event()
+    def hold():
+        with forked.lock:
+            locked.set()
+            unlock.wait()
+    holder = threading.Thread(target=hold)
+    holder.start()
+    locked.wait()
+    pid = os.fork()
+    if 0 == pid:
+        # the parent's slot and lock are gone in the child, whose second
+        # caller has to queue until the first releases
+        code = 1
+        try:
+            signal.alarm(10)
+            forked.acquire(timeout=1.0)
+            threading.Timer(0.1, forked.release).start()
+            forked.acquire(timeout=5.0)
+            forked.release()
+            code = 0 if 0 == forked.stats()[r'in_flight'] else 2
+        finally:
+            os._exit(code)
+    unlock.set()
+    holder.join()
+    forked.release()
+    assert (0 == os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])) is True
+
+def test_pool_scheduler_deadline():
+    limiter = mdbpg.scheduler(max_conns=2)
+    standin_pool = pgpool(lambda: standinconnection([]), max_conns=1, scheduler=limiter)
+    held = standin_pool.checkout()
+
+    with limiter.using(timeout=0.05):
+        started = time.time()
+
+        try:
+            standin_pool.checkout()
+            assert False
+        except TimeoutError:
+            pass
+
+        assert (time.time() - started < 1.0) is True
+
+    standin_pool.checkin(held)
+    assert (0 == limiter.stats()[r'in_flight']) is True
+    standin_pool.close()
+
+def test_pgdb_scheduler():
+    scheduled_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, scheduler=mdbpg.scheduler(max_conns=1, timeout=0.05))
+
+    with scheduled_pgdb.transaction() as tx:
+        assert tx.find(r'testtbl', {r'testvar3': r'scheduled'}) == []
+        assert scheduled_pgdb.find(r'testtbl', {r'testvar3': r'scheduled'}) is None
+        assert (1 == scheduled_pgdb.scheduler.stats()[r'lanes'][r'interactive'][r'timeouts']) is True
+
+    assert scheduled_pgdb.find(r'testtbl', {r'testvar3': r'scheduled'}) == []
+    assert (0 == scheduled_pgdb.scheduler.stats()[r'in_flight']) is True
+    scheduled_pgdb.close()
+
+def test_pgdb_resilience():
+    faults = standinfaults(2)
+    resilient_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, resilience=mdbpg.resilience(attempts=3, base_delay=0.001, failure_threshold=3, reset_timeout=0.05))
+    resilient_pgdb.pool = pgpool(lambda: standinconnection([{r'id': 1}], faults), max_conns=1, scheduler=resilient_pgdb.scheduler)
+    assert resilient_pgdb.find(r'standin', {r'id': 1}) == [{r'id': 1}]
+    assert (2 == resilient_pgdb.resilience.stats()[r'retries']) is True
+    faults.failures = 10
+    assert resilient_pgdb.insert(r'standin', {r'id': 2}) is False
+    assert resilient_pgdb.find(r'standin', {r'id': 1}) is None
+    assert (r'open' == resilient_pgdb.resilience.stats()[r'state']) is True
+    calls = faults.calls
+    assert resilient_pgdb.fetch(r'SELECT 1') is None
+    assert (calls == faults.calls) is True
+    time.sleep(0.06)
+    faults.failures = 0
+    assert resilient_pgdb.find(r'standin', {r'id': 1}) == [{r'id': 1}]
+    assert (r'closed' == resilient_pgdb.resilience.stats()[r'state']) is True
+    resilient_pgdb.close()
+
+def test_mdb_resilience():
+    faults = standinfaults(1, AutoReconnect)
+    resilient_mdb = mdbpg.mongodb(max_conns=1, resilience=mdbpg.resilience(attempts=2, base_delay=0.001, failure_threshold=2, reset_timeout=60.0))
+    resilient_mdb.connstr = r'standin'
+    resilient_mdb.client = standinclient(faults)
+    resilient_mdb.client_key = (os.getpid(), resilient_mdb.connstr)
+    assert resilient_mdb.find(r'test', {r'id': 1}) == []
+    assert (1 == resilient_mdb.resilience.stats()[r'retries']) is True
+    faults.failures = 2
+    assert resilient_mdb.insert(r'test', {r'id': 2}) is False
+    assert resilient_mdb.find(r'test', {r'id': 1}) is None
+    assert resilient_mdb.find(r'test', {r'id': 1}) is None
+    assert (2 == resilient_mdb.resilience.stats()[r'rejected']) is True
+
+def test_singleflight():
+    flights = mdbpg.singleflight()
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def loader():
+        started.set()
+        release.wait()
+        return [{r'flag': True}]
+
+    leader = threading.Thread(target=lambda: results.append(flights.run(r'flags', {r'a': 1, r'b': 2}, (), loader)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flights.run(r'flags', {r'b': 2, r'a': 1}, (), loader))) for i in range(3)]
+
+    for follower in followers:
+        follower.start()
+
+    while 3 > flights.stats()[r'collapsed']:
+        time.sleep(0.001)
+
+    release.set()
+
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert (4 == len(results) and all(result == [{r'flag': True}] for result in results)) is True
+    assert (4 == len({ id(result) for result in results }) and 4 == len({ id(result[0]) for result in results })) is True
+    assert flights.stats() == {r'leaders': 1, r'collapsed': 3, r'in_flight': 0}
+
+def test_pgdb_singleflight():
+    coalesced_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, singleflight=mdbpg.singleflight())
+    assert coalesced_pgdb.insert(r'testtbl', {r'testvar1': True, r'testvar2': 45, r'testvar3': r'coalesced'}) is True
+    assert (1 == len(coalesced_pgdb.find(r'testtbl', {r'testvar3': r'coalesced'}))) is True
+    assert coalesced_pgdb.delete(r'testtbl', {r'testvar3': r'coalesced'}) is True
+    assert (1 == coalesced_pgdb.singleflight.stats()[r'leaders']) is True
+
+    with coalesced_pgdb.session():
+        assert coalesced_pgdb.insert(r'testtbl', {r'testvar1': True, r'testvar2': 46, r'testvar3': r'coalesced'}) is True
+        assert (1 == len(coalesced_pgdb.find(r'testtbl', {r'testvar3': r'coalesced'}))) is True
+
+    assert (1 == coalesced_pgdb.singleflight.stats()[r'leaders']) is True
+    assert coalesced_pgdb.delete(r'testtbl', {r'testvar3': r'coalesced'}) is True
+    coalesced_pgdb.close()
+
+def test_split_hosts():
+    assert (split_hosts(r'replica1, replica2,') == [r'replica1', r'replica2']) is True
+    assert (split_hosts([r'replica1']) == [r'replica1']) is True
+    assert (split_hosts(None) == []) is True
+
+def test_pgdb_replicas():
+    replicated_pgdb = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, replicas=[pgdb.hostname], max_replica_lag=5.0)
+    assert (0 == len(replicated_pgdb.find(r'testtbl', {r'testvar3': r'nobody'}))) is True
+    for probe in list(replicated_pgdb.replicas.probes):
+        probe.join()
+    assert (replicated_pgdb.replicas.stats()[pgdb.hostname][r'healthy']) is True
+    assert (replicated_pgdb.replicas.stats()[pgdb.hostname][r'latency'] is not None) is True
+    assert (1 == len(replicated_pgdb.fetch(r'SELECT 1 AS one', replica=True))) is True
+    with replicated_pgdb.session():
+        assert (0 == len(replicated_pgdb.find(r'testtbl', {r'testvar3': r'replicated'}))) is True
+        assert replicated_pgdb.insert(r'testtbl', {r'testvar1': True, r'testvar2': 46, r'testvar3': r'replicated'}) is True
+        assert (1 == len(replicated_pgdb.find(r'testtbl', {r'testvar3': r'replicated'}))) is True
+        assert replicated_pgdb.delete(r'testtbl', {r'testvar3': r'replicated'}) is True
+    replicated_pgdb.close()
+
+def test_partitions():
+    assert (split_range(0, 100, 4) == [25, 50, 75]) is True
+    assert (split_range(0, 2, 4) == [1]) is True
+    assert (split_range(r'a', r'z', 4) is None) is True
+    assert (split_range(None, None, 4) == []) is True
+    assert (ranges([25, 50]) == [(None, 25), (25, 50), (50, None)]) is True
+    assert (mongo_range({}, r'_id', 25, 50) == {r'_id': {r'$gte': 25, r'$lt': 50}}) is True
+    assert (mongo_range({r'a': 1}, r'_id', None, 25) == {r'$and': [{r'a': 1}, {r'_id': {r'$not': {r'$gte': 25}}}]}) is True
+    assert (sorted(merge([lambda: iter(range(0, 500)), lambda: iter(range(500, 1000))])) == list(range(1000))) is True
+    assert (list(merge([lambda: iter(range(0, 500)), lambda: iter(range(500, 1000))], ordered=True)) == list(range(1000))) is True
+    closed = merge([lambda: iter(range(100000)), lambda: iter(range(100000))])
+    assert (next(closed) is not None) is True
+    closed.close()
+    def failing():
+        yield 1
+        raise ValueError(r'partition failed')
+    for ordered in (False, True):
+        failed = merge([failing, lambda: iter(range(100000))], ordered)
+        try:
+            rows = list(failed)
+        except ValueError:
+            rows = None
+        assert (rows is None) is True
+
+def test_pgdb_parallel_find():
+    assert pgdb.insert_many(r'testtbl', [{r'testvar1': True, r'testvar2': i, r'testvar3': r'parallel'} for i in range(100)]) is not None
+    assert (100 == len(list(pgdb.parallel_find(r'testtbl', {r'testvar3': r'parallel'}, r'testvar2', workers=4)))) is True
+    assert ([row[r'testvar2'] for row in pgdb.parallel_find(r'testtbl', {r'testvar3': r'parallel'}, r'testvar2', workers=4, ordered=True)] == list(range(100))) is True
+    assert (100 == len(list(pgdb.parallel_find(r'testtbl', {r'testvar3': r'parallel'}, r'testvar3', workers=4)))) is True
+    assert (100 == len(list(pgdb.parallel_find(r'testtbl', {r'testvar3': r'parallel'}, workers=4)))) is True
+    assert pgdb.delete(r'testtbl', {r'testvar3': r'parallel'}) is True
+    assert (bad_pgdb.parallel_find(r'testtbl', {}, r'testvar2') is None) is True
+
+def test_mdb_parallel_find():
+    # ObjectIds an hour apart so that the range splits on their timestamps
+    identities = [ObjectId.from_datetime(datetime(2022, 1, 1, tzinfo=timezone.utc) + timedelta(hours=i)) for i in range(100)]
+    assert (100 == mdb.insert_many(r'test', [{r'_id': identity, r'testval2': i, r'testval3': r'parallel'} for i, identity in enumerate(identities)])[0][r'count']) is True
+    assert (100 == len(list(mdb.parallel_find(r'test', {r'testval3': r'parallel'}, workers=4)))) is True
+    assert ([document[r'_id'] for document in mdb.parallel_find(r'test', {r'testval3': r'parallel'}, workers=4, ordered=True)] == identities) is True
+    assert ([document[r'testval2'] for document in mdb.parallel_find(r'test', {r'testval3': r'parallel'}, r'testval2', workers=4, ordered=True)] == list(range(100))) is True
+    assert mdb.delete(r'test', {r'testval3': r'parallel'}) is True
+
+def test_transfer(tmp_path):
+    csv_path = str(tmp_path / r'records.csv')
+    with open(csv_path, r'wb') as csv_file:
+        csv_file.write(b'a,b\n1,"x\ny"\n2,z\n')
+    with mapped(csv_path) as mapped_view:
+        assert (csv_header(mapped_view) == ((r'a', r'b'), 4)) is True
+        assert (12 == record_end(mapped_view, 4, 1, r'csv')) is True
+        assert (9 == record_end(mapped_view, 4, 1, r'text')) is True
+        assert ([row for row, end in read_documents(mapped_view, 0, r'csv')] == [{r'a': r'1', r'b': 'x\ny'}, {r'a': r'2', r'b': r'z'}]) is True
+    quoted_path = str(tmp_path / r'quoted.csv')
+    with open(quoted_path, r'wb') as csv_file:
+        csv_file.write(b'a,b\n1,"x\n""y""\n\nz"\n2,"\n"\n3,w\n')
+    with mapped(quoted_path) as mapped_view:
+        assert (19 == record_end(mapped_view, 4, 8, r'csv')) is True
+        assert (25 == record_end(mapped_view, 19, 2, r'csv')) is True
+        assert (25 == record_end(mapped_view, 4, 21, r'csv')) is True
+        assert ([row[r'b'] for row, end in read_documents(mapped_view, 0, r'csv')] == ['x\n"y"\n\nz', '\n', r'w']) is True
+
+def test_pgdb_export_import(tmp_path):
+    assert pgdb.insert_many(r'testtbl', [{r'testvar1': True, r'testvar2': i, r'testvar3': r'exported'} for i in range(100)]) is not None
+    for file_format in (r'csv', r'text', r'binary'):
+        path = str(tmp_path / (r'testtbl.' + file_format))
+        assert (100 == pgdb.export_table(r'testtbl', path, file_format, {r'testvar3': r'exported'})[r'count']) is True
+        assert pgdb.delete(r'testtbl', {r'testvar3': r'exported'}) is True
+        assert (100 == pgdb.import_table(r'testtbl', path, file_format, chunk_size=256)[r'count']) is True
+        assert (100 == len(pgdb.find(r'testtbl', {r'testvar3': r'exported'}))) is True
+    assert pgdb.delete(r'testtbl', {r'testvar3': r'exported'}) is True
+    assert (pgdb.export_table(r'testtbl', str(tmp_path / r'testtbl.xml'), r'xml') is None) is True
+    assert (0 == pgdb.import_table(r'nosuchtbl', str(tmp_path / r'testtbl.csv'))[r'count']) is True
+
+def test_mdb_export_import(tmp_path):
+    def interrupt(offset):
+        raise RuntimeError(r'interrupted')
+    assert (50 == mdb.insert_many(r'test', [{r'testval2': i, r'testval3': r'exported'} for i in range(50)])[0][r'count']) is True
+    for file_format in (r'bson', r'jsonl', r'csv'):
+        path = str(tmp_path / (r'test.' + file_format))
+        assert (50 == mdb.export_table(r'test', path, file_format, {r'testval3': r'exported'}, fields=[r'testval2', r'testval3'])[r'count']) is True
+        assert mdb.delete(r'test', {r'testval3': r'exported'}) is True
+        # the first batch lands before progress stops the import, whose
+        # offset then resumes it
+        stopped = mdb.import_table(r'test', path, file_format, progress=interrupt, batch_size=10)
+        assert (10 == stopped[r'count'] and stopped[r'error'] is not None) is True
+        assert (40 == mdb.import_table(r'test', path, file_format, offset=stopped[r'offset'], batch_size=10)[r'count']) is True
+        assert (50 == len(mdb.find(r'test', {r'testval3': r'exported'}))) is True
+    assert mdb.delete(r'test', {r'testval3': r'exported'}) is True
+    assert (mdb.export_table(r'test', str(tmp_path / r'test.csv'), r'csv') is None) is True
+    assert (mdb.export_table(r'test', str(tmp_path / r'test.xml'), r'xml') is None) is True
+
+def test_criteria():
+    assert (criteria_error({r'age': {r'$gt': 5}, r'id': {r'$in': [1, 2]}, r'name': r'rex'}) is None) is True
+    assert (criteria_error({r'age': {r'$where': 5}}) is not None) is True
+    assert (criteria_error({r'$or': []}) is not None) is True
+    assert (criteria_terms({r'age': {r'$gt': 5, r'$lt': 9}, r'name': r'rex'}) == (((r'age', r'$gt'), (r'age', r'$lt'), r'name'), (5, 9, r'rex'))) is True
+    assert (criteria_terms({r'name': {r'$prefix': r'a_%'}})[1] == (r'a\_\%%',)) is True
+    assert (mongo_criteria({r'name': {r'$prefix': r'a.'}}) == {r'name': {r'$regex': r'^a\.'}}) is True
+
+def test_pgdb_criteria():
+    assert pgdb.insert_many(r'testtbl', [{r'testvar1': True, r'testvar2': i, r'testvar3': r'crit' + str(i)} for i in range(20)]) is not None
+    assert (5 == len(pgdb.find(r'testtbl', {r'testvar2': {r'$gte': 5, r'$lt': 10}, r'testvar3': {r'$prefix': r'crit'}}))) is True
+    assert (2 == len(pgdb.find(r'testtbl', {r'testvar3': {r'$in': [r'crit1', r'crit2']}}))) is True
+    assert (11 == len(pgdb.find(r'testtbl', {r'testvar3': {r'$prefix': r'crit1'}}))) is True
+    assert pgdb.update(r'testtbl', {r'testvar3': {r'$prefix': r'crit'}, r'testvar2': {r'$lt': 3}}, {r'testvar1': False}) is True
+    assert (3 == len(pgdb.find(r'testtbl', {r'testvar3': {r'$prefix': r'crit'}, r'testvar1': False}))) is True
+    assert (pgdb.find(r'testtbl', {r'testvar2': {r'$regex': r'.'}}) is None) is True
+    assert pgdb.delete(r'testtbl', {r'testvar3': {r'$prefix': r'crit'}}) is True
+    assert (0 == len(pgdb.find(r'testtbl', {r'testvar3': {r'$prefix': r'crit'}}))) is True
+
+def test_advisor():
+    assert (index_columns({r'b': 1, r'a': { r'$in': [1, 2] }, r'd': { r'$gt': 1 }, r'c': { r'$prefix': r'x' }, r'e': { r'$ne': 1 }}) == ((r'a', r'eq'), (r'b', r'eq'), (r'c', r'prefix'))) is True
+    assert (covered(((r'a', r'eq'), (r'b', r'eq'), (r'c', r'range')), [(r'b', r'a', r'c', r'd')]) is True) is True
+    assert (covered(((r'a', r'eq'), (r'c', r'range')), [(r'c', r'a')]) is False) is True
+    assert (pg_summary([{ r'Plan': { r'Node Type': r'Bitmap Heap Scan', r'Plan Rows': 5, r'Plans': [{ r'Node Type': r'Bitmap Index Scan', r'Index Name': r'idx' }] } }])[r'index'] == r'idx') is True
+    assert (mongo_summary({ r'queryPlanner': { r'winningPlan': { r'stage': r'COLLSCAN' } }, r'executionStats': { r'nReturned': 2, r'executionTimeMillis': 3 } })[r'scan'] == r'seq_scan') is True
+
+    recorder = mdbpg.advisor()
+    recorder.record(r'dogs', { r'color': r'black' }, 0.5)
+    recorder.record(r'dogs', { r'color': r'white' }, 1.5)
+    recorder.record(r'dogs', { r'$or': [] }, 1.0)
+    assert (recorder.candidates()[0][r'count'] == 2 and recorder.candidates()[0][r'mean'] == 1.0) is True
+    assert (0 == len(recorder.candidates(min_count=3))) is True
+
+def test_pgdb_explain_advisor():
+    recorder = mdbpg.advisor()
+    advised = mdbpg.postgres(max_conns=1, use_env_vars=not local_config, advisor=recorder)
+
+    assert advised.commit(r'DROP INDEX IF EXISTS ' + advised.compiler.create_index(r'testtbl', ((r'testvar3', r'eq'),))[1]) is True
+    assert (advised.explain(r'testtbl', { r'testvar3': r'advised' })[r'scan'] is not None) is True
+    assert (advised.explain(r'testtbl', { r'testvar3': { r'$where': 1 } }) is None) is True
+    assert (advised.find(r'testtbl', { r'testvar3': r'advised' }) is not None) is True
+    assert ([((r'testvar3', r'eq'),)] == [suggestion[r'columns'] for suggestion in advised.suggest_indexes()]) is True
+    assert (1 == len(advised.ensure_indexes())) is True
+    assert (0 == len(advised.suggest_indexes())) is True
+    assert advised.commit(r'DROP INDEX ' + advised.compiler.create_index(r'testtbl', ((r'testvar3', r'eq'),))[1]) is True
+
+    advised.close()
+
+def test_mdb_explain_advisor():
+    recorder = mdbpg.advisor()
+    advised = mdbpg.mongodb(max_conns=1, use_env_vars=not local_config, advisor=recorder)
+
+    assert advised.insert(r'test', { r'testval3': r'advised' }) is True
+    assert (advised.explain(r'test', { r'testval3': r'advised' })[r'scan'] == r'seq_scan') is True
+    assert (advised.find(r'test', { r'testval3': r'advised' }) is not None) is True
+    assert ([((r'testval3', r'eq'),)] == [suggestion[r'columns'] for suggestion in advised.suggest_indexes()]) is True
+    created = advised.ensure_indexes()
+    assert (1 == len(created)) is True
+    assert (0 == len(advised.suggest_indexes())) is True
+    explained = advised.explain(r'test', { r'testval3': r'advised' })
+    assert (explained[r'scan'] == r'index_scan' and explained[r'index'] == created[0] and explained[r'actual_rows'] == 1) is True
+    assert advised.delete(r'test', { r'testval3': r'advised' }) is True
+    advised._collection(r'test').drop_index(created[0])
+
+    advised.close()
+
+def test_matches():
+    document = { r'a': 1, r'b': None, r'tags': [r'x', r'y'], r'nested': { r'name': r'rex' } }
+
+    assert (matches(document, { r'a': { r'$gte': 1, r'$lt': 2 }, r'tags': r'x', r'nested.name': { r'$prefix': r're' } }) is True) is True
+    assert (matches(document, { r'b': None }) is True and matches(document, { r'b': None }, sql=True) is False) is True
+    assert (matches(document, { r'missing': { r'$ne': 1 } }) is True and matches(document, { r'a': { r'$gt': r'x' } }) is False) is True
+    assert (matches(document, { r'a': { r'$nin': [2, None] } }, sql=True) is False and matches(document, { r'a': { r'$in': [2, 1] } }, sql=True) is True) is True
+
+def test_mirror_abstract():
+    try:
+        mirror(r'dogs', r'id', True, lambda column: column)
+        built = True
+    except TypeError:
+        built = False
+    assert (built is False) is True
+
+def test_pgdb_mirror():
+    assert pgdb.commit(r'CREATE TABLE IF NOT EXISTS MIRRORTBL (testvar2 int PRIMARY KEY, testvar3 text)') is True
+    assert pgdb.insert_many(r'MIRRORTBL', [{ r'testvar2': i, r'testvar3': r'mirror' + str(i % 3) } for i in range(30)]) is not None
+
+    mirrored = pgdb.mirror(r'MIRRORTBL', r'testvar2', timeout=10.0)
+
+    assert (mirrored.stats()[r'rows'] == 30) is True
+    assert (10 == len(pgdb.find(r'MIRRORTBL', { r'testvar3': r'mirror1' }))) is True
+    assert ([{ r'testvar3': r'mirror2' }] == pgdb.find(r'MIRRORTBL', { r'testvar2': 5 }, fields=[r'testvar3'])) is True
+    assert pgdb.update(r'MIRRORTBL', { r'testvar2': 5 }, { r'testvar3': r'changed' }) is True
+    assert ([{ r'testvar2': 5, r'testvar3': r'changed' }] == pgdb.find(r'MIRRORTBL', { r'testvar3': r'changed' })) is True
+    assert pgdb.delete(r'MIRRORTBL', { r'testvar2': { r'$lt': 3 } }) is True
+
+    deadline = time.time() + 5.0
+
+    while (mirrored.stats()[r'changes'] < 4 or mirrored.stats()[r'behind'] is True) and time.time() < deadline:
+        time.sleep(0.01)
+
+    hits = mirrored.stats()[r'hits']
+    assert ([{ r'testvar2': 5, r'testvar3': r'changed' }] == pgdb.find(r'MIRRORTBL', { r'testvar3': r'changed' })) is True
+    assert (27 == len(pgdb.find(r'MIRRORTBL', {}))) is True
+    assert (hits + 2 == mirrored.stats()[r'hits']) is True
+    assert (1 == len(pgdb.find(r'MIRRORTBL', { r'testvar2': r'5' }))) is True
+    assert (9 == len(pgdb.find(r'MIRRORTBL', { r'testvar3': { r'$gte': r'mirror1', r'$lt': r'mirror2' } }))) is True
+    assert (hits + 2 == mirrored.stats()[r'hits']) is True
+    assert pgdb.unmirror(r'MIRRORTBL') is True
+    assert pgdb.commit(r'DROP TABLE MIRRORTBL') is True
+
+def test_mdb_mirror():
+    # the change stream needs MongoDB to run as a replica set
+    assert (30 == mdb.insert_many(r'mirrored', [{ r'_id': i, r'testval3': r'mirror' + str(i % 3) } for i in range(30)])[0][r'count']) is True
+
+    mirrored = mdb.mirror(r'mirrored', timeout=10.0)
+
+    assert (mirrored.stats()[r'rows'] == 30) is True
+    assert (10 == len(mdb.find(r'mirrored', { r'testval3': r'mirror1' }))) is True
+    assert ([{ r'testval3': r'mirror2' }] == mdb.find(r'mirrored', { r'_id': 5 }, fields=[r'testval3'])) is True
+    assert mdb.update(r'mirrored', { r'_id': 5 }, { r'testval3': r'changed' }) is True
+    assert ([{ r'_id': 5, r'testval3': r'changed' }] == mdb.find(r'mirrored', { r'testval3': r'changed' })) is True
+    assert mdb.delete(r'mirrored', { r'_id': { r'$lt': 3 } }) is True
+
+    deadline = time.time() + 5.0
+
+    while (mirrored.stats()[r'changes'] < 4 or mirrored.stats()[r'behind'] is True) and time.time() < deadline:
+        time.sleep(0.01)
+
+    hits = mirrored.stats()[r'hits']
+    assert ([{ r'_id': 5, r'testval3': r'changed' }] == mdb.find(r'mirrored', { r'testval3': r'changed' })) is True
+    assert (27 == len(mdb.find(r'mirrored', {}))) is True
+    assert (hits + 2 == mirrored.stats()[r'hits']) is True
+    assert (0 == len(mdb.find(r'mirrored', { r'_id': r'5' }))) is True
+    assert (9 == len(mdb.find(r'mirrored', { r'testval3': { r'$gte': r'mirror1', r'$lt': r'mirror2' } }))) is True
+    assert (hits + 2 == mirrored.stats()[r'hits']) is True
+    assert mdb.unmirror(r'mirrored') is True
+    assert (mdb.unmirror(r'mirrored') is False) is True
+    assert mdb.delete(r'mirrored', {}) is True